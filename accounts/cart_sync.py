@@ -0,0 +1,148 @@
+import uuid
+
+from django.db import transaction
+
+from accounts.models import Cart, CartItem
+from products.models import ColorVariant, Product, SizeVariant
+
+
+class CartSyncError(ValueError):
+    """An operation in a cart-sync batch that cannot be applied."""
+
+
+def _uuid(value, index, what):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise CartSyncError(f"Operation {index}: invalid {what} '{value}'.")
+
+
+def _quantity(op, index, minimum):
+    try:
+        quantity = int(op.get('quantity', 1))
+    except (TypeError, ValueError):
+        raise CartSyncError(f"Operation {index}: quantity must be a whole number.")
+    if quantity < minimum:
+        raise CartSyncError(f"Operation {index}: quantity must be at least {minimum}.")
+    return quantity
+
+
+def apply_operations(user, operations):
+    """
+    Apply a list of cart operations for ``user`` in one transaction and
+    return ``(cart, lines)`` with the cart's lines after the change.
+
+    Operations are dicts with an ``op`` of:
+
+    * ``add``: ``product`` uid, ``size`` and optional ``color`` names, ``quantity`` (default 1)
+    * ``update``: ``cart_item_id`` and ``quantity`` (0 removes the line)
+    * ``remove``: ``cart_item_id``
+
+    The cart's lines are locked and loaded once, the operations are applied
+    in memory, and the result is written with one delete, one bulk update
+    and one bulk insert. Lines can only be addressed inside the shopper's
+    own open cart. Any invalid operation rejects the whole batch.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise CartSyncError("Expected a non-empty list of operations.")
+
+    parsed = []
+    product_ids, size_names, color_names = set(), set(), set()
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            raise CartSyncError(f"Operation {index}: expected an object.")
+        kind = op.get('op')
+        if kind == 'add':
+            product_id = _uuid(op.get('product'), index, 'product')
+            size, color = op.get('size'), op.get('color')
+            if not size:
+                raise CartSyncError(f"Operation {index}: a size is required.")
+            product_ids.add(product_id)
+            size_names.add(size)
+            if color:
+                color_names.add(color)
+            parsed.append((kind, index, (product_id, size, color), _quantity(op, index, 1)))
+        elif kind in ('update', 'remove'):
+            item_id = _uuid(op.get('cart_item_id'), index, 'cart_item_id')
+            quantity = _quantity(op, index, 0) if kind == 'update' else 0
+            parsed.append((kind, index, item_id, quantity))
+        else:
+            raise CartSyncError(f"Operation {index}: unknown op '{kind}'.")
+
+    products = Product.objects.in_bulk(product_ids)
+    sizes = {size.size_name: size for size in SizeVariant.objects.filter(size_name__in=size_names)}
+    colors = {color.color_name: color for color in ColorVariant.objects.filter(color_name__in=color_names)} if color_names else {}
+
+    with transaction.atomic():
+        cart, _ = Cart.objects.select_related('coupon').get_or_create(user=user, is_paid=False)
+        # Row locks make concurrent add_cart_item() upserts wait for this batch.
+        lines = {
+            item.uid: item for item in
+            CartItem.objects.select_for_update(of=('self',)).filter(cart=cart)
+            .select_related('product', 'size_variant', 'color_variant')
+        }
+        by_key = {(item.product_id, item.size_variant_id, item.color_variant_id): item for item in lines.values()}
+        changed, created, removed = set(), [], set()
+
+        for kind, index, target, quantity in parsed:
+            if kind == 'add':
+                product_id, size_name, color_name = target
+                product, size = products.get(product_id), sizes.get(size_name)
+                color = colors.get(color_name) if color_name else None
+                if product is None or size is None or (color_name and color is None):
+                    raise CartSyncError(f"Operation {index}: unknown product, size or color.")
+                key = (product.pk, size.pk, color.pk if color else None)
+                item = by_key.get(key)
+                if item is None:
+                    item = by_key[key] = CartItem(
+                        cart=cart, product=product, size_variant=size, color_variant=color, quantity=0)
+                    created.append(item)
+                elif item.uid in removed:
+                    # Removed earlier in this batch: reuse the row.
+                    removed.discard(item.uid)
+                    item.quantity = 0
+                item.quantity += quantity
+                changed.add(item.uid)
+                continue
+
+            item = lines.get(target)
+            if item is None or item.uid in removed:
+                raise CartSyncError(f"Operation {index}: cart item not found.")
+            if quantity == 0:
+                removed.add(item.uid)
+            else:
+                item.quantity = quantity
+                changed.add(item.uid)
+
+        if removed:
+            CartItem.objects.filter(uid__in=removed).delete()
+        updates = [lines[uid] for uid in changed - removed if uid in lines]
+        if updates:
+            CartItem.objects.bulk_update(updates, ['quantity'])
+        if created:
+            CartItem.objects.bulk_create(created)
+
+    return cart, [item for uid, item in lines.items() if uid not in removed] + created
+
+
+def cart_summary(cart, lines):
+    total = sum(item.get_product_price() for item in lines)
+    total_after_coupon = total
+    if cart.coupon and total >= cart.coupon.minimum_amount:
+        total_after_coupon -= cart.coupon.discount_amount
+    return {
+        'items': [
+            {
+                'cart_item_id': str(item.uid),
+                'product': item.product.product_name,
+                'size': item.size_variant.size_name if item.size_variant else None,
+                'color': item.color_variant.color_name if item.color_variant else None,
+                'quantity': item.quantity,
+                'price': item.get_product_price(),
+            }
+            for item in lines
+        ],
+        'count': len(lines),
+        'total': total,
+        'total_after_coupon': total_after_coupon,
+    }
@@ -0,0 +1,124 @@
+import json
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+
+from accounts.models import Cart, add_cart_items
+from products.models import ColorVariant, Product, SizeVariant
+
+
+COOKIE_NAME = 'guest_cart'
+COOKIE_SALT = 'accounts.guest_cart'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+# Each line is ~110 bytes once signed, which keeps the cookie well under 4KB.
+MAX_LINES = 25
+
+
+class GuestCartFull(Exception):
+    pass
+
+
+class GuestCart:
+    """
+    An anonymous shopper's cart, kept in a signed cookie so browsing never
+    writes to the database. Lines are ``(product, size, color) -> quantity``
+    keyed by uid; the cookie stores them as ``[product, size, color, qty]``
+    lists of hex strings.
+    """
+
+    def __init__(self, lines=None):
+        self.lines = dict(lines or {})
+        self.modified = False
+
+    @classmethod
+    def from_request(cls, request):
+        try:
+            raw = request.get_signed_cookie(COOKIE_NAME, salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE)
+            lines = {}
+            for product, size, color, quantity in json.loads(raw)[:MAX_LINES]:
+                key = (uuid.UUID(product), uuid.UUID(size), uuid.UUID(color) if color else None)
+                lines[key] = max(1, int(quantity))
+        except (KeyError, signing.BadSignature, ValueError, TypeError):
+            # Missing, tampered with, expired or from an older format: start afresh.
+            return cls()
+        return cls(lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def add(self, product_id, size_id, color_id=None, quantity=1):
+        key = (product_id, size_id, color_id)
+        if key not in self.lines and len(self.lines) >= MAX_LINES:
+            raise GuestCartFull(f"Your cart is full ({MAX_LINES} items). Log in to add more.")
+        self.lines[key] = self.lines.get(key, 0) + quantity
+        self.modified = True
+
+    def clear(self):
+        self.lines = {}
+        self.modified = True
+
+    def dumps(self):
+        return json.dumps(
+            [[product.hex, size.hex, color.hex if color else None, quantity]
+             for (product, size, color), quantity in self.lines.items()],
+            separators=(',', ':'),
+        )
+
+    def update_response(self, response):
+        if not self.modified:
+            return
+        if self.lines:
+            response.set_signed_cookie(
+                COOKIE_NAME, self.dumps(), salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+            )
+        else:
+            response.delete_cookie(COOKIE_NAME, samesite='Lax')
+
+
+def merge_guest_cart(guest_cart, user):
+    """Fold ``guest_cart`` into ``user``'s open cart with one bulk upsert, then empty it."""
+    if not guest_cart:
+        return
+
+    # Drop lines whose product or variant has been deleted since they were added.
+    products = set(Product.objects.filter(pk__in={key[0] for key in guest_cart.lines}).values_list('pk', flat=True))
+    sizes = set(SizeVariant.objects.filter(pk__in={key[1] for key in guest_cart.lines}).values_list('pk', flat=True))
+    color_ids = {key[2] for key in guest_cart.lines if key[2]}
+    colors = set(ColorVariant.objects.filter(pk__in=color_ids).values_list('pk', flat=True)) if color_ids else set()
+
+    cart, _ = Cart.objects.get_or_create(user=user, is_paid=False)
+    add_cart_items(cart, [
+        {'product_id': product, 'size_variant_id': size, 'color_variant_id': color, 'quantity': quantity}
+        for (product, size, color), quantity in guest_cart.lines.items()
+        if product in products and size in sizes and (color is None or color in colors)
+    ])
+    guest_cart.clear()
+
+
+class GuestCartMiddleware:
+    """Attach ``request.guest_cart`` and write it back to its cookie when it changes."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.guest_cart = GuestCart.from_request(request)
+        response = self.get_response(request)
+        request.guest_cart.update_response(response)
+        return response
+
+    async def __acall__(self, request):
+        request.guest_cart = GuestCart.from_request(request)
+        response = await self.get_response(request)
+        request.guest_cart.update_response(response)
+        return response
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from accounts.models import Cart
+from accounts.stripe_stub import StripeStubServer
+from home.management.commands.load_harness import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare how many checkouts one WSGI worker (a fixed pool of threads) and one "
+        "ASGI worker (a single event loop) keep in flight against a slow local Stripe stub."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Checkouts per mode.")
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help="Checkouts the ASGI worker is offered at once.")
+        parser.add_argument('--threads', type=int, default=4,
+                            help="Threads in the WSGI worker (gunicorn --threads).")
+        parser.add_argument('--latency-ms', type=float, default=200, help="Delay added to every Stripe call.")
+        parser.add_argument('--users', type=int, default=50, help="Shoppers with open carts to rotate through.")
+
+    def handle(self, *args, **options):
+        carts = list(
+            Cart.objects.filter(is_paid=False, cart_items__isnull=False, user__isnull=False)
+            .select_related('user').distinct()[:options['users']]
+        )
+        if not carts:
+            raise CommandError("No open carts found; run `manage.py seed_scale` first.")
+        users = [cart.user for cart in carts]
+
+        stub = StripeStubServer(port=0, latency=options['latency_ms'] / 1000).start()
+        try:
+            with override_settings(STRIPE_API_BASE=stub.url):
+                self.stdout.write(
+                    f"{options['requests']} checkouts per mode, {len(users)} shoppers, "
+                    f"Stripe latency {options['latency_ms']:.0f}ms"
+                )
+                header = (f"{'worker':<24}{'errors':>8}{'wall s':>9}{'checkouts/s':>13}"
+                          f"{'p50 ms':>10}{'p99 ms':>10}{'in flight':>11}")
+                self.stdout.write(header)
+                self.stdout.write('-' * len(header))
+                self.report(f"WSGI ({options['threads']} threads)", *self.run_wsgi(users, options))
+                self.report(f"ASGI (1 loop, {options['concurrency']} conc)",
+                            *asyncio.run(self.run_asgi(users, options)))
+        finally:
+            stub.stop()
+
+    def run_wsgi(self, users, options):
+        # A WSGI worker can only have as many checkouts in flight as it has
+        # threads; each one blocks for the whole Stripe round-trip.
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        url = reverse('create_checkout_session')
+
+        def checkout(n):
+            started = time.perf_counter()
+            response = clients[n % len(clients)].post(url)
+            return time.perf_counter() - started, response.status_code == 200
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(checkout, range(options['requests'])))
+        return results, time.perf_counter() - started
+
+    async def run_asgi(self, users, options):
+        # One event loop: while a checkout waits on Stripe, the loop serves others.
+        clients = []
+        for user in users:
+            client = AsyncClient()
+            await client.aforce_login(user)
+            clients.append(client)
+        url = reverse('create_checkout_session')
+        pending = iter(range(options['requests']))
+        results = []
+
+        async def shopper():
+            for n in pending:
+                started = time.perf_counter()
+                response = await clients[n % len(clients)].post(url)
+                results.append((time.perf_counter() - started, response.status_code == 200))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(shopper() for _ in range(options['concurrency'])))
+        return results, time.perf_counter() - started
+
+    def report(self, label, results, wall):
+        latencies = sorted(elapsed for elapsed, _ in results)
+        errors = sum(1 for _, ok in results if not ok)
+        throughput = len(results) / wall
+        # Little's law: average checkouts in progress at once.
+        in_flight = throughput * (sum(latencies) / len(latencies))
+        self.stdout.write(
+            f"{label:<24}{errors:>8}{wall:>9.2f}{throughput:>13.1f}"
+            f"{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 99) * 1000:>10.1f}{in_flight:>11.1f}"
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from accounts.stripe_stub import StripeStubServer
+
+
+class Command(BaseCommand):
+    help = "Run a local Stripe API stand-in for load tests (point STRIPE_API_BASE at it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--latency-ms', type=float, default=0, help="Delay added to every response.")
+        parser.add_argument('--no-auto-pay', action='store_true',
+                            help="Leave checkout sessions unpaid instead of marking them paid.")
+
+    def handle(self, *args, **options):
+        server = StripeStubServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency_ms'] / 1000,
+            auto_pay=not options['no_auto_pay'],
+        )
+        self.stdout.write(f"Fake Stripe listening on {server.url} (latency {options['latency_ms']:.0f}ms)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served {server.request_count:,} requests")
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import ReconciliationCheckpoint
+from accounts.reconciliation import paid_payments, reconcile
+from base.stripe_client import get_stripe_client
+
+
+CHECKPOINT = 'stripe_payments'
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the orders for Stripe payments whose shopper never reached payment_success. "
+        "Scans from the last checkpoint (minus --overlap-hours) up to now."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="ISO datetime to scan from, ignoring the checkpoint.")
+        parser.add_argument('--until', help="ISO datetime to scan to (default: now).")
+        parser.add_argument('--overlap-hours', type=float, default=24,
+                            help="Re-scan this much before the checkpoint. A checkout session can be paid "
+                                 "up to 24h after it is created, and listing is by creation time.")
+        parser.add_argument('--lookback-days', type=float, default=3,
+                            help="Window for the first run, when there is no checkpoint yet.")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would be created without writing orders or the checkpoint.")
+
+    def handle(self, *args, **options):
+        until = self.parse_datetime(options['until']) if options['until'] else timezone.now()
+        checkpoint = ReconciliationCheckpoint.objects.filter(name=CHECKPOINT).first()
+        if options['since']:
+            since = self.parse_datetime(options['since'])
+        elif checkpoint:
+            since = checkpoint.synced_until - timedelta(hours=options['overlap_hours'])
+        else:
+            since = until - timedelta(days=options['lookback_days'])
+
+        self.stdout.write(f"Reconciling Stripe payments created {since:%Y-%m-%d %H:%M} to {until:%Y-%m-%d %H:%M}")
+        payments = paid_payments(get_stripe_client(), since, until)
+        stats = reconcile(payments, batch_size=options['batch_size'], dry_run=options['dry_run'])
+
+        action = "would create" if options['dry_run'] else "created"
+        self.stdout.write(
+            f"{stats['payments']} paid payments: {action} {stats['created']} orders, "
+            f"{stats['already_recorded']} already recorded, {stats['unmatched']} without an open cart"
+        )
+        if not options['dry_run'] and not options['since']:
+            ReconciliationCheckpoint.objects.update_or_create(name=CHECKPOINT, defaults={'synced_until': until})
+
+    def parse_datetime(self, value):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Not an ISO datetime: {value}")
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
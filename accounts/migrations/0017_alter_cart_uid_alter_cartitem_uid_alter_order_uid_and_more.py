@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:42
+
+import base.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_rename_razorpay_order_id_cart_stripe_payment_intent_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cart',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
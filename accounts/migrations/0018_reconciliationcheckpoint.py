@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:00
+
+import base.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_alter_cart_uid_alter_cartitem_uid_alter_order_uid_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationCheckpoint',
+            fields=[
+                ('uid', models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('synced_until', models.DateTimeField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
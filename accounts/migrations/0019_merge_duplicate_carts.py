@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    # Races in add_to_cart could leave a shopper with several open carts, or a
+    # cart with several rows for the same line. Fold them together so the
+    # unique constraints in the next migration can be created.
+    Cart = apps.get_model('accounts', 'Cart')
+    CartItem = apps.get_model('accounts', 'CartItem')
+
+    duplicated_users = (
+        Cart.objects.filter(is_paid=False).exclude(user=None)
+        .values('user').annotate(open_carts=Count('uid')).filter(open_carts__gt=1)
+        .values_list('user', flat=True)
+    )
+    for user_id in list(duplicated_users):
+        keep, *extra = Cart.objects.filter(user_id=user_id, is_paid=False).order_by('pk')
+        CartItem.objects.filter(cart__in=extra).update(cart=keep)
+        if keep.coupon_id is None:
+            keep.coupon_id = next((cart.coupon_id for cart in extra if cart.coupon_id), None)
+            keep.save(update_fields=['coupon'])
+        Cart.objects.filter(pk__in=[cart.pk for cart in extra]).delete()
+
+    duplicated_lines = (
+        CartItem.objects.values('cart', 'product', 'size_variant', 'color_variant')
+        .annotate(rows=Count('uid'), total=Sum('quantity')).filter(rows__gt=1)
+    )
+    for line in list(duplicated_lines):
+        keep, *extra = CartItem.objects.filter(
+            cart=line['cart'], product=line['product'],
+            size_variant=line['size_variant'], color_variant=line['color_variant'],
+        ).order_by('pk')
+        CartItem.objects.filter(pk=keep.pk).update(quantity=line['total'])
+        CartItem.objects.filter(pk__in=[item.pk for item in extra]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0018_reconciliationcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0019_merge_duplicate_carts'),
+        ('products', '0015_alter_category_uid_alter_colorvariant_uid_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_paid', False)), fields=('user',), name='unique_open_cart_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product', 'size_variant', 'color_variant'), name='unique_cart_line', nulls_distinct=False),
+        ),
+    ]
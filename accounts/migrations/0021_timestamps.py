@@ -0,0 +1,97 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:03
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+# BaseModel set created_at on every save and updated_at only on insert, so a
+# row saved since it was inserted holds its creation time in updated_at and
+# its last change in created_at. Rows never saved again have both at their
+# insert time already.
+SWAPPED = [
+    'cart',
+    'cartitem',
+    'order',
+    'orderitem',
+    'profile',
+    'reconciliationcheckpoint',
+]
+
+
+def swap_timestamps(apps, schema_editor):
+    # Both columns are read before either is written, so this is a straight swap.
+    for name in SWAPPED:
+        apps.get_model('accounts', name).objects.filter(created_at__gt=F('updated_at')).update(
+            created_at=F('updated_at'), updated_at=F('created_at'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0020_unique_open_cart_and_cart_line'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cart',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='cart',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='cartitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='reconciliationcheckpoint',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='reconciliationcheckpoint',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(swap_timestamps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:28
+
+import django.db.models.functions.comparison
+import uuid
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    # Where NULLS NOT DISTINCT wasn't available (SQLite, PostgreSQL before 15)
+    # unique_cart_line was never created, so lines without a size or colour
+    # may have been added twice. Fold them together before it is.
+    CartItem = apps.get_model('accounts', 'CartItem')
+    duplicated_lines = (
+        CartItem.objects.values('cart', 'product', 'size_variant', 'color_variant')
+        .annotate(rows=Count('uid'), total=Sum('quantity')).filter(rows__gt=1)
+    )
+    for line in list(duplicated_lines):
+        keep, *extra = CartItem.objects.filter(
+            cart=line['cart'], product=line['product'],
+            size_variant=line['size_variant'], color_variant=line['color_variant'],
+        ).order_by('pk')
+        CartItem.objects.filter(pk=keep.pk).update(quantity=line['total'])
+        CartItem.objects.filter(pk__in=[item.pk for item in extra]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0021_timestamps'),
+        ('products', '0023_timestamps'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='cartitem',
+            name='unique_cart_line',
+        ),
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(models.F('cart'), models.F('product'), django.db.models.functions.comparison.Coalesce('size_variant', models.Value(uuid.UUID('00000000-0000-0000-0000-000000000000'), output_field=models.UUIDField())), django.db.models.functions.comparison.Coalesce('color_variant', models.Value(uuid.UUID('00000000-0000-0000-0000-000000000000'), output_field=models.UUIDField())), name='unique_cart_line'),
+        ),
+    ]
@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models import Prefetch
 from django.contrib.auth.models import User
-from base.models import BaseModel
+from base.models import BaseModel, coalesce_key, coalesce_key_sql
 from products.models import Product, ColorVariant, SizeVariant, Coupon
 from home.models import ShippingAddress
 from django.conf import settings
@@ -46,6 +47,13 @@ class Cart(BaseModel):
     is_paid = models.BooleanField(default=False)
     stripe_payment_intent_id = models.CharField(max_length=100, null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            # One open cart per shopper, so concurrent get_or_create() calls agree.
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(is_paid=False), name='unique_open_cart_per_user'),
+        ]
+
     def get_cart_total(self):
         cart_items = self.cart_items.all()
         total_price = 0
@@ -73,6 +81,15 @@ class CartItem(BaseModel):
     size_variant = models.ForeignKey(SizeVariant, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.IntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # One row per cart line, lines without a size or colour included,
+            # which is what lets add_cart_items() upsert them.
+            models.UniqueConstraint(
+                'cart', 'product', coalesce_key('size_variant'), coalesce_key('color_variant'),
+                name='unique_cart_line'),
+        ]
+
     def get_product_price(self):
         price = self.product.price * self.quantity
 
@@ -85,6 +102,63 @@ class CartItem(BaseModel):
         return price
 
 
+def cart_items_prefetch():
+    # Everything get_product_price() touches, so cart totals cost one query.
+    return Prefetch(
+        'cart_items',
+        queryset=CartItem.objects.select_related('product', 'size_variant', 'color_variant'),
+    )
+
+
+def add_cart_item(cart, product, size_variant=None, color_variant=None, quantity=1):
+    """
+    Add ``quantity`` of a product to ``cart``, creating the line if needed,
+    without losing concurrent updates to the same line.
+    """
+    add_cart_items(cart, [{
+        'product': product, 'size_variant': size_variant, 'color_variant': color_variant, 'quantity': quantity,
+    }])
+
+
+def add_cart_items(cart, lines):
+    """
+    Add several lines to ``cart`` at once. Each line is a dict of CartItem
+    fields (``product``/``product_id``, ``size_variant``, ``color_variant``
+    and ``quantity``); quantities are added to any existing line.
+
+    One multi-row ``INSERT ... ON CONFLICT DO UPDATE`` against
+    ``unique_cart_line``, so concurrent adds of the same line sum up instead
+    of racing to insert it.
+    """
+    if not lines:
+        return
+
+    qn = connection.ops.quote_name
+    fields = CartItem._meta.concrete_fields
+    values = []
+    for line in lines:
+        item = CartItem(cart=cart, **line)
+        values.extend(field.get_db_prep_save(field.pre_save(item, True), connection) for field in fields)
+    table = qn(CartItem._meta.db_table)
+    columns = ', '.join(qn(field.column) for field in fields)
+    row = f'({", ".join(["%s"] * len(fields))})'
+    conflict = ', '.join(
+        [qn(CartItem._meta.get_field(name).column) for name in ('cart', 'product')]
+        + [coalesce_key_sql(CartItem, name, connection) for name in ('size_variant', 'color_variant')]
+    )
+    updates = ', '.join(
+        [f'{qn("quantity")} = {table}.{qn("quantity")} + EXCLUDED.{qn("quantity")}']
+        + [f'{qn(field.column)} = EXCLUDED.{qn(field.column)}'
+           for field in fields if getattr(field, 'auto_now', False)]
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) VALUES {", ".join([row] * len(lines))} '
+            f'ON CONFLICT ({conflict}) DO UPDATE SET {updates}',
+            values,
+        )
+
+
 class Order(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders")
     order_id = models.CharField(max_length=100, unique=True)
@@ -123,3 +197,12 @@ class OrderItem(BaseModel):
             quantity=self.quantity
         )
         return cart_item.get_product_price()
+
+
+class ReconciliationCheckpoint(BaseModel):
+    # How far `manage.py reconcile_payments` has scanned Stripe, so each run is incremental.
+    name = models.CharField(max_length=50, unique=True)
+    synced_until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} synced until {self.synced_until}"
@@ -0,0 +1,121 @@
+import uuid
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import Cart, Order, OrderItem, cart_items_prefetch
+from products.inventory import commit_reservations
+
+
+def paid_payments(client, since, until, page_size=100):
+    """
+    Yield ``(payment_intent_id, cart_id)`` for every paid Checkout Session and
+    succeeded PaymentIntent created in ``[since, until]``, paging through
+    Stripe's list endpoints. ``cart_id`` is None when Stripe has no metadata.
+    """
+    params = {'created': {'gte': int(since.timestamp()), 'lte': int(until.timestamp())}, 'limit': page_size}
+
+    for session in client.checkout.sessions.list(params=params).auto_paging_iter():
+        if session.payment_status == 'paid' and session.payment_intent:
+            yield session.payment_intent, (session.metadata or {}).get('cart_id')
+
+    for intent in client.payment_intents.list(params=params).auto_paging_iter():
+        if intent.status == 'succeeded':
+            yield intent.id, (intent.metadata or {}).get('cart_id')
+
+
+def _valid_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def reconcile(payments, batch_size=200, dry_run=False):
+    """
+    Create the ``Order`` that ``payment_success`` would have created for
+    every paid Stripe payment whose cart is still unpaid.
+
+    Payments are matched to carts by the ``cart_id`` metadata first and by
+    ``Cart.stripe_payment_intent_id`` otherwise. Each batch costs a handful
+    of queries and commits on its own, and payments that already have an
+    order are skipped, so re-running over the same window is safe.
+    """
+    stats = Counter()
+    # A checkout session and its PaymentIntent describe the same payment.
+    cart_ids = {}
+    for payment_intent_id, cart_id in payments:
+        if payment_intent_id not in cart_ids or cart_id:
+            cart_ids[payment_intent_id] = cart_id
+    stats['payments'] = len(cart_ids)
+
+    payment_intent_ids = list(cart_ids)
+    for start in range(0, len(payment_intent_ids), batch_size):
+        batch = {pi: cart_ids[pi] for pi in payment_intent_ids[start:start + batch_size]}
+        for key, count in _reconcile_batch(batch, dry_run).items():
+            stats[key] += count
+    return stats
+
+
+def _reconcile_batch(batch, dry_run):
+    stats = Counter()
+    recorded = set(Order.objects.filter(order_id__in=batch).values_list('order_id', flat=True))
+    stats['already_recorded'] = len(recorded)
+    pending = {pi: cart_id for pi, cart_id in batch.items() if pi not in recorded}
+    if not pending:
+        return stats
+
+    with transaction.atomic():
+        uids = [uid for uid in map(_valid_uuid, pending.values()) if uid]
+        carts = list(
+            Cart.objects.select_for_update(of=('self',))
+            .filter(Q(uid__in=uids) | Q(stripe_payment_intent_id__in=pending), is_paid=False)
+            .select_related('user__profile__shipping_address', 'coupon')
+            .prefetch_related(cart_items_prefetch())
+        )
+        by_uid = {cart.uid: cart for cart in carts}
+        by_payment_intent = {cart.stripe_payment_intent_id: cart for cart in carts}
+
+        matched = []
+        for payment_intent_id, cart_id in pending.items():
+            cart = by_uid.get(_valid_uuid(cart_id)) or by_payment_intent.get(payment_intent_id)
+            if cart is None or cart.is_paid:
+                stats['unmatched'] += 1
+                continue
+            cart.is_paid = True
+            cart.stripe_payment_intent_id = payment_intent_id
+            matched.append(cart)
+        stats['created'] = len(matched)
+        if dry_run or not matched:
+            return stats
+
+        orders = [
+            Order(
+                user=cart.user,
+                order_id=cart.stripe_payment_intent_id,
+                payment_status="Paid",
+                shipping_address=cart.user.profile.shipping_address,
+                payment_mode="Credit Card",
+                order_total_price=cart.get_cart_total(),
+                coupon=cart.coupon,
+                grand_total=cart.get_cart_total_price_after_coupon(),
+            )
+            for cart in matched
+        ]
+        Cart.objects.bulk_update(matched, ['is_paid', 'stripe_payment_intent_id'])
+        Order.objects.bulk_create(orders)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=cart_item.product,
+                size_variant=cart_item.size_variant,
+                color_variant=cart_item.color_variant,
+                quantity=cart_item.quantity,
+                product_price=cart_item.get_product_price(),
+            )
+            for order, cart in zip(orders, matched)
+            for cart_item in cart.cart_items.all()
+        ])
+        commit_reservations(matched)
+    return stats
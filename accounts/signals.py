@@ -1,7 +1,9 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
 from accounts.models import Profile
+from accounts.guest_cart import merge_guest_cart
 
 
 @receiver(post_save, sender=User)
@@ -13,3 +15,11 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+
+@receiver(user_logged_in)
+def merge_guest_cart_on_login(sender, request, user, **kwargs):
+    # Covers both login_page and allauth (email and social) logins.
+    guest_cart = getattr(request, 'guest_cart', None)
+    if guest_cart:
+        merge_guest_cart(guest_cart, user)
@@ -0,0 +1,183 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+
+def _parse_form(body):
+    """Turn Stripe's ``metadata[cart_id]=...`` form encoding into nested dicts."""
+    data = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        parts = key.replace(']', '').split('[')
+        target = data
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return data
+
+
+class StripeStubServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the handful of Stripe API endpoints the shop uses.
+
+    Objects live in memory for the lifetime of the server. ``latency`` (in
+    seconds) is added to every response to mimic a slow upstream, and
+    checkout sessions are reported as paid when ``auto_pay`` is set so the
+    ``payment_success`` flow can complete without a browser. List endpoints
+    page newest-first with ``starting_after``, as Stripe's do.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=12111, latency=0.0, auto_pay=True):
+        super().__init__((host, port), StripeStubHandler)
+        self.latency = latency
+        self.auto_pay = auto_pay
+        self.lock = threading.Lock()
+        self.objects = {'checkout.session': {}, 'payment_intent': {}}
+        self.request_count = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def store(self, kind, obj):
+        with self.lock:
+            self.objects[kind][obj['id']] = obj
+        return obj
+
+    def list_objects(self, kind, params):
+        """One page of ``kind``, newest first, honouring ``created[gte|gt|lte|lt]``, ``starting_after`` and ``limit``."""
+        created = params.get('created', {})
+        bounds = {
+            'gte': lambda value, bound: value >= bound,
+            'gt': lambda value, bound: value > bound,
+            'lte': lambda value, bound: value <= bound,
+            'lt': lambda value, bound: value < bound,
+        }
+        with self.lock:
+            objects = list(reversed(self.objects[kind].values()))
+        if isinstance(created, dict):
+            for op, bound in created.items():
+                objects = [obj for obj in objects if bounds[op](obj['created'], int(bound))]
+        elif created:
+            objects = [obj for obj in objects if obj['created'] == int(created)]
+
+        starting_after = params.get('starting_after')
+        if starting_after:
+            ids = [obj['id'] for obj in objects]
+            objects = objects[ids.index(starting_after) + 1:] if starting_after in ids else []
+
+        limit = min(int(params.get('limit', 10)), 100)
+        return {'object': 'list', 'data': objects[:limit], 'has_more': len(objects) > limit}
+
+    def create_payment_intent(self, amount, currency='inr', metadata=None, status='requires_payment_method'):
+        return self.store('payment_intent', {
+            'id': f'pi_{uuid.uuid4().hex[:24]}',
+            'object': 'payment_intent',
+            'amount': int(amount),
+            'currency': currency,
+            'status': status,
+            'created': int(time.time()),
+            'metadata': metadata or {},
+        })
+
+    def create_checkout_session(self, params):
+        metadata = params.get('metadata', {})
+        line_items = params.get('line_items', {})
+        amount = sum(
+            int(item.get('price_data', {}).get('unit_amount', 0)) * int(item.get('quantity', 1))
+            for item in line_items.values()
+        )
+        intent = self.create_payment_intent(
+            amount, currency=line_items.get('0', {}).get('price_data', {}).get('currency', 'cad'),
+            metadata=metadata, status='succeeded' if self.auto_pay else 'requires_payment_method',
+        )
+        session_id = f'cs_test_{uuid.uuid4().hex[:24]}'
+        return self.store('checkout.session', {
+            'id': session_id,
+            'object': 'checkout.session',
+            'amount_total': amount,
+            'created': int(time.time()),
+            'mode': params.get('mode', 'payment'),
+            'payment_intent': intent['id'],
+            'payment_status': 'paid' if self.auto_pay else 'unpaid',
+            'status': 'complete' if self.auto_pay else 'open',
+            'success_url': params.get('success_url'),
+            'url': f'{self.url}/pay/{session_id}',
+            'metadata': metadata,
+        })
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    server: StripeStubServer
+
+    routes = {
+        'checkout/sessions': 'checkout.session',
+        'payment_intents': 'payment_intent',
+    }
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_api('GET')
+
+    def do_POST(self):
+        self.handle_api('POST')
+
+    def handle_api(self, method):
+        with self.server.lock:
+            self.server.request_count += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        url = urlparse(self.path)
+        path = url.path.strip('/')
+        if not path.startswith('v1/'):
+            return self.respond(404, self.error('Unrecognized request URL.'))
+        path = path[len('v1/'):]
+
+        for prefix, kind in self.routes.items():
+            if path == prefix and method == 'POST':
+                length = int(self.headers.get('Content-Length') or 0)
+                params = _parse_form(self.rfile.read(length).decode())
+                if kind == 'checkout.session':
+                    return self.respond(200, self.server.create_checkout_session(params))
+                return self.respond(200, self.server.create_payment_intent(
+                    params.get('amount', 0), params.get('currency', 'inr'), params.get('metadata'),
+                ))
+            if path == prefix and method == 'GET':
+                page = self.server.list_objects(kind, _parse_form(url.query))
+                return self.respond(200, {**page, 'url': f'/v1/{prefix}'})
+            if path.startswith(prefix + '/') and method == 'GET':
+                obj = self.server.objects[kind].get(path[len(prefix) + 1:])
+                if obj is None:
+                    return self.respond(404, self.error(f'No such {kind}.', code='resource_missing'))
+                return self.respond(200, obj)
+
+        return self.respond(404, self.error('Unrecognized request URL.'))
+
+    def error(self, message, code=None):
+        return {'error': {'type': 'invalid_request_error', 'message': message, 'code': code}}
+
+    def respond(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Request-Id', f'req_{uuid.uuid4().hex[:14]}')
+        self.end_headers()
+        self.wfile.write(body)
@@ -1,3 +1,293 @@
-from django.test import TestCase
+import asyncio
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import stripe
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
+
+from accounts.guest_cart import COOKIE_NAME
+from accounts.models import Cart, CartItem, Order, ReconciliationCheckpoint, add_cart_item
+from accounts.stripe_stub import StripeStubServer
+from base.stripe_client import CircuitBreaker, ResilientHTTPXClient, get_gateway, stripe_metrics
+from base.testing import QueryBudgetMixin
+from home.seeding import seed
+from products.models import Product
+
+
+class AccountsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    app = 'accounts'
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class StripeClientTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=3, images_per_product=1, users=1, carts=1, cart_items=2,
+             orders=0, order_items=0, reviews=0, tag='stripe')
+        cls.user = User.objects.get(username='stripe-user-0')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_checkout_records_stripe_metrics(self):
+        stub = StripeStubServer(port=0).start()
+        self.addCleanup(stub.stop)
+
+        with self.settings(STRIPE_API_BASE=stub.url):
+            response = self.client.post(reverse('create_checkout_session'))
+            metrics = stripe_metrics()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics['circuit'], 'closed')
+        self.assertEqual(metrics['operations']['POST /v1/checkout/sessions']['calls'], 1)
+        self.assertEqual(metrics['operations']['POST /v1/checkout/sessions']['errors'], 0)
+
+    def test_checkout_fails_fast_once_circuit_opens(self):
+        with self.settings(STRIPE_API_BASE=f'http://127.0.0.1:{unused_port()}', STRIPE_MAX_RETRIES=0,
+                           STRIPE_CIRCUIT_FAILURE_THRESHOLD=2):
+            for _ in range(2):
+                self.assertEqual(self.client.post(reverse('create_checkout_session')).status_code, 500)
+
+            response = self.client.post(reverse('create_checkout_session'))
+            metrics = stripe_metrics()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('temporarily unavailable', response.json()['error'])
+        self.assertEqual(metrics['circuit'], 'open')
+        self.assertEqual(metrics['rejected'], 1)
+        self.assertEqual(metrics['operations']['POST /v1/checkout/sessions']['errors'], 2)
+
+    def test_circuit_lets_one_trial_call_through_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_cancelled_calls_are_not_failures(self):
+        with self.settings(STRIPE_CIRCUIT_FAILURE_THRESHOLD=1, STRIPE_CIRCUIT_RESET_TIMEOUT=0):
+            gateway = get_gateway()
+            client = ResilientHTTPXClient(gateway, timeout=httpx.Timeout(1), limits=httpx.Limits())
+            call = client.request_with_retries_async('post', 'https://api.stripe.com/v1/checkout/sessions', {})
+            cancelled = mock.patch.object(stripe.HTTPXClient, 'request_with_retries_async',
+                                          side_effect=asyncio.CancelledError)
+
+            # The shopper went away mid-call: the breaker stays closed.
+            with cancelled, self.assertRaises(asyncio.CancelledError):
+                asyncio.run(call)
+            self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+            self.assertEqual(gateway.breaker.failures, 0)
+
+            # A cancelled trial call hands the trial to the next caller.
+            gateway.breaker.record_failure()
+            call = client.request_with_retries_async('post', 'https://api.stripe.com/v1/checkout/sessions', {})
+            with cancelled, self.assertRaises(asyncio.CancelledError):
+                asyncio.run(call)
+            self.assertEqual(gateway.breaker.state, CircuitBreaker.OPEN)
+            self.assertTrue(gateway.breaker.allow())
+
+
+class ReconcilePaymentsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=6, images_per_product=1, users=3, carts=3, cart_items=2,
+             orders=0, order_items=0, reviews=0, tag='reconcile')
+        cls.carts = list(Cart.objects.filter(user__username__startswith='reconcile-').order_by('user__username'))
+
+    def setUp(self):
+        self.stripe = StripeStubServer(port=0).start()
+        self.addCleanup(self.stripe.stop)
+
+    def reconcile(self, *args):
+        out = StringIO()
+        with self.settings(STRIPE_API_BASE=self.stripe.url):
+            call_command('reconcile_payments', '--batch-size', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_creates_missing_orders_incrementally(self):
+        paid, abandoned, by_intent = self.carts
+        self.stripe.create_checkout_session({'metadata': {'cart_id': str(paid.uid)}})
+        self.stripe.auto_pay = False
+        self.stripe.create_checkout_session({'metadata': {'cart_id': str(abandoned.uid)}})
+        self.stripe.auto_pay = True
+        # No metadata: matched through the PaymentIntent the cart page recorded.
+        intent = self.stripe.create_payment_intent(1000, status='succeeded')
+        Cart.objects.filter(pk=by_intent.pk).update(stripe_payment_intent_id=intent['id'])
+
+        self.assertIn('created 2 orders', self.reconcile())
+        self.assertEqual(set(Order.objects.values_list('user', flat=True)), {paid.user_id, by_intent.user_id})
+        self.assertEqual(Order.objects.get(order_id=intent['id']).order_items.count(), 2)
+        self.assertFalse(Cart.objects.get(pk=abandoned.pk).is_paid)
+        self.assertTrue(ReconciliationCheckpoint.objects.filter(name='stripe_payments').exists())
+
+        # A second run re-scans the overlap but creates nothing new.
+        self.assertIn('created 0 orders', self.reconcile())
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_pages_through_stripe_lists(self):
+        for cart in self.carts:
+            self.stripe.create_checkout_session({'metadata': {'cart_id': str(cart.uid)}})
+        for _ in range(150):
+            self.stripe.create_payment_intent(500, status='succeeded')
+
+        output = self.reconcile('--dry-run')
+
+        self.assertIn('153 paid payments: would create 3 orders', output)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertFalse(ReconciliationCheckpoint.objects.exists())
+
+
+class CartSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=4, images_per_product=1, users=1, carts=1, cart_items=2,
+             orders=0, order_items=0, reviews=0, tag='sync')
+        cls.user = User.objects.get(username='sync-user-0')
+        cls.cart = Cart.objects.get(user=cls.user)
+        cls.first, cls.second = cls.cart.cart_items.order_by('pk')
+        cls.new_product = Product.objects.exclude(cartitem__cart=cls.cart).first()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def sync(self, *operations):
+        return self.client.post(reverse('cart_sync'), {'operations': list(operations)},
+                                content_type='application/json')
+
+    def test_applies_add_update_and_remove_in_one_request(self):
+        response = self.sync(
+            {'op': 'add', 'product': str(self.new_product.uid), 'size': 'M', 'quantity': 2},
+            {'op': 'add', 'product': str(self.new_product.uid), 'size': 'M'},
+            {'op': 'update', 'cart_item_id': str(self.first.uid), 'quantity': 4},
+            {'op': 'remove', 'cart_item_id': str(self.second.uid)},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+        self.assertEqual(summary['count'], 2)
+        quantities = dict(self.cart.cart_items.values_list('product', 'quantity'))
+        self.assertEqual(quantities, {self.first.product_id: 4, self.new_product.pk: 3})
+        self.assertEqual(summary['total'], sum(item.get_product_price() for item in self.cart.cart_items.all()))
+
+    def test_rejects_the_whole_batch_on_a_bad_operation(self):
+        response = self.sync(
+            {'op': 'update', 'cart_item_id': str(self.first.uid), 'quantity': 5},
+            {'op': 'remove', 'cart_item_id': str(self.new_product.uid)},
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Operation 1', response.json()['error'])
+        self.first.refresh_from_db()
+        self.assertNotEqual(self.first.quantity, 5)
+
+
+class GuestCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=3, images_per_product=1, users=1, carts=1, cart_items=1,
+             orders=0, order_items=0, reviews=0, tag='guest')
+        cls.user = User.objects.get(username='guest-user-0')
+        cls.cart = Cart.objects.get(user=cls.user)
+        # add_to_cart never picks a color, so make the seeded line one it can match.
+        cls.cart.cart_items.update(color_variant=None)
+        cls.existing = cls.cart.cart_items.select_related('product', 'size_variant').get()
+        cls.new_product = Product.objects.exclude(cartitem__cart=cls.cart).first()
+
+    def add(self, product, size):
+        return self.client.get(reverse('add_to_cart', args=[product.uid]), {'size': size})
+
+    def test_guest_cart_is_merged_on_login(self):
+        existing_size = self.existing.size_variant.size_name
+        with self.assertNumQueries(4):
+            self.add(self.existing.product, existing_size)
+            self.add(self.existing.product, existing_size)
+        self.add(self.new_product, 'M')
+        self.assertIn(COOKIE_NAME, self.client.cookies)
+        self.assertEqual(CartItem.objects.count(), 1)
+
+        response = self.client.post(reverse('login'), {'username': self.user.username, 'password': 'loadtest123'})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[COOKIE_NAME].value, '')
+        quantities = dict(self.cart.cart_items.values_list('product', 'quantity'))
+        self.assertEqual(quantities, {self.existing.product_id: self.existing.quantity + 2, self.new_product.pk: 1})
+
+    def test_tampered_cookie_is_ignored(self):
+        self.add(self.new_product, 'M')
+        self.client.cookies[COOKIE_NAME] = self.client.cookies[COOKIE_NAME].value.replace('M', 'X', 1) + 'x'
+
+        self.client.post(reverse('login'), {'username': self.user.username, 'password': 'loadtest123'})
+
+        self.assertEqual(self.cart.cart_items.count(), 1)
+
+
+class CartLineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=1, images_per_product=1, users=1, carts=1, cart_items=0,
+             orders=0, order_items=0, reviews=0, tag='line')
+        cls.cart = Cart.objects.get()
+        cls.product = Product.objects.get()
+
+    def test_lines_without_a_size_or_colour_are_unique_on_every_backend(self):
+        add_cart_item(self.cart, self.product)
+        add_cart_item(self.cart, self.product, quantity=2)
+        self.assertEqual(list(self.cart.cart_items.values_list('quantity', flat=True)), [3])
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.create(cart=self.cart, product=self.product)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentCartTests(TransactionTestCase):
+    threads = 16
+    clicks = 10
+
+    def setUp(self):
+        seed(categories=1, products=2, images_per_product=1, users=1, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=0, tag='race')
+        self.user = User.objects.get(username='race-user-0')
+        self.product = Product.objects.first()
+
+    def test_concurrent_add_to_cart_keeps_every_click(self):
+        url = reverse('add_to_cart', args=[self.product.uid]) + '?size=M'
+        clients = []
+        for _ in range(self.threads):
+            client = Client()
+            client.force_login(self.user)
+            clients.append(client)
+        start = threading.Barrier(self.threads)
+
+        def shopper(client):
+            try:
+                start.wait()
+                for _ in range(self.clicks):
+                    client.get(url)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            list(pool.map(shopper, clients))
+
+        self.assertEqual(Cart.objects.filter(user=self.user, is_paid=False).count(), 1)
+        lines = CartItem.objects.filter(cart__user=self.user)
+        self.assertEqual(lines.count(), 1)
+        self.assertEqual(lines.get().quantity, self.threads * self.clicks)
@@ -31,11 +31,14 @@ urlpatterns = [
     path('cart/', cart, name="cart"),
     path('add-to-cart/<uid>/', add_to_cart, name="add_to_cart"),
     path('update_cart_item/', update_cart_item, name='update_cart_item'),
+    path('cart/sync/', cart_sync, name='cart_sync'),
+    path('viewer/', viewer, name='viewer'),
     path('remove-cart/<uid>/', remove_cart, name="remove_cart"),
     path('remove-coupon/<cart_id>/', remove_coupon, name="remove_coupon"),
     
     #Success url after payment is done.
     path('success/', payment_success, name="success"),
+    path('stripe-health/', stripe_health, name="stripe_health"),
     
     #Order history and details urls
     path('order-history/', order_history, name='order_history'),
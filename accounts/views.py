@@ -1,25 +1,36 @@
 import os, json
 import uuid
 import stripe
+from asgiref.sync import sync_to_async
 from weasyprint import CSS, HTML
 from products.models import *
 from django.urls import reverse
 from django.conf import settings
+from django.db import IntegrityError
 from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from home.models import ShippingAddress
 from django.contrib.auth.models import User
-from django.template.loader import get_template
-from accounts.models import Profile, Cart, CartItem, Order, OrderItem
+from django.template.loader import get_template, render_to_string
+from accounts.models import Profile, Cart, CartItem, Order, OrderItem, add_cart_item, cart_items_prefetch
 from base.emails import send_account_activation_email
+from base.decorators import async_login_required
+from base.stripe_client import StripeUnavailable, get_stripe_client, stripe_metrics
 from django.views.decorators.http import require_POST
 from django.contrib.auth import update_session_auth_hash
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import HttpResponseRedirect, HttpResponse
 from django.contrib.auth import authenticate, login, logout
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.shortcuts import redirect, render, get_object_or_404
+from accounts.cart_sync import apply_operations, cart_summary
+from accounts.guest_cart import GuestCartFull
+from products.coupons import CouponError, apply_coupon, remove_coupon as remove_coupon_from_cart
+from products.flash_sale import blocking_sale
+from products.inventory import OutOfStock, commit_reservations, release_cart_reservations, reserve_cart
 from accounts.forms import UserUpdateForm, UserProfileForm, ShippingAddressForm, CustomPasswordChangeForm
 
 
@@ -115,7 +126,6 @@ def activate_email_account(request, email_token):
     except Exception as e:
         return HttpResponse('Invalid email token.')
 
-@login_required
 def add_to_cart(request, uid):
     try:
         variant = request.GET.get('size')
@@ -123,20 +133,34 @@ def add_to_cart(request, uid):
             messages.error(request, 'Please select a size variant!')
             return redirect(request.META.get('HTTP_REFERER'))
         
+        sale = blocking_sale(request, [uid])
+        if sale:
+            messages.warning(request, "This product is in a flash sale. Please wait for your turn.")
+            return redirect('get_product', slug=sale['slug'])
+
         product = get_object_or_404(Product, uid=uid)
+        # Only this product's own variants: size and color names aren't unique across the catalog.
+        size_variant = get_object_or_404(product.size_variant, size_name=variant)
+        color = request.GET.get('color')
+        color_variant = get_object_or_404(product.color_variant, color_name=color) if color else None
+
+        if not request.user.is_authenticated:
+            # Guests keep their cart in a signed cookie; it is merged into a real cart when they log in.
+            request.guest_cart.add(product.uid, size_variant.uid, color_variant.uid if color_variant else None)
+            messages.success(request, 'Item added to cart. Log in to check out.')
+            return redirect(request.META.get('HTTP_REFERER') or 'index')
 
         cart, _ = Cart.objects.get_or_create(user=request.user, is_paid=False)
-        size_variant = get_object_or_404(SizeVariant, size_name=variant)
 
-        # Check if the cart item already exists in the cart
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product, size_variant=size_variant)
-        
-        if not created:
-            cart_item.quantity += 1
-            cart_item.save()
+        # Add the line or bump its quantity in one statement, safe under double clicks
+        add_cart_item(cart, product, size_variant, color_variant)
 
         messages.success(request, 'Item added to cart successfully.')
 
+    except GuestCartFull as e:
+        messages.warning(request, str(e))
+        return redirect(request.META.get('HTTP_REFERER') or 'index')
+
     except Exception as e:
         print(e)
         messages.error(request, 'Error adding item to cart.')
@@ -144,64 +168,14 @@ def add_to_cart(request, uid):
     return redirect(reverse('cart'))
 
 
-@login_required
-def payment_success(request):
-    # Get the Stripe session ID from the query parameters
-    session_id = request.GET.get("session_id")
-    if not session_id:
-        messages.error(request, "Invalid session ID.")
-        return redirect("cart")  # Redirect to the cart if no session_id is provided
-
-    # Initialize Stripe with the secret key
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-
-    try:
-        # Retrieve the checkout session details from Stripe
-        session = stripe.checkout.Session.retrieve(session_id)
-
-        # Check if the payment was successful
-        if session.payment_status == "paid":
-            # Get the cart based on metadata (saved during the Stripe session creation)
-            cart_id = session.metadata.get("cart_id")
-            cart = get_object_or_404(Cart, id=cart_id, user=request.user, is_paid=False)
-
-            # Mark the cart as paid
-            cart.is_paid = True
-            cart.stripe_payment_intent_id = session.payment_intent  # Save payment intent for records
-            cart.save()
-
-            # Display a success message
-            messages.success(request, "Payment successful! Thank you for your order.")
-
-            # Redirect to a success page
-            return render(request, "accounts/success.html", {"cart": cart})
-
-        else:
-            messages.error(request, "Payment was not successful. Please try again.")
-            return redirect("cart")
-
-    except stripe.error.StripeError as e:
-        # Handle any Stripe-specific errors
-        messages.error(request, f"Stripe error: {e.user_message}")
-        return redirect("cart")
-
-    except Exception as e:
-        # Handle other errors
-        messages.error(request, "An unexpected error occurred.")
-        print(e)
-        return redirect("cart")
-
-
 @csrf_exempt
-@login_required
-def create_checkout_session(request):
-    # Initialize Stripe with secret key
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-
-    user = request.user
+@async_login_required
+async def create_checkout_session(request):
+    user = await request.auser()
     try:
         # Get the user's cart
-        cart = get_object_or_404(Cart, user=user, is_paid=False)
+        cart = await Cart.objects.select_related('coupon').prefetch_related(
+            cart_items_prefetch()).aget(user=user, is_paid=False)
 
         # Calculate the total amount in cents (Stripe uses smallest currency unit)
         total_amount = int(cart.get_cart_total_price_after_coupon() * 100)
@@ -209,79 +183,80 @@ def create_checkout_session(request):
         if total_amount < 100:  # Minimum transaction amount in INR
             return JsonResponse({"error": "Cart total is too low for a transaction."}, status=400)
 
-        # Create the Stripe Checkout Session
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[
-                { 
-                    "price_data": {
-                        "currency": "cad",
-                        "product_data": {
-                            "name": "Sustainable Clothing Cart",
-                            "description": f"Order from {user.username}",
+        sale = await sync_to_async(blocking_sale)(request, {item.product_id for item in cart.cart_items.all()})
+        if sale:
+            return JsonResponse({"error": "Your cart has a flash-sale item. Please wait for your turn in the waiting room."}, status=403)
+
+        # Hold the stock before taking payment, so a drop can't be oversold
+        await sync_to_async(reserve_cart)(cart)
+
+        # Create the Stripe Checkout Session without holding a worker thread
+        try:
+            session = await get_stripe_client().checkout.sessions.create_async(params={
+                "payment_method_types": ["card"],
+                "line_items": [
+                    {
+                        "price_data": {
+                            "currency": "cad",
+                            "product_data": {
+                                "name": "Sustainable Clothing Cart",
+                                "description": f"Order from {user.username}",
+                            },
+                            "unit_amount": total_amount,
                         },
-                        "unit_amount": total_amount,
+                        "quantity": 1,
                     },
-                    "quantity": 1,
+                ],
+                "mode": "payment",
+                "success_url": f"{settings.SITE_URL}/accounts/success/?session_id={{CHECKOUT_SESSION_ID}}",
+                "cancel_url": f"{settings.SITE_URL}/accounts/cart/?checkout=cancelled",
+                "metadata": {
+                    "cart_id": str(cart.uid),
+                    "user_id": user.id,
                 },
-            ],
-            mode="payment",
-            success_url=f"{settings.SITE_URL}/accounts/success/?session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=f"{settings.SITE_URL}/accounts/cart/",
-            metadata={
-                "cart_id": cart.uid,
-                "user_id": user.id,
-            },
-        )
+            })
+        except Exception:
+            await sync_to_async(release_cart_reservations)(cart)
+            raise
 
         # Save the session ID to the cart for tracking
         cart.stripe_payment_intent_id = session.payment_intent
-        cart.save()
+        await cart.asave()
         return JsonResponse({"id": session.id})
+    except OutOfStock as e:
+        return JsonResponse({"error": str(e)}, status=409)
+    except StripeUnavailable as e:
+        # Circuit breaker is open: fail fast instead of queueing on a struggling Stripe.
+        return JsonResponse({"error": e.user_message}, status=503)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-@login_required
-def cart(request):
+@async_login_required
+async def cart(request):
     cart_obj = None
-    user = request.user
-
-    # Initialize Stripe with secret key
-    stripe.api_key = settings.STRIPE_SECRET_KEY
+    user = await request.auser()
 
     try:
-        cart_obj = Cart.objects.get(is_paid=False, user=user)
+        cart_obj = await Cart.objects.select_related('coupon').prefetch_related(
+            cart_items_prefetch(), product_images_prefetch('cart_items__product__product_images'),
+        ).aget(is_paid=False, user=user)
     except Exception as e:
         print(e)
         messages.warning(request, "Your cart is empty. Please sign in or add a product to cart.")
         return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
-    if request.method == 'POST':
-        coupon = request.POST.get('coupon')
-        coupon_obj = Coupon.objects.filter(coupon_code__exact=coupon).first()
-
-        if not coupon_obj:
-            messages.warning(request, 'Invalid coupon code.')
-            return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
-
-        if cart_obj and cart_obj.coupon:
-            messages.warning(request, 'Coupon already exists.')
-            return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
-
-        if coupon_obj and coupon_obj.is_expired:
-            messages.warning(request, 'Coupon code expired.')
-            return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
+    if request.GET.get('checkout') == 'cancelled':
+        # The shopper backed out of Stripe Checkout: give the stock held for them back now.
+        await sync_to_async(release_cart_reservations)(cart_obj)
 
-        if cart_obj and coupon_obj and cart_obj.get_cart_total() < coupon_obj.minimum_amount:
-            messages.warning(
-                request, f'Amount should be greater than {coupon_obj.minimum_amount}')
-            return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
-
-        if cart_obj and coupon_obj:
-            cart_obj.coupon = coupon_obj
-            cart_obj.save()
+    if request.method == 'POST':
+        try:
+            # Validated against the cached active coupons; caps are enforced atomically.
+            await sync_to_async(apply_coupon)(cart_obj, request.POST.get('coupon'))
             messages.success(request, 'Coupon applied successfully.')
-            return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
+        except CouponError as e:
+            messages.warning(request, str(e))
+        return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
     if cart_obj:
         cart_total = cart_obj.get_cart_total_price_after_coupon()
@@ -293,13 +268,16 @@ def cart(request):
 
         # Stripe payment intent
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=int(cart_total * 100),  # Convert total to paise (smallest currency unit)
-                currency='inr',
-                metadata={'cart_id': cart_obj.uid},  # Include cart ID in metadata for tracking
-            )
+            intent = await get_stripe_client().payment_intents.create_async(params={
+                'amount': int(cart_total * 100),  # Convert total to paise (smallest currency unit)
+                'currency': 'inr',
+                'metadata': {'cart_id': str(cart_obj.uid)},  # Include cart ID in metadata for tracking
+            })
             cart_obj.stripe_payment_intent_id = intent['id']
-            cart_obj.save()
+            await cart_obj.asave()
+        except StripeUnavailable as e:
+            # Still show the cart; checkout will report the outage too.
+            messages.warning(request, e.user_message)
         except stripe.error.StripeError as e:
             messages.error(request, f"Stripe error: {e.user_message}")
             return redirect('index')
@@ -309,7 +287,13 @@ def cart(request):
         'quantity_range': range(1, 6),
         'stripe_public_key': settings.STRIPE_PUBLIC_KEY,
     }
-    return render(request, 'accounts/cart.html', context)
+    # Templates (and the navbar's lazy queries) still render synchronously.
+    return await sync_to_async(render)(request, 'accounts/cart.html', context)
+
+@user_passes_test(lambda user: user.is_staff)
+def stripe_health(request):
+    # Circuit state plus per-endpoint call/error counts and latencies for this worker.
+    return JsonResponse(stripe_metrics())
 
 @require_POST
 @login_required
@@ -319,15 +303,58 @@ def update_cart_item(request):
         cart_item_id = data.get("cart_item_id")
         quantity = int(data.get("quantity"))
 
-        cart_item = CartItem.objects.get(uid=cart_item_id, cart__user=request.user, cart__is_paid=False)
-        cart_item.quantity = quantity
-        cart_item.save()
+        updated = CartItem.objects.filter(
+            uid=cart_item_id, cart__user=request.user, cart__is_paid=False).update(quantity=quantity)
+        if not updated:
+            return JsonResponse({"success": False, "error": "Cart item not found."})
 
         return JsonResponse({"success": True})
     except Exception as e:
         return JsonResponse({"success": False, "error": str(e)})
 
 
+@require_POST
+@login_required
+def cart_sync(request):
+    # Apply a batch of add/update/remove operations and return the new cart totals.
+    try:
+        data = json.loads(request.body)
+        cart, lines = apply_operations(request.user, data.get("operations"))
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    except IntegrityError:
+        # A concurrent request added the same new line; the client can resend.
+        return JsonResponse({"success": False, "error": "Your cart changed, please try again."}, status=409)
+
+    return JsonResponse({"success": True, **cart_summary(cart, lines)})
+
+
+@never_cache
+def viewer(request):
+    # The per-visitor parts of the pages served by base.conditional.public_page, fetched after they load.
+    user = request.user
+    if user.is_authenticated:
+        profile = getattr(user, 'profile', None)
+        cart_count = profile.get_cart_count() if profile else 0
+        wishlist_count = user.wishlist.count()
+    else:
+        cart_count = len(request.guest_cart) if request.guest_cart else None
+        wishlist_count = None
+
+    data = {
+        'signed_in': user.is_authenticated,
+        'profile': render_to_string('home/navbar_profile.html', request=request),
+        'cart_count': cart_count,
+        'wishlist_count': wishlist_count,
+        # Also sets the CSRF cookie the token belongs to.
+        'csrf_token': get_token(request),
+    }
+    # Only read when the page has somewhere to show them, so they aren't lost.
+    if request.GET.get('messages'):
+        data['messages'] = render_to_string('base/alert.html', request=request)
+    return JsonResponse(data)
+
+
 def remove_cart(request, uid):
     try:
         cart_item = get_object_or_404(CartItem, uid=uid)
@@ -341,45 +368,45 @@ def remove_cart(request, uid):
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
 
+@login_required
 def remove_coupon(request, cart_id):
-    cart = Cart.objects.get(uid=cart_id)
-    cart.coupon = None
-    cart.save()
+    cart = get_object_or_404(Cart.objects.select_related('coupon'), uid=cart_id, user=request.user)
+    # Gives the use back to the coupon's redemption caps.
+    remove_coupon_from_cart(cart)
 
     messages.success(request, 'Coupon Removed.')
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
-@login_required
-def payment_success(request):
+@async_login_required
+async def payment_success(request):
     # Get the Stripe session ID from the query parameters
     session_id = request.GET.get("session_id")
     if not session_id:
         messages.error(request, "Invalid session ID.")
         return redirect("cart")  # Redirect to the cart if no session_id is provided
 
-    # Initialize Stripe with the secret key
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-
+    user = await request.auser()
     try:
         # Retrieve the checkout session details from Stripe
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = await get_stripe_client().checkout.sessions.retrieve_async(session_id)
 
         # Check if the payment was successful
         if session.payment_status == "paid":
             # Get the cart based on metadata (saved during the Stripe session creation)
             cart_id = session.metadata.get("cart_id")
-            cart = get_object_or_404(Cart, uid=cart_id, user=request.user, is_paid=False)
+            cart = await Cart.objects.select_related('coupon').prefetch_related(
+                cart_items_prefetch()).aget(uid=cart_id, user=user, is_paid=False)
 
             # Mark the cart as paid
             cart.is_paid = True
             cart.stripe_payment_intent_id = session.payment_intent  # Save payment intent for records
-            cart.save()
+            await cart.asave()
 
-            order = create_order(cart)
+            order = await sync_to_async(create_order)(cart)
             # Display a success message
             messages.success(request, "Payment successful! Thank you for your order.")
 
-            return render(request, 'payment_success/payment_success.html', { 'order': order })
+            return await sync_to_async(render)(request, 'payment_success/payment_success.html', { 'order': order })
 
         else:
             messages.error(request, "Payment was not successful. Please try again.")
@@ -449,7 +476,7 @@ def render_to_pdf(template_src, context_dict={}):
 
 def download_invoice(request, order_id):
     order = get_object_or_404(Order, order_id=order_id)
-    order_items = order.order_items.all()
+    order_items = order.order_items.select_related('product', 'size_variant', 'color_variant')
 
     context = {
         'order': order,
@@ -549,17 +576,21 @@ def create_order(cart):
         grand_total=cart.get_cart_total_price_after_coupon(),
     )
 
-    # Create OrderItem instances for each item in the cart
-    cart_items = CartItem.objects.filter(cart=cart)
-    for cart_item in cart_items:
-        OrderItem.objects.get_or_create(
-            order=order,
-            product=cart_item.product,
-            size_variant=cart_item.size_variant,
-            color_variant=cart_item.color_variant,
-            quantity=cart_item.quantity,
-            product_price=cart_item.get_product_price()
-        )
+    # Create OrderItem instances for each item in the cart (only once per order)
+    if created:
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=cart_item.product,
+                size_variant=cart_item.size_variant,
+                color_variant=cart_item.color_variant,
+                quantity=cart_item.quantity,
+                product_price=cart_item.get_product_price()
+            )
+            for cart_item in cart.cart_items.all()
+        ])
+        # The stock held at checkout is now sold
+        commit_reservations([cart])
 
     return order
 
@@ -568,7 +599,7 @@ def create_order(cart):
 @login_required
 def order_details(request, order_id):
     order = get_object_or_404(Order, order_id=order_id, user=request.user)
-    order_items = OrderItem.objects.filter(order=order)
+    order_items = OrderItem.objects.filter(order=order).select_related('product', 'size_variant', 'color_variant')
     context = {
         'order': order,
         'order_items': order_items,
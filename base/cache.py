@@ -0,0 +1,252 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger('ecomm.cache')
+
+_MISSING = object()
+
+# What the shared tier holds for ``set()`` values: the value, when it expires
+# (epoch seconds, None for never) and how long it took to compute, which
+# drives early expiration in ``get_or_set()``.
+Entry = namedtuple('Entry', 'value expires_at delta')
+
+
+class TwoTierCache(BaseCache):
+    """
+    A small per-process LRU in front of a shared cache (Redis, files, or
+    ``LocMemCache`` as a stand-in when there is only one process).
+
+    - Reads try the LRU first. Local copies live at most ``LOCAL_TIMEOUT``
+      seconds, which bounds how stale another process's ``set``/``delete``
+      can leave them.
+    - ``get_or_set()`` computes a missing value once per key: other threads
+      wait for it, and other processes wait on a lock in the shared tier.
+    - As an entry nears expiry, ``get_or_set()`` has a growing chance of
+      recomputing it early (XFetch: the costlier the value, the earlier),
+      so a hot key is refreshed by one request instead of by a stampede
+      of them the moment it expires.
+    - Hits and misses are counted per key prefix (up to the first ``:``);
+      see ``hit_ratios()``. They are logged on ``ecomm.cache`` every
+      ``STATS_LOG_SECONDS``.
+
+    Integers are stored as they are, so ``add()``/``incr()`` counters work.
+    They are never copied locally: every read sees the latest count.
+
+    OPTIONS: ``SHARED`` (a cache config dict), ``LOCAL_MAX_ENTRIES``,
+    ``LOCAL_TIMEOUT``, ``LOCK_TIMEOUT``, ``EARLY_EXPIRATION_BETA`` (0
+    disables it) and ``STATS_LOG_SECONDS``.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        shared = dict(options.get('SHARED', {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}))
+        self.shared = import_string(shared.pop('BACKEND'))(shared.pop('LOCATION', location), shared)
+        self.local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self.beta = options.get('EARLY_EXPIRATION_BETA', 1.0)
+        self.stats_log_seconds = options.get('STATS_LOG_SECONDS', 60)
+
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+        self.inflight = {}
+        self.stats = {}
+        self.stats_logged_at = time.monotonic()
+
+    # Local tier
+
+    def _local_get(self, local_key):
+        with self.lock:
+            item = self.local.get(local_key)
+            if item is None:
+                return _MISSING
+            entry, local_expires_at = item
+            if time.time() >= local_expires_at:
+                del self.local[local_key]
+                return _MISSING
+            self.local.move_to_end(local_key)
+            return entry
+
+    def _local_set(self, local_key, entry):
+        local_expires_at = time.time() + self.local_timeout
+        if isinstance(entry, Entry) and entry.expires_at is not None:
+            local_expires_at = min(local_expires_at, entry.expires_at)
+        with self.lock:
+            self.local[local_key] = (entry, local_expires_at)
+            self.local.move_to_end(local_key)
+            while len(self.local) > self.local_max_entries:
+                self.local.popitem(last=False)
+
+    def _local_delete(self, local_key):
+        with self.lock:
+            self.local.pop(local_key, None)
+
+    # Stats
+
+    def _count(self, key, outcome):
+        prefix = str(key).split(':', 1)[0]
+        with self.lock:
+            self.stats.setdefault(prefix, Counter())[outcome] += 1
+            due = time.monotonic() - self.stats_logged_at >= self.stats_log_seconds
+            if due:
+                self.stats_logged_at = time.monotonic()
+        if due:
+            logger.info(json.dumps({'event': 'cache_hit_ratios', 'prefixes': self.hit_ratios()}))
+
+    def hit_ratios(self):
+        """``{prefix: {local, shared, miss, early, ..., hit_ratio}}`` for this process since it started."""
+        with self.lock:
+            stats = {prefix: dict(counts) for prefix, counts in self.stats.items()}
+        for counts in stats.values():
+            lookups = counts.get('local', 0) + counts.get('shared', 0) + counts.get('miss', 0)
+            counts['hit_ratio'] = round((lookups - counts.get('miss', 0)) / lookups, 3) if lookups else None
+        return stats
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {}
+
+    # Reads and writes
+
+    def _fetch(self, key, version):
+        # The stored entry (or raw counter) from the nearest tier that has it.
+        local_key = self.make_and_validate_key(key, version)
+        entry = self._local_get(local_key)
+        if entry is not _MISSING:
+            self._count(key, 'local')
+            return entry
+        entry = self.shared.get(key, _MISSING, version=version)
+        if entry is _MISSING:
+            self._count(key, 'miss')
+            return _MISSING
+        self._count(key, 'shared')
+        if type(entry) is not int:
+            self._local_set(local_key, entry)
+        return entry
+
+    def get(self, key, default=None, version=None):
+        entry = self._fetch(key, version)
+        if entry is _MISSING:
+            return default
+        return entry.value if isinstance(entry, Entry) else entry
+
+    def _store(self, key, value, timeout, version, delta=0.0):
+        local_key = self.make_and_validate_key(key, version)
+        if type(value) is int:
+            entry = value
+        else:
+            expires_at = self.get_backend_timeout(timeout)
+            entry = Entry(value, expires_at, delta)
+        self.shared.set(key, entry, timeout, version=version)
+        if type(entry) is not int:
+            self._local_set(local_key, entry)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self.make_and_validate_key(key, version))
+        if type(value) is not int:
+            value = Entry(value, self.get_backend_timeout(timeout), 0.0)
+        return self.shared.add(key, value, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version))
+        return self.shared.delete(key, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self.make_and_validate_key(key, version))
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version))
+        return self.shared.decr(key, delta, version=version)
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    # Single-flight and early expiration
+
+    def _expires_early(self, entry):
+        if not isinstance(entry, Entry) or entry.expires_at is None or not self.beta:
+            return False
+        # 1 - random() is in (0, 1], so the log is defined.
+        return time.time() - entry.delta * self.beta * math.log(1 - random.random()) >= entry.expires_at
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        entry = self._fetch(key, version)
+        if entry is not _MISSING and not self._expires_early(entry):
+            return entry.value if isinstance(entry, Entry) else entry
+        if entry is not _MISSING:
+            # Refresh early if nobody else is; everyone else keeps the current value meanwhile.
+            self._count(key, 'early')
+            value = self._compute(key, default, timeout, version, wait=False)
+            return entry.value if value is _MISSING else value
+        return self._compute(key, default, timeout, version, wait=True)
+
+    def _compute(self, key, default, timeout, version, wait):
+        local_key = self.make_and_validate_key(key, version)
+        lock_key = f'singleflight:{local_key}'
+        with self.lock:
+            event = self.inflight.get(local_key)
+            leader = event is None
+            if leader:
+                event = self.inflight[local_key] = threading.Event()
+        if not leader:
+            if not wait:
+                return _MISSING
+            self._count(key, 'coalesced')
+            event.wait(self.lock_timeout)
+            value = self.get(key, _MISSING, version=version)
+            if value is not _MISSING:
+                return value
+            # The leader failed or timed out: compute it ourselves.
+            event = None
+
+        try:
+            # Other processes: whoever adds the lock computes, the rest poll for its result.
+            locked = self.shared.add(lock_key, 1, self.lock_timeout)
+            if not locked:
+                if not wait:
+                    return _MISSING
+                self._count(key, 'coalesced')
+                deadline = time.monotonic() + self.lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    found = self.shared.get(key, _MISSING, version=version)
+                    if found is not _MISSING:
+                        self._local_set(local_key, found)
+                        return found.value if isinstance(found, Entry) else found
+            try:
+                started = time.perf_counter()
+                value = default() if callable(default) else default
+                if value is not None:
+                    self._store(key, value, timeout, version, delta=time.perf_counter() - started)
+                return value
+            finally:
+                if locked:
+                    self.shared.delete(lock_key)
+        finally:
+            if event is not None:
+                with self.lock:
+                    self.inflight.pop(local_key, None)
+                event.set()
@@ -0,0 +1,156 @@
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Without Brotli every client that accepts gzip gets gzip.
+    brotli = None
+
+
+# Formats that are already compressed (images, fonts, PDFs, archives) gain nothing from another pass.
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(text/|application/(json|javascript|xml|xhtml\+xml|manifest\+json)|image/svg\+xml)'
+)
+
+_CODING = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+def accepted_codings(accept_encoding):
+    """The content codings an ``Accept-Encoding`` header allows, ``q=0`` ones left out."""
+    codings = set()
+    for item in accept_encoding.lower().split(','):
+        match = _CODING.match(item)
+        if match:
+            try:
+                quality = float(match[2]) if match[2] else 1.0
+            except ValueError:
+                continue
+            if quality > 0:
+                codings.add(match[1])
+    return codings
+
+
+def choose_coding(accept_encoding):
+    """``'br'``, ``'gzip'`` or ``None``: Brotli when the client takes it, being smaller for the same CPU."""
+    codings = accepted_codings(accept_encoding)
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        if coding in codings or '*' in codings:
+            return coding
+    return None
+
+
+class Compressor:
+    """One response's worth of Brotli or gzip at the configured level."""
+
+    def __init__(self, coding, options):
+        if coding == 'br':
+            self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=options['BROTLI_QUALITY'])
+            self.compress, self._flush, self._finish = (
+                self._compressor.process, self._compressor.flush, self._compressor.finish,
+            )
+        else:
+            # wbits=31 writes a gzip header and trailer around the deflate stream.
+            self._compressor = zlib.compressobj(options['GZIP_LEVEL'], zlib.DEFLATED, 31)
+            self.compress = self._compressor.compress
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+
+    def flush(self, chunk):
+        """Compress ``chunk`` and everything buffered so far, so the client can read it now."""
+        return self.compress(chunk) + self._flush()
+
+    def finish(self, content=b''):
+        return self.compress(content) + self._finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress text responses (HTML, JSON, JavaScript, CSS, SVG) with Brotli or
+    gzip, whichever the client accepts, Brotli first.
+
+    Bodies under ``COMPRESSION['MIN_SIZE']`` bytes, ones that already have a
+    ``Content-Encoding`` and other content types are sent as they are, as is
+    a compressed body that came out no smaller. Streaming responses are
+    compressed chunk by chunk, each flushed as the view yields it, so they
+    still arrive progressively. ``BROTLI_QUALITY`` (0-11) and ``GZIP_LEVEL``
+    (1-9) trade CPU for bytes; `manage.py bench_compression` measures both on
+    the real pages.
+
+    ETags are weakened, as Django's ``GZipMiddleware`` does, since the bytes
+    now depend on the coding. CSRF tokens are masked afresh in every
+    response, which keeps BREACH from recovering them through the
+    compressed length.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.options = settings.COMPRESSION
+        if not self.options['ENABLED']:
+            raise MiddlewareNotUsed
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code in (204, 206, 304):
+            return response
+        if not COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')):
+            return response
+        if not response.streaming and len(response.content) < self.options['MIN_SIZE']:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = choose_coding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if coding is None:
+            return response
+
+        compressor = Compressor(coding, self.options)
+        if response.streaming:
+            response.streaming_content = (
+                self._compress_async(response.streaming_content, compressor) if response.is_async
+                else self._compress_stream(response.streaming_content, compressor)
+            )
+            del response.headers['Content-Length']
+        else:
+            compressed = compressor.finish(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = coding
+        return response
+
+    @staticmethod
+    def _compress_stream(chunks, compressor):
+        for chunk in chunks:
+            if chunk:
+                yield compressor.flush(chunk)
+        yield compressor.finish()
+
+    @staticmethod
+    async def _compress_async(chunks, compressor):
+        async for chunk in chunks:
+            if chunk:
+                yield compressor.flush(chunk)
+        yield compressor.finish()
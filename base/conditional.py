@@ -0,0 +1,117 @@
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.conf import settings
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.cache import cc_delim_re, get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def _etag(parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def public_page(validators):
+    """
+    Serve GET/HEAD requests for a page as one public response that browsers
+    and CDNs may share between visitors, answered with ``304 Not Modified``
+    when their copy is still current, without running the view.
+
+    ``validators(request, *args, **kwargs)`` returns ``(parts, last_modified)``
+    from data that is cheap to read (version numbers, a timestamp), or
+    ``None`` for a page that must stay private. ``parts`` is hashed into the
+    ETag; ``last_modified`` is an aware datetime or ``None``.
+
+    The view runs with ``request.public_page`` set and must not read the
+    session or the user: the templates leave the navbar's user, cart and
+    wishlist, messages and CSRF tokens out, and fill them in after load from
+    the ``viewer`` endpoint. ``s-maxage`` lets a shared cache keep the page
+    for ``EDGE_CACHE_SECONDS``; browsers revalidate on every visit.
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            found = validators(request, *args, **kwargs)
+            if found is None:
+                response = view_func(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+                return response
+
+            parts, last_modified = found
+            etag = _etag(parts)
+            last_modified = timegm(last_modified.utctimetuple()) if last_modified else None
+            request.public_page = True
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if response.cookies or _session_accessed(request):
+                    # Something on the page was per-visitor after all; never share it.
+                    patch_cache_control(response, private=True)
+                    return response
+            response.headers.setdefault('ETag', etag)
+            if last_modified is not None:
+                response.headers.setdefault('Last-Modified', http_date(last_modified))
+            patch_cache_control(response, public=True, max_age=0, s_maxage=settings.EDGE_CACHE_SECONDS)
+            return response
+
+        return _wrapped_view
+
+    return decorator
+
+
+def _session_accessed(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.accessed
+
+
+class PublicPageMiddleware:
+    """
+    Keep the pages ``public_page`` serves shareable once the session has had
+    its say. Goes just before ``SessionMiddleware``.
+
+    allauth's ``AccountMiddleware`` clears a login left half-way (one waiting
+    on an emailed code, say) on the next page the visitor opens, and reads
+    the session to find it; ``SessionMiddleware`` then adds ``Vary: Cookie``.
+    The view itself didn't read the session (``public_page`` checks), so that
+    ``Vary`` is dropped again here. When the cleanup did change the session,
+    the response carries the new session cookie and is sent ``private``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.share(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.share(request, await self.get_response(request))
+
+    def share(self, request, response):
+        if not getattr(request, 'public_page', False):
+            return response
+        if 'public' not in cc_delim_re.split(response.get('Cache-Control', '')):
+            return response
+        if response.cookies:
+            patch_cache_control(response, private=True)
+            return response
+        if response.has_header('Vary'):
+            vary = [field for field in cc_delim_re.split(response['Vary']) if field.lower() != 'cookie']
+            if vary:
+                response.headers['Vary'] = ', '.join(vary)
+            else:
+                del response.headers['Vary']
+        return response
@@ -0,0 +1,19 @@
+from functools import wraps
+
+from django.contrib.auth.views import redirect_to_login
+
+
+def async_login_required(view_func):
+    """``login_required`` for ``async def`` views (Django 5.0's only wraps sync views)."""
+
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        user = await request.auser()
+        # Templates and context processors read request.user, which caches
+        # separately from auser(); hand them the user we already loaded.
+        request.user = user
+        if user.is_authenticated:
+            return await view_func(request, *args, **kwargs)
+        return redirect_to_login(request.get_full_path())
+
+    return _wrapped_view
@@ -0,0 +1,185 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+
+logger = logging.getLogger('ecomm.queries')
+
+_current_stats = ContextVar('query_instrumentation_stats', default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*%s\s*,)*\s*%s\s*\)")
+_VALUES_LIST = re.compile(r"(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    Reduce a SQL statement to its shape so the same query issued with
+    different parameters (or a different number of ``IN`` values) counts
+    as one fingerprint.
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    sql = _VALUES_LIST.sub(r'\1', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class RequestStats:
+    """Query and template timings collected for a single sampled request."""
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.query_count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold=1):
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > threshold]
+
+
+def _patch_template_render():
+    # Top-level renders (render(), render_to_string(), TemplateResponse) all go
+    # through the backend Template; includes are rendered inside that call.
+    if getattr(DjangoTemplate.render, '_instrumented', False):
+        return
+
+    original_render = DjangoTemplate.render
+
+    def render(self, context=None, request=None):
+        stats = _current_stats.get()
+        if stats is None:
+            return original_render(self, context, request)
+
+        started = time.perf_counter()
+        try:
+            return original_render(self, context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+    render._instrumented = True
+    DjangoTemplate.render = render
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record query count, DB time, duplicate SQL shapes and template render time
+    for a sample of requests.
+
+    Results go out as a ``Server-Timing`` header and one JSON log line per
+    request on the ``ecomm.queries`` logger. Any SQL shape that repeats more
+    than ``QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD`` times is logged as a
+    warning against the view that issued it, which is how N+1 loops show up.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'QUERY_INSTRUMENTATION_SAMPLE_RATE', 0.0)
+        self.duplicate_threshold = getattr(settings, 'QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD', 5)
+        _patch_template_render()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with self.wrap_connections(stats):
+                response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        # Async views run their queries through sync_to_async on the request's
+        # own thread, so the wrappers have to be installed on that thread's
+        # connections rather than the event loop's.
+        stack = await sync_to_async(self.wrap_connections)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current_stats.reset(token)
+        return self.finish(request, response, stats, started)
+
+    def sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def wrap_connections(self, stats):
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        return stack
+
+    def finish(self, request, response, stats, started):
+        total_time = time.perf_counter() - started
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries"',
+            f'tpl;dur={stats.template_time * 1000:.1f}',
+            f'total;dur={total_time * 1000:.1f}',
+        ])
+        self.log(request, response, stats, total_time)
+        return response
+
+    def log(self, request, response, stats, total_time):
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        duplicates = stats.duplicates()
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'queries': stats.query_count,
+            'db_ms': round(stats.db_time * 1000, 1),
+            'template_ms': round(stats.template_time * 1000, 1),
+            'total_ms': round(total_time * 1000, 1),
+            'duplicate_queries': sum(count - 1 for _, count in duplicates),
+        }))
+
+        for sql, count in duplicates:
+            if count > self.duplicate_threshold:
+                logger.warning(json.dumps({
+                    'event': 'repeated_query',
+                    'view': view_name,
+                    'path': request.path,
+                    'count': count,
+                    'sql': sql,
+                }))
@@ -1,11 +1,82 @@
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+import os
+import threading
+import time
 import uuid
 
+from base.query_cache import CachingManager
+
+
+_uuid7_lock = threading.Lock()
+_uuid7_last = [0, 0]  # [unix_ts_ms, rand_a counter]
+
+
+def uuid7():
+    """
+    Time-ordered UUID (RFC 9562, version 7).
+
+    The first 48 bits are the Unix time in milliseconds, so new keys land at
+    the right-hand edge of the primary key B-tree instead of at a random
+    page. Keys generated within the same millisecond use the 12-bit
+    ``rand_a`` field as a counter so they stay monotonic within a process.
+    """
+    with _uuid7_lock:
+        now_ms = time.time_ns() // 1_000_000
+        last_ms, counter = _uuid7_last
+
+        if now_ms > last_ms:
+            counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            # Same millisecond (or the clock stepped back): keep ordering
+            # by bumping the counter, borrowing the next millisecond on overflow.
+            now_ms = last_ms
+            counter += 1
+            if counter > 0xFFF:
+                now_ms += 1
+                counter = 0
+
+        _uuid7_last[0], _uuid7_last[1] = now_ms, counter
+
+    rand_b = int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    value = (now_ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0b10 << 62
+    value |= rand_b
+    return uuid.UUID(int=value)
+
 
 class BaseModel(models.Model):
-    uid = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
-    created_at = models.DateTimeField(auto_now=True)
-    updated_at = models.DateTimeField(auto_now_add=True)
+    uid = models.UUIDField(primary_key=True, editable=False, default=uuid7)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Reads cache only for the models settings.QUERY_CACHE allows.
+    objects = CachingManager()
 
     class Meta:
         abstract = True
+
+
+# A plain unique constraint treats NULLs as distinct, and NULLS NOT DISTINCT
+# needs PostgreSQL 15, so an optional foreign key in a unique key is compared
+# through COALESCE with this all-zero UUID, which no row uses as its key.
+NO_KEY = uuid.UUID(int=0)
+
+
+def coalesce_key(field):
+    """``field`` (a nullable foreign key to a BaseModel) with NULL as ``NO_KEY``, for unique constraints."""
+    return Coalesce(field, Value(NO_KEY, output_field=models.UUIDField()))
+
+
+def coalesce_key_sql(model, field, connection):
+    """
+    ``coalesce_key(field)`` as SQL for an ``ON CONFLICT`` target. SQLite only
+    matches it to the constraint's index with the UUID written out literally.
+    """
+    column = connection.ops.quote_name(model._meta.get_field(field).column)
+    # Quoted the way the schema editor wrote it into the index; no DDL runs.
+    no_key = connection.schema_editor().quote_value(models.UUIDField().get_db_prep_value(NO_KEY, connection))
+    return f'COALESCE({column}, {no_key})'
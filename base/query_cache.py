@@ -0,0 +1,159 @@
+import hashlib
+import pickle
+import re
+import time
+from functools import lru_cache, partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.signals import setting_changed
+from django.db import connections, models, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.query import FlatValuesListIterable, ModelIterable, ValuesIterable, ValuesListIterable
+
+
+# Tables a SELECT reads, and the table a write statement changes. Both
+# backends Django supports here quote table names with double quotes.
+READ_TABLES = re.compile(r'\b(?:FROM|JOIN)\s+"([^"]+)"', re.IGNORECASE)
+WRITE_TABLE = re.compile(r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|UPDATE|DELETE\s+FROM|REPLACE\s+INTO)\s+"([^"]+)"', re.IGNORECASE)
+TRUNCATE = re.compile(r'^\s*TRUNCATE\b', re.IGNORECASE)
+QUOTED = re.compile(r'"([^"]+)"')
+
+# Result shapes that pickle: not ``values_list(named=True)``, whose row class is made per query.
+CACHEABLE_ITERABLES = (ModelIterable, ValuesIterable, ValuesListIterable, FlatValuesListIterable)
+
+
+def _table_key(table):
+    return f'qc_table:{table}'
+
+
+@lru_cache(maxsize=None)
+def _cacheable_tables():
+    """The tables of allowed models (and of their automatic many-to-many tables), minus denied ones."""
+    options = settings.QUERY_CACHE
+    allow, deny = set(options.get('ALLOW', ())), set(options.get('DENY', ()))
+    tables = set()
+    for model in apps.get_models(include_auto_created=True):
+        label = model._meta.label
+        if model._meta.auto_created:
+            # A many-to-many table is allowed along with the model it points at.
+            label = next(
+                (f.related_model._meta.label for f in model._meta.fields if f.remote_field and f.related_model is not model._meta.auto_created),
+                label,
+            )
+        if label in allow and label not in deny and model._meta.label not in deny:
+            tables.add(model._meta.db_table)
+    return frozenset(tables)
+
+
+def _reset(setting, **kwargs):
+    if setting == 'QUERY_CACHE':
+        _cacheable_tables.cache_clear()
+
+
+setting_changed.connect(_reset)
+
+
+def table_versions(tables):
+    """The current version of each of ``tables``, starting any that aren't in the cache yet."""
+    keys = {_table_key(table): table for table in tables}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        # Seeded from the clock, so a version lost to eviction never comes
+        # back at a number that older entries were stored under.
+        cache.add(key, time.time_ns(), None)
+        found[key] = cache.get(key)
+    return tuple(sorted((keys[key], version) for key, version in found.items()))
+
+
+def bump_table(table):
+    """Invalidate every cached query that reads ``table``."""
+    try:
+        cache.incr(_table_key(table))
+    except ValueError:
+        # Nothing cached against it yet; start it fresh.
+        cache.add(_table_key(table), time.time_ns(), None)
+
+
+def _written_tables(sql):
+    if TRUNCATE.match(sql):
+        return QUOTED.findall(sql)
+    match = WRITE_TABLE.match(sql)
+    return [match.group(1)] if match else []
+
+
+def invalidate_on_write(execute, sql, params, many, context):
+    """
+    A database ``execute_wrapper``: after any INSERT, UPDATE, DELETE or
+    TRUNCATE, bump the version of the table it wrote to. This catches
+    ``save()``, ``bulk_create()``, ``QuerySet.update()/delete()`` and raw
+    SQL alike. Inside a transaction the bump waits for the commit, so
+    nobody re-caches the old rows under the new version in between.
+    """
+    result = execute(sql, params, many, context)
+    tables = _written_tables(sql) if isinstance(sql, str) else []
+    if tables:
+        connection = context['connection']
+        for table in tables:
+            transaction.on_commit(partial(bump_table, table), using=connection.alias)
+    return result
+
+
+def _install(sender, connection, **kwargs):
+    if invalidate_on_write not in connection.execute_wrappers:
+        connection.execute_wrappers.append(invalidate_on_write)
+
+
+connection_created.connect(_install)
+
+
+class CachingQuerySet(models.QuerySet):
+    """
+    Caches the results of reads whose tables are all allowed by
+    ``settings.QUERY_CACHE``, keyed on the SQL, its parameters and the
+    version of every table it reads (see ``invalidate_on_write``).
+
+    Reads bypass the cache inside a transaction (a transaction sees its own
+    uncommitted writes, which mustn't be shared), and so does anything
+    locking rows or prefetching related objects.
+    """
+
+    def _fetch_all(self):
+        if self._result_cache is None and settings.QUERY_CACHE['ENABLED']:
+            key = self._query_cache_key()
+            if key is not None:
+                cached = cache.get(key)
+                if cached is None:
+                    super()._fetch_all()
+                    cache.set(key, pickle.dumps(self._result_cache, pickle.HIGHEST_PROTOCOL), settings.QUERY_CACHE['TIMEOUT'])
+                else:
+                    self._result_cache = pickle.loads(cached)
+                return
+        super()._fetch_all()
+
+    def _query_cache_key(self):
+        if (
+            self.query.select_for_update
+            or self._prefetch_related_lookups
+            or self._iterable_class not in CACHEABLE_ITERABLES
+            or connections[self.db].in_atomic_block
+        ):
+            return None
+        allowed = _cacheable_tables()
+        if self.model._meta.db_table not in allowed:
+            return None
+        try:
+            sql, params = self.query.sql_with_params()
+        except EmptyResultSet:
+            return None
+        tables = set(READ_TABLES.findall(sql))
+        if not tables or not tables <= allowed:
+            return None
+        digest = hashlib.sha1(repr((self.db, sql, params, table_versions(tables))).encode()).hexdigest()
+        return f'qc:{digest}'
+
+
+class CachingManager(models.Manager.from_queryset(CachingQuerySet)):
+    pass
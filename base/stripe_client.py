@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict, deque
+
+import httpx
+import stripe
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+logger = logging.getLogger('ecomm.stripe')
+
+# Object ids in request paths (cs_test_..., pi_...) so metrics group by endpoint.
+_OBJECT_ID = re.compile(r'/[a-z]+_(?:test_|live_)?[A-Za-z0-9]{8,}')
+
+
+class StripeUnavailable(stripe.error.StripeError):
+    """Raised without contacting Stripe while the circuit breaker is open."""
+
+    def __init__(self):
+        super().__init__("Payments are temporarily unavailable. Please try again in a few minutes.")
+
+
+class CircuitBreaker:
+    """
+    Stop calling Stripe after ``failure_threshold`` consecutive failed calls.
+
+    While open, calls are rejected immediately. After ``reset_timeout``
+    seconds a single trial call is let through: if it succeeds the circuit
+    closes, otherwise it opens again for another ``reset_timeout``.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info("Stripe circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Stripe circuit opened after %d failed calls", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Give back a trial call that ended without a verdict, so the next call can try instead."""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+
+class StripeMetrics:
+    """Per-endpoint call counts, error counts and recent latencies for this process."""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.rejected = 0
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, operation, elapsed, ok):
+        with self.lock:
+            self.calls[operation] += 1
+            self.latencies[operation].append(elapsed)
+            if not ok:
+                self.errors[operation] += 1
+
+    def record_rejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        with self.lock:
+            operations = {}
+            for operation, count in self.calls.items():
+                values = sorted(self.latencies[operation])
+                operations[operation] = {
+                    'calls': count,
+                    'errors': self.errors[operation],
+                    'p50_ms': round(values[len(values) // 2] * 1000, 1),
+                    'p95_ms': round(values[int(len(values) * 0.95)] * 1000, 1),
+                    'max_ms': round(values[-1] * 1000, 1),
+                }
+            return {'rejected': self.rejected, 'operations': operations}
+
+
+class ResilientHTTPXClient(stripe.HTTPXClient):
+    """
+    Stripe's httpx client with a keep-alive connection pool, guarded by the
+    circuit breaker and timed into the metrics.
+
+    Each logical API call (including the library's own bounded retries)
+    counts once: a connection error, timeout or 5xx after the last retry is
+    a failure. A call cancelled or interrupted on our side counts for neither.
+    """
+
+    def __init__(self, gateway, timeout, limits, allow_sync_methods=False):
+        super().__init__(timeout=timeout, allow_sync_methods=allow_sync_methods)
+        self.gateway = gateway
+        # HTTPXClient doesn't pass pool settings through, so close the clients it built and rebuild them.
+        self.close()
+        _close_unused(self._client_async)
+        verify = stripe.ca_bundle_path if self._verify_ssl_certs else False
+        self._client_async = httpx.AsyncClient(verify=verify, limits=limits)
+        if allow_sync_methods:
+            self._client = httpx.Client(verify=verify, limits=limits)
+
+    def request_with_retries(self, method, url, headers, post_data=None, max_network_retries=None, *, _usage=None):
+        started = self.before_call()
+        try:
+            response = super().request_with_retries(
+                method, url, headers, post_data, max_network_retries, _usage=_usage)
+        except Exception:
+            self.after_call(method, url, started, ok=False)
+            raise
+        except BaseException:
+            # Interrupted, not failed: say nothing about Stripe, but don't hold the trial call.
+            self.gateway.breaker.release_trial()
+            raise
+        self.after_call(method, url, started, ok=response[1] < 500)
+        return response
+
+    async def request_with_retries_async(self, method, url, headers, post_data=None, max_network_retries=None, *, _usage=None):
+        started = self.before_call()
+        try:
+            response = await super().request_with_retries_async(
+                method, url, headers, post_data, max_network_retries, _usage=_usage)
+        except Exception:
+            self.after_call(method, url, started, ok=False)
+            raise
+        except BaseException:
+            # A shopper who closes the browser cancels the view; Stripe is no less healthy for it.
+            self.gateway.breaker.release_trial()
+            raise
+        self.after_call(method, url, started, ok=response[1] < 500)
+        return response
+
+    def before_call(self):
+        if not self.gateway.breaker.allow():
+            self.gateway.metrics.record_rejected()
+            raise StripeUnavailable()
+        return time.perf_counter()
+
+    def after_call(self, method, url, started, ok):
+        elapsed = time.perf_counter() - started
+        operation = f"{method.upper()} {_OBJECT_ID.sub('/{id}', httpx.URL(url).path)}"
+        self.gateway.metrics.record(operation, elapsed, ok)
+        if ok:
+            self.gateway.breaker.record_success()
+        else:
+            logger.warning("Stripe call failed: %s after %.0fms", operation, elapsed * 1000)
+            self.gateway.breaker.record_failure()
+
+
+_closing = set()
+
+
+def _close_unused(client):
+    """Close an ``httpx.AsyncClient`` that never sent a request, from sync code."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        asyncio.run(client.aclose())
+        return
+    task = loop.create_task(client.aclose())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+class StripeGateway:
+    """
+    Process-wide Stripe settings, circuit breaker and metrics.
+
+    httpx connection pools belong to the event loop that opened them, so
+    async callers get one client per loop (one per worker under ASGI; async
+    views served by WSGI get a fresh loop per request). Sync callers such
+    as management commands share a single thread-safe client.
+    """
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.STRIPE_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.STRIPE_CIRCUIT_RESET_TIMEOUT,
+        )
+        self.metrics = StripeMetrics()
+        self.lock = threading.Lock()
+        self.async_clients = weakref.WeakKeyDictionary()
+        self.sync_client = None
+
+    def build_client(self, allow_sync_methods):
+        http_client = ResilientHTTPXClient(
+            self,
+            timeout=httpx.Timeout(settings.STRIPE_TIMEOUT, connect=settings.STRIPE_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.STRIPE_POOL_SIZE,
+                max_keepalive_connections=settings.STRIPE_POOL_SIZE,
+            ),
+            allow_sync_methods=allow_sync_methods,
+        )
+        return stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            base_addresses={'api': settings.STRIPE_API_BASE},
+            max_network_retries=settings.STRIPE_MAX_RETRIES,
+            http_client=http_client,
+        )
+
+    def client(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        with self.lock:
+            if loop is None:
+                if self.sync_client is None:
+                    self.sync_client = self.build_client(allow_sync_methods=True)
+                return self.sync_client
+            client = self.async_clients.get(loop)
+            if client is None:
+                client = self.async_clients[loop] = self.build_client(allow_sync_methods=False)
+            return client
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = StripeGateway()
+        return _gateway
+
+
+def get_stripe_client():
+    """Return the shared Stripe client for the current thread or event loop."""
+    return get_gateway().client()
+
+
+def stripe_metrics():
+    gateway = get_gateway()
+    return {'circuit': gateway.breaker.state, **gateway.metrics.snapshot()}
+
+
+@receiver(setting_changed)
+def _reset_gateway(setting, **kwargs):
+    global _gateway
+    if setting.startswith('STRIPE_'):
+        with _gateway_lock:
+            _gateway = None
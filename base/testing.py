@@ -0,0 +1,224 @@
+import json
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from accounts.models import Cart, Order
+from accounts.stripe_stub import StripeStubServer
+from home.seeding import seed
+from products.flash_sale import active_sales
+from products.models import Product, Wishlist
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Django's runner with query instrumentation off, so sampled requests
+    don't print log lines at random through the run; tests of the
+    middleware turn it back on.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._instrumentation_off = override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=0.0)
+        self._instrumentation_off.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._instrumentation_off.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+# Rows per relation (cart items, wishlist items, reviews per product, orders
+# and order lines; three times as many products) at each scale. A view whose
+# query count differs between the two has an N+1 somewhere.
+SMALL_SCALE = 5
+LARGE_SCALE = 25
+
+
+class ViewBudget:
+    def __init__(self, app, url_name, max_queries, method='get', login=True, label=None,
+                 args=None, query=None, data=None, content_type=None):
+        self.app = app
+        self.url_name = url_name
+        self.max_queries = max_queries
+        self.method = method
+        self.login = login
+        self.label = label or url_name
+        self.args = args
+        self.query = query
+        self.data = data
+        self.content_type = content_type
+
+
+# One row per view: the most queries it may run for a logged-in shopper
+# (navbar included), whatever the size of the catalog, cart or order history.
+QUERY_BUDGETS = [
+    # home.views
+    # Catalog and product pages are public: no user, cart or wishlist queries. A visitor with a
+    # session cookie costs one read of it, allauth looking for a login they left half-way.
+    ViewBudget('home', 'index', 4),
+    ViewBudget('home', 'index', 4, label='index (filtered)',
+               query=lambda fx: {'category': fx['product'].category.category_name, 'sort': 'priceAsc'}),
+    # Every seeded product name contains a space, so this matches the whole catalog.
+    ViewBudget('home', 'product_search', 2, query=lambda fx: {'q': ' '}),
+    ViewBudget('home', 'contact', 5),
+    ViewBudget('home', 'about', 5),
+    ViewBudget('home', 'terms-and-conditions', 5),
+    ViewBudget('home', 'privacy-policy', 5),
+
+    # products.views
+    # load_product_page(): five queries, plus two each for the price matrix and the related
+    # products' key range when they aren't cached, one for the ETag (the listing's refresh
+    # time) and allauth's read of the session.
+    ViewBudget('products', 'get_product', 11, args=lambda fx: [fx['product'].slug]),
+    ViewBudget('products', 'get_product', 11, label='get_product (size)',
+               args=lambda fx: [fx['product'].slug], query=lambda fx: {'size': 'M'}),
+    # A sort the product page hasn't cached, so the keyset query runs.
+    ViewBudget('products', 'product_reviews', 1, login=False,
+               args=lambda fx: [fx['product'].uid], query=lambda fx: {'sort': 'lowest', 'format': 'html'}),
+    ViewBudget('products', 'wishlist', 7),
+    ViewBudget('products', 'add_to_wishlist', 8, method='post',
+               args=lambda fx: [fx['product'].uid], query=lambda fx: {'size': 'M'}),
+    ViewBudget('products', 'remove_from_wishlist', 5, method='post',
+               args=lambda fx: [fx['wishlist'].product_id], query=lambda fx: {'size': fx['wishlist'].size_variant.size_name}),
+    # add_cart_item() is a single upsert on every backend.
+    ViewBudget('products', 'move_to_cart', 8, method='post', args=lambda fx: [fx['wishlist'].product_id]),
+
+    # accounts.views
+    ViewBudget('accounts', 'login', 0, login=False),
+    ViewBudget('accounts', 'register', 0, login=False),
+    ViewBudget('accounts', 'profile', 6, args=lambda fx: [fx['user'].username]),
+    ViewBudget('accounts', 'change_password', 5),
+    ViewBudget('accounts', 'shipping-address', 6),
+    ViewBudget('accounts', 'cart', 9),
+    ViewBudget('accounts', 'add_to_cart', 6, query=lambda fx: {'size': 'M'}, args=lambda fx: [fx['product'].uid]),
+    # Guests' carts live in a signed cookie: no writes, just the product and size lookups.
+    ViewBudget('accounts', 'add_to_cart', 2, login=False, label='add_to_cart (guest)',
+               query=lambda fx: {'size': 'M'}, args=lambda fx: [fx['product'].uid]),
+    ViewBudget('accounts', 'update_cart_item', 4, method='post', content_type='application/json',
+               data=lambda fx: json.dumps({'cart_item_id': str(fx['cart_item'].uid), 'quantity': 2})),
+    ViewBudget('accounts', 'cart_sync', 11, method='post', content_type='application/json',
+               data=lambda fx: json.dumps({'operations': [
+                   {'op': 'add', 'product': str(fx['product'].uid), 'size': 'M', 'quantity': 2},
+                   {'op': 'update', 'cart_item_id': str(fx['cart_items'][0].uid), 'quantity': 3},
+                   {'op': 'remove', 'cart_item_id': str(fx['cart_items'][1].uid)},
+               ]})),
+    # The navbar of a public page: session, user, profile, cart count and wishlist count.
+    ViewBudget('accounts', 'viewer', 5),
+    ViewBudget('accounts', 'remove_cart', 2, args=lambda fx: [fx['cart_item'].uid]),
+    ViewBudget('accounts', 'remove_coupon', 3, args=lambda fx: [fx['cart'].uid]),
+    ViewBudget('accounts', 'order_history', 6),
+    ViewBudget('accounts', 'order_details', 9, args=lambda fx: [fx['order'].order_id]),
+    ViewBudget('accounts', 'download_invoice', 3, args=lambda fx: [fx['order'].order_id]),
+    # Checking for stock rows and holds costs two queries even for untracked products.
+    ViewBudget('accounts', 'create_checkout_session', 7, method='post'),
+    ViewBudget('accounts', 'payment_success', 17, query=lambda fx: {'session_id': fx['checkout_session']}),
+]
+
+
+class QueryBudgetMixin:
+    """
+    Render every budgeted view of ``app`` against seeded data at two scales
+    and fail if a view runs more queries than its budget, or if its query
+    count changes with the amount of data.
+
+    Each view runs in its own rolled-back savepoint, so views that write
+    (checkout, cart edits) leave the fixtures untouched for the next one.
+    Stripe calls go to a local ``StripeStubServer``.
+    """
+
+    app = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe = StripeStubServer(port=0).start()
+        cls.addClassCleanup(cls.stripe.stop)
+
+    def budgets(self):
+        return [budget for budget in QUERY_BUDGETS if budget.app == self.app]
+
+    def test_query_counts_stay_within_budget(self):
+        budgets = self.budgets()
+        with self.settings(STRIPE_API_BASE=self.stripe.url):
+            small = self.measure(SMALL_SCALE, budgets)
+            large = self.measure(LARGE_SCALE, budgets)
+
+        for budget in budgets:
+            with self.subTest(view=budget.label):
+                self.assertEqual(
+                    small[budget.label], large[budget.label],
+                    f"{budget.label} ran {small[budget.label]} queries with {SMALL_SCALE} rows per relation "
+                    f"but {large[budget.label]} with {LARGE_SCALE}",
+                )
+                self.assertLessEqual(
+                    large[budget.label], budget.max_queries,
+                    f"{budget.label} ran {large[budget.label]} queries (budget {budget.max_queries})",
+                )
+
+    def measure(self, scale, budgets):
+        with transaction.atomic():
+            fixtures = self.seed_fixtures(scale)
+            # Process-wide caches refill once every few seconds, not per request.
+            active_sales()
+            counts = {budget.label: self.count_queries(budget, fixtures) for budget in budgets}
+            transaction.set_rollback(True)
+        return counts
+
+    def seed_fixtures(self, scale):
+        tag = f'budget{scale}'
+        seed(
+            categories=1, products=scale * 3, images_per_product=2, users=scale,
+            carts=1, cart_items=scale, wishlist_items=scale,
+            orders=scale, order_items=scale, reviews=scale * scale * 3,
+            chunk_size=500, tag=tag,
+        )
+        user = User.objects.get(username=f'{tag}-user-0')
+        Order.objects.update(user=user)
+        cart = Cart.objects.get(user=user, is_paid=False)
+        session = self.stripe.create_checkout_session({'metadata': {'cart_id': str(cart.uid)}})
+
+        # Products the shopper has neither in the cart nor on the wishlist, so
+        # add/move views always take the same "new row" branch.
+        free_products = list(
+            Product.objects.select_related('category')
+            .exclude(cartitem__cart=cart).exclude(wishlisted_by__user=user).order_by('pk')[:2]
+        )
+        wishlist = Wishlist.objects.create(
+            user=user, product=free_products[1], size_variant=cart.cart_items.first().size_variant)
+        return {
+            'user': user,
+            'product': free_products[0],
+            'cart': cart,
+            'cart_item': cart.cart_items.first(),
+            'cart_items': list(cart.cart_items.order_by('pk')[:2]),
+            'wishlist': wishlist,
+            'order': Order.objects.filter(user=user).first(),
+            'checkout_session': session['id'],
+        }
+
+    def count_queries(self, budget, fixtures):
+        client = Client()
+        if budget.login:
+            client.force_login(fixtures['user'])
+
+        url = reverse(budget.url_name, args=budget.args(fixtures) if budget.args else None)
+        if budget.query:
+            url += '?' + urlencode(budget.query(fixtures))
+        kwargs = {'HTTP_REFERER': '/'}
+        if budget.data:
+            kwargs['data'] = budget.data(fixtures)
+        if budget.content_type:
+            kwargs['content_type'] = budget.content_type
+
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, budget.method)(url, **kwargs)
+            transaction.set_rollback(True)
+
+        self.assertLess(response.status_code, 400, f"{budget.label} returned {response.status_code}")
+        return len(queries.captured_queries)
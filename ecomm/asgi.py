@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecomm.settings')
 
 application = get_asgi_application()
+
+# Drop this worker's cached coupons, flash sales and catalog when another
+# process changes them. With gunicorn --preload, call this from post_fork instead.
+from products.invalidation import bus  # noqa: E402
+from products.warming import warm_in_background  # noqa: E402
+
+bus.start()
+# Off unless WARM_CACHES_ON_BOOT is set; see `python manage.py warm_caches`.
+warm_in_background()
@@ -109,11 +109,15 @@ SOCIALACCOUNT_PROVIDERS = {
 }
 
 MIDDLEWARE = [
+    'base.middleware.QueryInstrumentationMiddleware',
+    'base.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'base.conditional.PublicPageMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.guest_cart.GuestCartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware', #added this line
@@ -164,6 +168,27 @@ DATABASES = {
 # }
 
 
+# Two tiers (base/cache.py): a per-process LRU in front of a cache shared by
+# every worker. Point the shared tier at Redis or files in production, e.g.
+# SHARED_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# SHARED_CACHE_LOCATION=redis://127.0.0.1:6379/1. The default, process-local
+# memory, stands in for it in development and tests.
+CACHES = {
+    'default': {
+        'BACKEND': 'base.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': {
+                'BACKEND': config('SHARED_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+                'LOCATION': config('SHARED_CACHE_LOCATION', default='shared'),
+            },
+            'LOCAL_MAX_ENTRIES': config('CACHE_LOCAL_MAX_ENTRIES', default=1000, cast=int),
+            # Longest a worker can serve a value another worker has replaced or deleted.
+            'LOCAL_TIMEOUT': config('CACHE_LOCAL_TIMEOUT', default=5, cast=float),
+        },
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -233,6 +258,90 @@ RAZORPAY_SECRET_KEY = config('RAZORPAY_SECRET_KEY')
 
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
 STRIPE_PUBLIC_KEY = config('STRIPE_PUBLIC_KEY')
+# Point at `python manage.py fake_stripe` (http://127.0.0.1:12111) for local load tests.
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='https://api.stripe.com')
+# Shared Stripe client (base/stripe_client.py): per-call timeouts in seconds,
+# retries on connection errors/5xx, keep-alive pool size, and the circuit
+# breaker that fails checkout fast after repeated Stripe failures.
+STRIPE_TIMEOUT = config('STRIPE_TIMEOUT', default=10, cast=float)
+STRIPE_CONNECT_TIMEOUT = config('STRIPE_CONNECT_TIMEOUT', default=3, cast=float)
+STRIPE_MAX_RETRIES = config('STRIPE_MAX_RETRIES', default=2, cast=int)
+STRIPE_POOL_SIZE = config('STRIPE_POOL_SIZE', default=20, cast=int)
+STRIPE_CIRCUIT_FAILURE_THRESHOLD = config('STRIPE_CIRCUIT_FAILURE_THRESHOLD', default=5, cast=int)
+STRIPE_CIRCUIT_RESET_TIMEOUT = config('STRIPE_CIRCUIT_RESET_TIMEOUT', default=30, cast=float)
+
+# How long checkout holds stock for a cart before release_expired_reservations
+# (or the next checkout of the same SKU) gives it back.
+STOCK_RESERVATION_MINUTES = config('STOCK_RESERVATION_MINUTES', default=30, cast=int)
+
+# How long the list of running flash sales is cached per process. Saving a
+# FlashSale clears it; the ticket counter needs a cache shared by all workers.
+FLASH_SALE_CACHE_SECONDS = config('FLASH_SALE_CACHE_SECONDS', default=30, cast=int)
+
+# How long each process trusts its copy of the active coupons. Redemption caps
+# are always checked against the database.
+COUPON_CACHE_SECONDS = config('COUPON_CACHE_SECONDS', default=60, cast=int)
+
+# Serve the home page and search from an in-process copy of the product
+# listings (products/catalog_snapshot.py) instead of the database. Each worker
+# holds the whole catalog; see `python manage.py catalog_snapshot_report`.
+CATALOG_SNAPSHOT = config('CATALOG_SNAPSHOT', default=False, cast=bool)
+
+# Longest a per-process cache (coupons, flash sales, price matrix version,
+# catalog snapshot) stays stale after another process changes what it holds:
+# the LISTEN timeout on PostgreSQL, the polling interval on SQLite.
+CACHE_INVALIDATION_POLL_SECONDS = config('CACHE_INVALIDATION_POLL_SECONDS', default=1.0, cast=float)
+
+# ORM query-result caching (base/query_cache.py) for models that extend
+# BaseModel. Only queries reading nothing but allowed models (app_label.Model)
+# are cached; any write to a table drops every cached query that reads it.
+QUERY_CACHE = {
+    'ENABLED': config('QUERY_CACHE', default=True, cast=bool),
+    'TIMEOUT': config('QUERY_CACHE_SECONDS', default=300, cast=int),
+    'ALLOW': ['products.Category', 'products.SizeVariant', 'products.ColorVariant', 'products.Coupon'],
+    'DENY': [],
+}
+
+# Have each worker run `manage.py warm_caches` for its hottest products on a
+# background thread as it boots, so the first visitors after a deploy or a
+# cache flush don't pay for the cold paths.
+WARM_CACHES_ON_BOOT = config('WARM_CACHES_ON_BOOT', default=False, cast=bool)
+WARM_CACHES_PRODUCTS = config('WARM_CACHES_PRODUCTS', default=200, cast=int)
+WARM_CACHES_WORKERS = config('WARM_CACHES_WORKERS', default=4, cast=int)
+
+# How long a CDN or shared proxy may serve the home page, search and product
+# pages without asking us again (base/conditional.py). These pages are the
+# same for every visitor; the per-visitor parts load from accounts' `viewer`.
+EDGE_CACHE_SECONDS = config('EDGE_CACHE_SECONDS', default=60, cast=int)
+
+# Brotli/gzip compression of HTML and JSON responses (base/compression.py).
+# Turn it off when a proxy in front already compresses; compare the levels
+# with `python manage.py bench_compression`.
+COMPRESSION = {
+    'ENABLED': config('COMPRESSION', default=True, cast=bool),
+    'MIN_SIZE': config('COMPRESSION_MIN_SIZE', default=512, cast=int),
+    'BROTLI_QUALITY': config('COMPRESSION_BROTLI_QUALITY', default=4, cast=int),
+    'GZIP_LEVEL': config('COMPRESSION_GZIP_LEVEL', default=6, cast=int),
+}
+
+
+# Query instrumentation (Server-Timing headers and N+1 warnings).
+# Keep the sample rate low in production; set it to 1.0 locally to see every request.
+QUERY_INSTRUMENTATION_SAMPLE_RATE = config('QUERY_INSTRUMENTATION_SAMPLE_RATE', default=0.05, cast=float)
+QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD = config('QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD', default=5, cast=int)
+# The test suite runs with sampling off; the middleware's own tests turn it on.
+TEST_RUNNER = 'base.testing.TestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'ecomm': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
 
 
 # Auth Backends Configurations
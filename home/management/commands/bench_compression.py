@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from base.compression import Compressor, brotli
+from products.models import Category, Product
+
+
+LEVELS = [('gzip', 1), ('gzip', 6), ('gzip', 9), ('br', 1), ('br', 4), ('br', 5), ('br', 9), ('br', 11)]
+
+
+class Command(BaseCommand):
+    help = "Compress the real pages and JSON responses with gzip and Brotli at several levels: bytes saved against CPU."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Compressions per page and level, after one warm-up.")
+
+    def handle(self, *args, **options):
+        category = Category.objects.order_by('pk').first()
+        # The most reviewed product, so the reviews JSON is a full page.
+        product = Product.objects.filter(parent=None).annotate(reviews_count=Count('reviews')).order_by(
+            '-reviews_count', 'pk').first()
+        if product is None:
+            raise CommandError("No products to browse; run `manage.py seed_scale` first.")
+        pages = [
+            ('index', reverse('index'), {}),
+            ('index?category', reverse('index'), {'category': category.category_name}),
+            ('search', reverse('product_search'), {'q': product.product_name.split()[0]}),
+            ('product', reverse('get_product', args=[product.slug]), {}),
+            ('reviews.json', reverse('product_reviews', args=[product.uid]), {}),
+            ('viewer.json', reverse('viewer'), {}),
+        ]
+        levels = [(coding, level) for coding, level in LEVELS if coding == 'gzip' or brotli is not None]
+
+        header = f"{'page':<16}{'coding':>8}{'bytes':>9}{'saved':>8}{'ms':>8}{'MB/s':>8}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        client = Client()
+        for label, path, params in pages:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                body = client.get(path, params).content
+            self.stdout.write(f"{label:<16}{'none':>8}{len(body):>9}")
+            for coding, level in levels:
+                size, seconds = self.run(body, coding, level, options['repeat'])
+                self.stdout.write(
+                    f"{'':<16}{f'{coding}-{level}':>8}{size:>9}{1 - size / len(body):>8.0%}"
+                    f"{seconds * 1000:>8.2f}{len(body) / seconds / 1e6:>8.0f}"
+                )
+
+        current = settings.COMPRESSION
+        self.stdout.write(f"Configured: br-{current['BROTLI_QUALITY']}, gzip-{current['GZIP_LEVEL']}")
+
+    def run(self, body, coding, level, repeat):
+        options = {'BROTLI_QUALITY': level, 'GZIP_LEVEL': level}
+        size = len(Compressor(coding, options).finish(body))
+        started = time.perf_counter()
+        for _ in range(repeat):
+            Compressor(coding, options).finish(body)
+        return size, (time.perf_counter() - started) / repeat
@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from home.management.commands.load_harness import percentile
+from products.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = "Time the catalog views with the ORM query cache off and on, and count the queries each runs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per view and mode, after one warm-up.")
+
+    def handle(self, *args, **options):
+        category = Category.objects.order_by('pk').first()
+        product = Product.objects.filter(parent=None).order_by('pk').first()
+        if product is None:
+            raise CommandError("No products to browse; run `manage.py seed_scale` first.")
+        views = [
+            ('index', reverse('index'), {}),
+            ('index?category', reverse('index'), {'category': category.category_name}),
+            ('search', reverse('product_search'), {'q': product.product_name.split()[0]}),
+            ('product', reverse('get_product', args=[product.slug]), {}),
+        ]
+
+        header = f"{'view':<16}{'query cache':>13}{'queries':>9}{'p50 ms':>9}{'p99 ms':>9}{'req/s':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for label, path, params in views:
+            for enabled in (False, True):
+                query_cache = {**settings.QUERY_CACHE, 'ENABLED': enabled}
+                with override_settings(QUERY_CACHE=query_cache, ALLOWED_HOSTS=['*']):
+                    self.report(label, enabled, *self.run(path, params, options['requests']))
+
+    def run(self, path, params, requests):
+        client = Client()
+        cache.clear()
+        client.get(path, params)
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(requests):
+                started = time.perf_counter()
+                client.get(path, params)
+                timings.append(time.perf_counter() - started)
+        return len(queries) / requests, sorted(timings)
+
+    def report(self, label, enabled, queries, timings):
+        self.stdout.write(
+            f"{label:<16}{'on' if enabled else 'off':>13}{queries:>9.1f}"
+            f"{percentile(timings, 50) * 1000:>9.2f}{percentile(timings, 99) * 1000:>9.2f}"
+            f"{len(timings) / sum(timings):>9.0f}"
+        )
@@ -0,0 +1,64 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+
+from base.models import uuid7
+
+
+class Command(BaseCommand):
+    help = "Compare insert throughput and primary key index size for uuid4 vs uuid7 keys."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true', help="Keep the scratch tables after the run.")
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        batch_size = options['batch_size']
+        uid_field = models.UUIDField(primary_key=True)
+        uid_type = uid_field.db_type(connection)
+
+        self.stdout.write(f"Inserting {rows:,} rows per table on {connection.vendor} (batch {batch_size:,})")
+
+        for label, generator in (('uuid4', uuid.uuid4), ('uuid7', uuid7)):
+            table = f'bench_pk_{label}'
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+                cursor.execute(f'CREATE TABLE {table} (uid {uid_type} PRIMARY KEY, payload integer NOT NULL)')
+
+            started = time.perf_counter()
+            inserted = 0
+            while inserted < rows:
+                count = min(batch_size, rows - inserted)
+                params = [(uid_field.get_db_prep_value(generator(), connection), inserted + i) for i in range(count)]
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(f'INSERT INTO {table} (uid, payload) VALUES (%s, %s)', params)
+                inserted += count
+            elapsed = time.perf_counter() - started
+
+            index_size = self.index_size(table)
+            size_label = f"{index_size / 1024 / 1024:,.1f} MiB" if index_size is not None else "n/a"
+            self.stdout.write(f"{label}: {rows / elapsed:,.0f} rows/s ({elapsed:.1f}s), pk index {size_label}")
+
+            if not options['keep']:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE {table}')
+
+    def index_size(self, table):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f"SELECT pg_relation_size('{table}_pkey')")
+                return cursor.fetchone()[0]
+            if connection.vendor == 'sqlite':
+                try:
+                    cursor.execute(
+                        "SELECT SUM(pgsize) FROM dbstat WHERE name = %s",
+                        [f'sqlite_autoindex_{table}_1'],
+                    )
+                except Exception:
+                    return None  # SQLite built without the dbstat virtual table
+                return cursor.fetchone()[0]
+        return None
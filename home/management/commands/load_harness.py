@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from products.models import Category, Product
+
+
+JOURNEYS = ('browse', 'search', 'cart', 'checkout')
+SEARCH_TERMS = ['linen', 'shirt', 'organic', 'dress', 'hemp', 'tee', 'jacket', 'scarf']
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, elapsed, ok):
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+class VirtualUser:
+    """One shopper with its own cookie jar, replaying weighted journeys."""
+
+    def __init__(self, base_url, username, password, catalog, recorder):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.catalog = catalog
+        self.recorder = recorder
+        self.session = requests.Session()
+        self.logged_in = False
+
+    def request(self, endpoint, method, path, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.record(endpoint, time.perf_counter() - started, ok)
+        return response
+
+    def login(self):
+        if self.logged_in:
+            return
+        self.request('login_form', 'GET', '/accounts/login/')
+        token = self.session.cookies.get('csrftoken', '')
+        response = self.request('login', 'POST', '/accounts/login/', data={
+            'csrfmiddlewaretoken': token,
+            'username': self.username,
+            'password': self.password,
+        }, headers={'Referer': self.base_url + '/accounts/login/'})
+        self.logged_in = response is not None and response.status_code == 302 and 'sessionid' in self.session.cookies
+
+    def browse(self):
+        self.request('index', 'GET', '/')
+        self.request('index_page', 'GET', f'/?page={random.randint(2, 5)}')
+        if self.catalog['categories']:
+            category = random.choice(self.catalog['categories'])
+            self.request('index_filtered', 'GET', '/', params={'category': category, 'sort': 'priceAsc'})
+        slug, _ = random.choice(self.catalog['products'])
+        self.request('get_product', 'GET', f'/product/{slug}/')
+
+    def search(self):
+        self.request('product_search', 'GET', '/search/', params={'q': random.choice(SEARCH_TERMS)})
+
+    def cart(self):
+        self.login()
+        slug, uid = random.choice(self.catalog['products'])
+        self.request('get_product', 'GET', f'/product/{slug}/')
+        self.request('add_to_cart', 'GET', f'/accounts/add-to-cart/{uid}/',
+                     params={'size': random.choice(self.catalog['sizes'])})
+        self.request('cart', 'GET', '/accounts/cart/')
+
+    def checkout(self):
+        self.cart()
+        self.request('create_checkout_session', 'POST', '/create-checkout-session/',
+                     headers={'X-CSRFToken': self.session.cookies.get('csrftoken', '')})
+
+
+class Command(BaseCommand):
+    help = "Drive browse, search, cart and checkout journeys over HTTP and report latency percentiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=20, help="Number of simultaneous virtual users.")
+        parser.add_argument('--duration', type=float, default=60, help="Seconds to run.")
+        parser.add_argument('--mix', default='browse=60,search=20,cart=15,checkout=5',
+                            help="Journey weights, e.g. browse=60,search=20,cart=15,checkout=5.")
+        parser.add_argument('--user-prefix', default='seed-user-', help="Usernames created by seed_scale.")
+        parser.add_argument('--users', type=int, default=1000, help="How many seeded users to rotate through.")
+        parser.add_argument('--password', default='loadtest123')
+        parser.add_argument('--sample-products', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        weights = self.parse_mix(options['mix'])
+        catalog = {
+            'products': list(
+                Product.objects.filter(parent=None).order_by('?')
+                .values_list('slug', 'uid')[:options['sample_products']]
+            ),
+            'categories': list(Category.objects.values_list('category_name', flat=True)[:50]),
+            'sizes': ['S', 'M', 'L'],
+        }
+        if not catalog['products']:
+            raise CommandError("No products found; run `manage.py seed_scale` first.")
+
+        recorder = Recorder()
+        deadline = time.monotonic() + options['duration']
+        journeys = list(weights)
+        journey_weights = [weights[name] for name in journeys]
+
+        def run(worker):
+            user = VirtualUser(
+                options['base_url'], f"{options['user_prefix']}{worker % options['users']}",
+                options['password'], catalog, recorder,
+            )
+            while time.monotonic() < deadline:
+                journey = random.choices(journeys, journey_weights)[0]
+                started = time.perf_counter()
+                getattr(user, journey)()
+                recorder.record(f'journey:{journey}', time.perf_counter() - started, True)
+
+        self.stdout.write(
+            f"Running {options['concurrency']} virtual users against {options['base_url']} "
+            f"for {options['duration']:.0f}s"
+        )
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(run, range(options['concurrency'])))
+
+        self.report(recorder, options['duration'])
+
+    def parse_mix(self, mix):
+        weights = {}
+        for part in mix.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in JOURNEYS:
+                raise CommandError(f"Unknown journey '{name}'; choose from {', '.join(JOURNEYS)}.")
+            weights[name] = float(weight or 1)
+        return weights
+
+    def report(self, recorder, duration):
+        header = f"{'endpoint':<28}{'count':>8}{'errors':>8}{'rps':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for endpoint in sorted(recorder.latencies):
+            values = sorted(recorder.latencies[endpoint])
+            self.stdout.write(
+                f"{endpoint:<28}{len(values):>8}{recorder.errors[endpoint]:>8}{len(values) / duration:>8.1f}"
+                f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 90) * 1000:>10.1f}"
+                f"{percentile(values, 99) * 1000:>10.1f}{values[-1] * 1000:>10.1f}"
+            )
@@ -0,0 +1,53 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from home.seeding import seed
+
+
+class Command(BaseCommand):
+    help = "Bulk-insert a synthetic catalog, users, carts, orders and reviews for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--images-per-product', type=int, default=2)
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--carts', type=int, default=5_000)
+        parser.add_argument('--cart-items', type=int, default=3, help="Items per open cart.")
+        parser.add_argument('--wishlist-items', type=int, default=5, help="Wishlist entries per cart owner.")
+        parser.add_argument('--orders', type=int, default=50_000)
+        parser.add_argument('--order-items', type=int, default=3, help="Lines per order.")
+        parser.add_argument('--reviews', type=int, default=1_000_000)
+        parser.add_argument('--chunk-size', type=int, default=5_000)
+        parser.add_argument('--tag', default='seed', help="Prefix for generated names, usernames and slugs.")
+        parser.add_argument('--password', default='loadtest123', help="Password shared by every generated user.")
+
+    def handle(self, *args, **options):
+        tag = options['tag']
+        if User.objects.filter(username__startswith=f'{tag}-user-').exists():
+            raise CommandError(f"Data tagged '{tag}' already exists; pass a different --tag.")
+        if options['categories'] < 1 or options['products'] < 1:
+            raise CommandError("At least one category and one product are required.")
+
+        started = time.perf_counter()
+        counts = seed(
+            categories=options['categories'],
+            products=options['products'],
+            images_per_product=options['images_per_product'],
+            users=options['users'],
+            carts=options['carts'],
+            cart_items=options['cart_items'],
+            wishlist_items=options['wishlist_items'],
+            orders=options['orders'],
+            order_items=options['order_items'],
+            reviews=options['reviews'],
+            chunk_size=options['chunk_size'],
+            tag=tag,
+            password=options['password'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {sum(counts.values()):,} rows in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:42
+
+import base.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shippingaddress',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,207 @@
+import random
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.text import slugify
+
+from accounts.models import Profile, Cart, CartItem, Order, OrderItem
+from products.listing import refresh_listings
+from products.models import Category, ColorVariant, SizeVariant, Product, ProductImage, ProductReview, Wishlist
+
+
+SIZE_NAMES = [('XS', 0), ('S', 0), ('M', 0), ('L', 50), ('XL', 100)]
+COLOR_NAMES = [('Natural', 0), ('Indigo', 50), ('Sage', 50), ('Charcoal', 0), ('Rust', 100)]
+ADJECTIVES = ['Organic', 'Linen', 'Hemp', 'Recycled', 'Bamboo', 'Woven', 'Relaxed', 'Classic']
+NOUNS = ['Shirt', 'Dress', 'Trousers', 'Jacket', 'Tee', 'Skirt', 'Hoodie', 'Scarf']
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _bulk_insert(model, objects, chunk_size):
+    count = 0
+    for chunk in _chunked(objects, chunk_size):
+        with transaction.atomic():
+            model.objects.bulk_create(chunk, batch_size=chunk_size)
+        count += len(chunk)
+    return count
+
+
+def seed(
+    categories=10,
+    products=1000,
+    images_per_product=2,
+    users=100,
+    carts=50,
+    cart_items=3,
+    wishlist_items=0,
+    orders=100,
+    order_items=3,
+    reviews=2000,
+    chunk_size=5000,
+    tag='seed',
+    password='loadtest123',
+    log=None,
+):
+    """
+    Bulk-insert a synthetic catalog, users, open carts, wishlists, orders and reviews.
+
+    Rows are generated lazily and written with ``bulk_create`` in chunks of
+    ``chunk_size``, so memory stays flat even for millions of reviews.
+    Signals and ``save()`` overrides do not run; slugs and profiles are filled
+    in here instead. Users are named ``<tag>-user-<n>`` and share ``password``.
+    Returns the number of rows created per model.
+    """
+    rng = random.Random(tag)
+    counts = {}
+
+    def step(name, model, objects):
+        started = time.perf_counter()
+        counts[name] = _bulk_insert(model, objects, chunk_size)
+        if log:
+            log(f"{name}: {counts[name]:,} rows in {time.perf_counter() - started:.1f}s")
+
+    # Variants are global lookup tables, so reuse any that already exist.
+    size_variants = [
+        SizeVariant.objects.get_or_create(size_name=name, defaults={'price': price, 'order': order})[0]
+        for order, (name, price) in enumerate(SIZE_NAMES)
+    ]
+    color_variants = [
+        ColorVariant.objects.get_or_create(color_name=name, defaults={'price': price})[0]
+        for name, price in COLOR_NAMES
+    ]
+
+    category_objs = [
+        Category(category_name=f'{tag} Category {i}', slug=slugify(f'{tag}-category-{i}'),
+                 category_image='catgories/placeholder.jpg')
+        for i in range(categories)
+    ]
+    step('categories', Category, category_objs)
+
+    product_ids = []
+    product_prices = []
+
+    def product_rows():
+        for i in range(products):
+            name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}'
+            product = Product(
+                product_name=name,
+                slug=slugify(f'{tag}-{name}'),
+                category=category_objs[i % categories],
+                price=rng.randrange(500, 5000, 50),
+                product_desription=f'{name} made from responsibly sourced fibres.',
+                newest_product=rng.random() < 0.1,
+            )
+            product_ids.append(product.pk)
+            product_prices.append(product.price)
+            yield product
+
+    step('products', Product, product_rows())
+
+    size_through = Product.size_variant.through
+    color_through = Product.color_variant.through
+    step('product sizes', size_through, (
+        size_through(product_id=product_id, sizevariant_id=size.pk)
+        for product_id in product_ids for size in size_variants
+    ))
+    step('product colors', color_through, (
+        color_through(product_id=product_id, colorvariant_id=color.pk)
+        for index, product_id in enumerate(product_ids)
+        for color in color_variants[index % 3:index % 3 + 2]
+    ))
+    step('product images', ProductImage, (
+        ProductImage(product_id=product_id, image=f'product/placeholder-{n}.jpg')
+        for product_id in product_ids for n in range(images_per_product)
+    ))
+
+    hashed_password = make_password(password)
+    step('users', User, (
+        User(username=f'{tag}-user-{i}', email=f'{tag}-user-{i}@example.com',
+             first_name='Load', last_name=f'Tester {i}', password=hashed_password)
+        for i in range(users)
+    ))
+    user_ids = list(
+        User.objects.filter(username__startswith=f'{tag}-user-').order_by('id').values_list('id', flat=True)
+    )
+    step('profiles', Profile, (Profile(user_id=user_id) for user_id in user_ids))
+
+    def line_fields(index):
+        return {
+            'product_id': product_ids[index],
+            'size_variant': rng.choice(size_variants),
+            'color_variant': rng.choice(color_variants),
+            'quantity': rng.randint(1, 3),
+        }, product_prices[index]
+
+    cart_objs = [Cart(user_id=user_id) for user_id in user_ids[:carts]]
+    step('carts', Cart, cart_objs)
+    step('cart items', CartItem, (
+        CartItem(cart=cart, **line_fields(index)[0])
+        for cart in cart_objs for index in rng.sample(range(len(product_ids)), min(cart_items, len(product_ids)))
+    ))
+
+    step('wishlist items', Wishlist, (
+        Wishlist(user_id=cart.user_id, product_id=product_ids[index], size_variant=rng.choice(size_variants))
+        for cart in cart_objs
+        for index in rng.sample(range(len(product_ids)), min(wishlist_items, len(product_ids)))
+    ))
+
+    order_ids = []
+    order_lines = []
+
+    def order_rows():
+        for i in range(orders if user_ids else 0):
+            lines = [line_fields(rng.randrange(len(product_ids))) for _ in range(order_items)]
+            total = sum(
+                price * fields['quantity'] + fields['size_variant'].price + fields['color_variant'].price
+                for fields, price in lines
+            )
+            order = Order(
+                user_id=user_ids[i % len(user_ids)],
+                order_id=f'pi_{tag}_{i}',
+                payment_status='Paid',
+                payment_mode='Credit Card',
+                order_total_price=Decimal(total),
+                grand_total=Decimal(total),
+            )
+            order_ids.append(order.pk)
+            order_lines.append(lines)
+            yield order
+
+    step('orders', Order, order_rows())
+
+    def order_item_rows():
+        for order_id, lines in zip(order_ids, order_lines):
+            for fields, price in lines:
+                line_total = price * fields['quantity'] + fields['size_variant'].price + fields['color_variant'].price
+                yield OrderItem(order_id=order_id, product_price=Decimal(line_total), **fields)
+
+    step('order items', OrderItem, order_item_rows())
+
+    # One review per (product, user) pair, walking products first so even a
+    # small user pool can cover millions of reviews without duplicates.
+    max_reviews = len(product_ids) * len(user_ids)
+    step('reviews', ProductReview, (
+        ProductReview(
+            product_id=product_ids[i % len(product_ids)],
+            user_id=user_ids[(i // len(product_ids)) % len(user_ids)],
+            stars=rng.randint(1, 5),
+            content='Lovely fabric and a great fit.',
+        )
+        for i in range(min(reviews, max_reviews))
+    ))
+
+    # bulk_create skips the signals that keep listings current.
+    started = time.perf_counter()
+    counts['listings'] = refresh_listings(product_ids, chunk_size)
+    if log:
+        log(f"listings: {counts['listings']:,} rows in {time.perf_counter() - started:.1f}s")
+
+    return counts
@@ -1,3 +1,329 @@
-from django.test import TestCase
+import gzip
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import brotli
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from base.cache import TwoTierCache
+from base.compression import CompressionMiddleware, choose_coding
+from base.middleware import QueryInstrumentationMiddleware, fingerprint
+from base.models import uuid7
+from base.testing import QueryBudgetMixin
+from home.seeding import seed
+from products import catalog_snapshot
+from products.invalidation import bus
+from products.listing import bump_catalog_version
+from products.models import Product
+
+
+class HomeQueryBudgetTests(QueryBudgetMixin, TestCase):
+    app = 'home'
+
+
+class CatalogSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=3, products=60, images_per_product=1, users=2, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=20, tag='snapshot')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # Versions other tests published were rolled back with them; start as a fresh process would.
+        patcher = mock.patch.dict(bus.versions, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pages(self):
+        category = Product.objects.first().category.category_name
+        requests = [
+            ('index', {}), ('index', {'page': 2}), ('index', {'category': category}),
+            ('index', {'sort': 'priceAsc'}), ('index', {'sort': 'priceDesc', 'page': 3}),
+            ('index', {'sort': 'newest'}), ('index', {'category': 'Nope'}),
+            ('product_search', {'q': 'linen'}), ('product_search', {'q': 'SHIRT 1'}), ('product_search', {'q': ''}),
+        ]
+        return [
+            [(card.slug, card.min_price, card.max_price, card.image) for card in response.context['products']]
+            for response in (self.client.get(reverse(name), params) for name, params in requests)
+        ]
+
+    def test_snapshot_pages_match_the_database(self):
+        expected = self.pages()
+        for numpy in (catalog_snapshot.np, None):
+            with self.subTest(numpy=numpy is not None), override_settings(CATALOG_SNAPSHOT=True), \
+                    mock.patch.object(catalog_snapshot, 'np', numpy), mock.patch.object(catalog_snapshot, '_snapshot', None):
+                self.assertEqual(self.pages(), expected)
+
+    @override_settings(CATALOG_SNAPSHOT=True)
+    def test_reloads_when_the_catalog_changes(self):
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('product_search'), {'q': 'linen'})
+
+        product = Product.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.product_name = 'Zephyr Wrap'
+            product.save()
+        response = self.client.get(reverse('product_search'), {'q': 'zephyr'})
+        self.assertEqual([card.slug for card in response.context['products']], [product.slug])
+
+
+class CatalogConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=3, images_per_product=1, users=0, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=0, tag='etag')
+
+    def test_listing_pages_revalidate_on_the_catalog_version(self):
+        url = reverse('index')
+        etag = self.client.get(url, {'sort': 'priceAsc'})['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'sort': 'priceAsc'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_version()
+        self.assertEqual(self.client.get(url, {'sort': 'priceAsc'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_listing_pages_are_shared_between_visitors(self):
+        response = self.client.get(reverse('product_search'), {'q': 'etag'})
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, s-maxage=60')
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertContains(response, 'data-viewer="cart-count"')
+
+    def test_an_abandoned_partial_login_is_still_cleared(self):
+        # Where allauth keeps a login waiting on an emailed code.
+        session = self.client.session
+        session['account_login'] = {'state': {}}
+        session.save()
+
+        response = self.client.get(reverse('product_search'), {'q': 'etag'})
+        self.assertNotIn('account_login', self.client.session)
+        # The response sets the session cookie, so it is this visitor's alone.
+        self.assertIn('private', response['Cache-Control'])
+
+        response = self.client.get(reverse('product_search'), {'q': 'etag'})
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, s-maxage=60')
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+
+@override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=1.0, QUERY_INSTRUMENTATION_DUPLICATE_THRESHOLD=3)
+class QueryInstrumentationTests(TestCase):
+    def test_fingerprints_ignore_literals_and_list_lengths(self):
+        self.assertEqual(
+            fingerprint("SELECT *  FROM t\nWHERE a = 'it''s' AND b = 4.5 AND c IN (%s, %s, %s)"),
+            "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)",
+        )
+        self.assertEqual(fingerprint("INSERT INTO t VALUES (%s, %s), (%s, %s), (%s, %s)"), "INSERT INTO t VALUES (...)")
+        self.assertEqual(fingerprint("SELECT 1 FROM t WHERE id IN (%s)"), fingerprint("SELECT 2 FROM t WHERE id IN (%s, %s)"))
+
+    def test_repeated_queries_are_logged_past_the_threshold(self):
+        def view(times):
+            def get_response(request):
+                for i in range(times):
+                    Product.objects.filter(product_name=f'none-{i}').exists()
+                return HttpResponse()
+            return get_response
+
+        for times, warned in [(3, False), (4, True)]:
+            with self.assertLogs('ecomm.queries', 'INFO') as logs:
+                QueryInstrumentationMiddleware(view(times))(RequestFactory().get('/'))
+            warnings = [record.getMessage() for record in logs.records if record.levelname == 'WARNING']
+            self.assertEqual(len(warnings), int(warned))
+            if warned:
+                self.assertIn('"count": 4', warnings[0])
+
+    def test_server_timing_header(self):
+        with self.assertLogs('ecomm.queries', 'INFO'):
+            response = self.client.get(reverse('about'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_left_alone(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('about')))
+
+
+class CompressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=3, images_per_product=1, users=0, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=0, tag='zip')
+
+    def middleware(self, response):
+        return CompressionMiddleware(lambda request: response)
+
+    def test_pages_are_compressed_with_the_best_coding_the_client_takes(self):
+        url = reverse('index')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+        self.assertLess(int(response['Content-Length']), len(plain.content) // 3)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_negotiation(self):
+        self.assertEqual(choose_coding('gzip, br'), 'br')
+        self.assertEqual(choose_coding('GZIP;q=0.5'), 'gzip')
+        self.assertEqual(choose_coding('*'), 'br')
+        self.assertIsNone(choose_coding('identity, br;q=0, gzip;q=0'))
+        self.assertIsNone(choose_coding(''))
+
+    def test_small_and_already_compressed_bodies_are_left_alone(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='br')
+        small = self.middleware(HttpResponse('<p>Hi</p>'))(request)
+        self.assertNotIn('Content-Encoding', small)
+
+        image = self.middleware(HttpResponse(b'\x89PNG' * 1000, content_type='image/png'))(request)
+        self.assertNotIn('Content-Encoding', image)
+
+        encoded = HttpResponse(gzip.compress(b'x' * 1000))
+        encoded['Content-Encoding'] = 'gzip'
+        self.assertEqual(self.middleware(encoded)(request)['Content-Encoding'], 'gzip')
+
+    def test_streaming_responses_are_compressed_chunk_by_chunk(self):
+        chunks = [f'<li>Row {n}</li>'.encode() * 50 for n in range(3)]
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = self.middleware(StreamingHttpResponse(iter(chunks)))(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response)
+
+        # Each chunk can be decoded as soon as it arrives.
+        decoder = zlib.decompressobj(31)
+        parts = [decoder.decompress(part) for part in response.streaming_content]
+        self.assertEqual(parts[:3], chunks)
+        self.assertEqual(b''.join(parts), b''.join(chunks))
+
+
+class UUID7Tests(SimpleTestCase):
+    NOW_MS = 1_760_000_000_000
+
+    def setUp(self):
+        # Each test starts from a fresh process's state, at a fixed millisecond.
+        patchers = [
+            mock.patch('base.models._uuid7_last', [0, 0]),
+            mock.patch('base.models.time.time_ns', side_effect=lambda: self.now_ms * 1_000_000),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.now_ms = self.NOW_MS
+
+    def parts(self, key):
+        return key.int >> 80, (key.int >> 64) & 0xFFF
+
+    def test_version_and_variant(self):
+        key = uuid7()
+        self.assertEqual(key.version, 7)
+        self.assertEqual(key.variant, uuid.RFC_4122)
+        self.assertEqual(self.parts(key)[0], self.NOW_MS)
+
+    def test_keys_from_one_millisecond_are_ordered(self):
+        keys = [uuid7() for _ in range(200)]
+        self.assertEqual(sorted(keys), keys)
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual({self.parts(key)[0] for key in keys}, {self.NOW_MS})
+
+    def test_counter_overflow_borrows_the_next_millisecond(self):
+        with mock.patch('base.models._uuid7_last', [self.NOW_MS, 0xFFF]):
+            key = uuid7()
+        self.assertEqual(self.parts(key), (self.NOW_MS + 1, 0))
+
+    def test_clock_stepping_back_keeps_keys_ordered(self):
+        before = uuid7()
+        self.now_ms -= 1000
+        after = uuid7()
+        self.assertGreater(after, before)
+        self.assertEqual(self.parts(after)[0], self.NOW_MS)
+
+
+class TwoTierCacheTests(TestCase):
+    def make_cache(self, location='two-tier-tests', **options):
+        # Instances sharing a LocMemCache location stand in for workers sharing Redis.
+        cache = TwoTierCache(None, {'OPTIONS': {
+            'SHARED': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': location},
+            **options,
+        }})
+        self.addCleanup(cache.clear)
+        return cache
+
+    def test_local_copies_expire_after_local_timeout(self):
+        worker, other = self.make_cache(LOCAL_TIMEOUT=0.2), self.make_cache(LOCAL_TIMEOUT=0.2)
+        worker.set('menu:main', ['shirts'])
+        other.set('menu:main', ['dresses'])
+        self.assertEqual(worker.get('menu:main'), ['shirts'])
+        time.sleep(0.25)
+        self.assertEqual(worker.get('menu:main'), ['dresses'])
+
+        worker.add('tickets:sale', 0)
+        other.incr('tickets:sale')
+        self.assertEqual(worker.incr('tickets:sale'), 2)
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'matrix'
+
+        workers = [self.make_cache(), self.make_cache()]
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda i: workers[i % 2].get_or_set('price_matrix:1', slow, 60), range(16)))
+        self.assertEqual(results, ['matrix'] * 16)
+        self.assertEqual(len(calls), 1)
+        self.assertGreater(sum(worker.hit_ratios()['price_matrix'].get('coalesced', 0) for worker in workers), 0)
+
+    def test_hot_keys_refresh_early_without_a_stampede(self):
+        cache = self.make_cache()
+        cache._store('reviews:1', 'old', 60, None, delta=30)
+        with mock.patch('base.cache.random.random', return_value=0.9):
+            # 30s to compute and 60s left: -30 * ln(0.1) = 69s, so this request refreshes it.
+            self.assertEqual(cache.get_or_set('reviews:1', lambda: 'new', 60), 'new')
+        cache._store('reviews:2', 'old', 60, None, delta=0.01)
+        with mock.patch('base.cache.random.random', return_value=0.9):
+            self.assertEqual(cache.get_or_set('reviews:2', lambda: 'new', 60), 'old')
+
+        # While one request refreshes, the rest keep getting the current value.
+        cache._store('reviews:3', 'old', 60, None, delta=30)
+        started, release = threading.Event(), threading.Event()
+
+        def refresh():
+            started.set()
+            release.wait(5)
+            return 'new'
+
+        with mock.patch('base.cache.random.random', return_value=0.9), ThreadPoolExecutor(max_workers=1) as pool:
+            leader = pool.submit(cache.get_or_set, 'reviews:3', refresh, 60)
+            started.wait(5)
+            self.assertEqual(cache.get_or_set('reviews:3', lambda: self.fail('second refresh'), 60), 'old')
+            release.set()
+            self.assertEqual(leader.result(), 'new')
+
+    def test_hit_ratios_by_prefix(self):
+        cache = self.make_cache()
+        cache.get('reviews:1')
+        cache.set('reviews:1', 'page')
+        cache.get('reviews:1')
+        cache.get('price_matrix:1')
+        ratios = cache.hit_ratios()
+        self.assertEqual(ratios['reviews']['hit_ratio'], 0.5)
+        self.assertEqual(ratios['price_matrix']['hit_ratio'], 0.0)
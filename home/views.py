@@ -1,5 +1,8 @@
 from django.shortcuts import render
-from products.models import Product, Category
+from base.conditional import public_page
+from products.catalog_snapshot import catalog_snapshot
+from products.listing import catalog_version
+from products.models import Category, ProductListing
 from django.db.models import Q
 from django.core.mail import send_mail
 from django.conf import settings
@@ -11,22 +14,35 @@ from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 # Create your views here.
 
 
+def catalog_validators(request):
+    # Listing pages change only when some listing does, which bumps the catalog version.
+    return ('catalog', catalog_version()), None
+
+
+@public_page(catalog_validators)
 def index(request):
-    query = Product.objects.all()
-    categories = Category.objects.all()
     selected_sort = request.GET.get('sort')
     selected_category = request.GET.get('category')
 
-    if selected_category:
-        query = query.filter(category__category_name=selected_category)
+    if settings.CATALOG_SNAPSHOT:
+        snapshot = catalog_snapshot()
+        categories = snapshot.categories
+        query = snapshot.search(category=selected_category, sort=selected_sort)
+    else:
+        # Cards come from the denormalized listing table: one indexed query per page, no per-card lookups.
+        query = ProductListing.objects.order_by('pk')
+        categories = Category.objects.all()
+
+        if selected_category:
+            query = query.filter(category_name=selected_category)
 
-    if selected_sort:
-        if selected_sort == 'newest':
-            query = query.filter(newest_product=True).order_by('category_id')
-        elif selected_sort == 'priceAsc':
-            query = query.order_by('price')
-        elif selected_sort == 'priceDesc':
-            query = query.order_by('-price')
+        if selected_sort:
+            if selected_sort == 'newest':
+                query = query.filter(newest_product=True).order_by('category_name', 'pk')
+            elif selected_sort == 'priceAsc':
+                query = query.order_by('price', 'pk')
+            elif selected_sort == 'priceDesc':
+                query = query.order_by('-price', 'pk')
 
     page = request.GET.get('page', 1)
     paginator = Paginator(query, 20)
@@ -49,15 +65,18 @@ def index(request):
     return render(request, 'home/index.html', context)
 
 
+@public_page(catalog_validators)
 def product_search(request):
     query = request.GET.get('q', '')
 
-    if query:
+    if query and settings.CATALOG_SNAPSHOT:
+        products = catalog_snapshot().search(text=query)
+    elif query:
         # Search for products that contain the query string in their product_name field
-        products = Product.objects.filter(Q(product_name__icontains=query) | Q(
-            product_name__istartswith=query))
+        products = ProductListing.objects.filter(Q(product_name__icontains=query) | Q(
+            product_name__istartswith=query)).order_by('pk')
     else:
-        products = Product.objects.none()
+        products = ProductListing.objects.none()
 
     context = {'query': query, 'products': products}
     return render(request, 'home/search.html', context)
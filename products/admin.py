@@ -28,6 +28,23 @@ class SizeVariantAdmin(admin.ModelAdmin):
 
     model = SizeVariant
 
+@admin.register(Stock)
+class StockAdmin(admin.ModelAdmin):
+    list_display = ['product', 'size_variant', 'color_variant', 'quantity']
+    list_select_related = ['product', 'size_variant', 'color_variant']
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['stock', 'cart', 'quantity', 'status', 'expires_at']
+    list_filter = ['status']
+    list_select_related = ['stock__product', 'stock__size_variant', 'stock__color_variant']
+
+@admin.register(FlashSale)
+class FlashSaleAdmin(admin.ModelAdmin):
+    list_display = ['product', 'starts_at', 'ends_at', 'admit_per_minute', 'is_active']
+    list_select_related = ['product']
+
 admin.site.register(Product, ProductAdmin)
 admin.site.register(ProductImage)
 admin.site.register(ProductReview)
\ No newline at end of file
@@ -0,0 +1,212 @@
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+from products.listing import catalog_version
+from products.models import Category, ProductListing
+
+try:
+    import numpy as np
+except ImportError:  # The snapshot works without NumPy, just with Python loops for filtering and sorting.
+    np = None
+
+
+# What the listing templates read from each card and the category filter.
+ListingRow = namedtuple('ListingRow', 'slug product_name image price min_price max_price rating review_count')
+CategoryRow = namedtuple('CategoryRow', 'category_name')
+
+SORTS = ('newest', 'priceAsc', 'priceDesc')
+
+
+def _column(typecode, values):
+    # A compact C array; with NumPy, viewed as an ndarray over the same buffer.
+    column = array(typecode, values)
+    return np.asarray(column) if np is not None else column
+
+
+class SnapshotResults:
+    """A filtered, sorted view of a snapshot that builds rows only for the slice asked for, e.g. by a Paginator."""
+
+    def __init__(self, snapshot, indices):
+        self.snapshot = snapshot
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.snapshot.row(i) for i in self.indices[key]]
+        return self.snapshot.row(self.indices[key])
+
+    def __iter__(self):
+        return (self.snapshot.row(i) for i in self.indices)
+
+
+class CatalogSnapshot:
+    """
+    Every product listing held in columns: NumPy arrays (or ``array.array``
+    without NumPy) for numbers and flags, tuples for strings, and all names
+    joined into one lower-cased string so a search is a run of ``str.find``
+    calls. Immutable once built; a new catalog version builds a new one.
+    """
+
+    def __init__(self, version, listings, categories):
+        self.version = version
+        self.categories = tuple(CategoryRow(name) for name in categories)
+        # Codes follow name order, so sorting by code sorts by category name.
+        names = sorted(set(categories) | {listing.category_name for listing in listings})
+        self.category_codes = {name: code for code, name in enumerate(names)}
+
+        self.slugs = tuple(listing.slug for listing in listings)
+        self.names = tuple(listing.product_name for listing in listings)
+        self.images = tuple(listing.image for listing in listings)
+        self.price = _column('i', (listing.price for listing in listings))
+        self.min_price = _column('i', (listing.min_price for listing in listings))
+        self.max_price = _column('i', (listing.max_price for listing in listings))
+        self.rating = _column('f', (listing.rating for listing in listings))
+        self.review_count = _column('I', (listing.review_count for listing in listings))
+        self.category = _column('H', (self.category_codes[listing.category_name] for listing in listings))
+        self.newest = _column('B', (listing.newest_product for listing in listings))
+
+        # '\n' can't appear in a product name, so no match spans two of them.
+        lowered = [name.lower() for name in self.names]
+        self.search_text = '\n'.join(lowered)
+        starts = array('Q', [0])
+        for name in lowered[:-1]:
+            starts.append(starts[-1] + len(name) + 1)
+        self.name_starts = np.asarray(starts) if np is not None else starts
+
+    @classmethod
+    def load(cls, version):
+        # Two queries, in the order the DB-backed index lists products.
+        listings = list(ProductListing.objects.order_by('pk').only(
+            'slug', 'product_name', 'category_name', 'image', 'price', 'min_price', 'max_price',
+            'rating', 'review_count', 'newest_product',
+        ))
+        categories = list(Category.objects.values_list('category_name', flat=True))
+        return cls(version, listings, categories)
+
+    def __len__(self):
+        return len(self.slugs)
+
+    def row(self, i):
+        return ListingRow(
+            self.slugs[i], self.names[i], self.images[i], int(self.price[i]), int(self.min_price[i]),
+            int(self.max_price[i]), float(self.rating[i]), int(self.review_count[i]),
+        )
+
+    def _matching_names(self, text):
+        # Indices of products whose name contains ``text``, in catalog order.
+        text = text.lower()
+        if np is not None:
+            hits = np.fromiter((match.start() for match in re.finditer(re.escape(text), self.search_text)), dtype=np.int64)
+            return np.unique(np.searchsorted(self.name_starts, hits, side='right') - 1)
+        matches = []
+        start = self.search_text.find(text)
+        while start != -1:
+            i = bisect_right(self.name_starts, start) - 1
+            matches.append(i)
+            # Skip to the next name: one hit per product is enough.
+            next_start = self.name_starts[i + 1] if i + 1 < len(self.name_starts) else len(self.search_text)
+            start = self.search_text.find(text, next_start)
+        return matches
+
+    def search(self, category=None, newest=False, text=None, sort=None):
+        """
+        Products matching every filter given, sorted like the index view
+        sorts (``SORTS``) and otherwise in catalog order, as ``SnapshotResults``.
+        """
+        code = self.category_codes.get(category) if category else None
+        if category and code is None:
+            return SnapshotResults(self, [])
+        if text and '\n' in text:
+            return SnapshotResults(self, [])
+
+        if np is not None:
+            mask = np.ones(len(self), dtype=bool)
+            if code is not None:
+                mask &= self.category == code
+            if newest or sort == 'newest':
+                mask &= self.newest.view(np.bool_)
+            if text:
+                found = np.zeros(len(self), dtype=bool)
+                found[self._matching_names(text)] = True
+                mask &= found
+            indices = np.flatnonzero(mask)
+            if sort == 'newest':
+                indices = indices[np.argsort(self.category[indices], kind='stable')]
+            elif sort == 'priceAsc':
+                indices = indices[np.argsort(self.price[indices], kind='stable')]
+            elif sort == 'priceDesc':
+                indices = indices[np.argsort(-self.price[indices], kind='stable')]
+            return SnapshotResults(self, indices)
+
+        indices = self._matching_names(text) if text else range(len(self))
+        if code is not None:
+            indices = [i for i in indices if self.category[i] == code]
+        if newest or sort == 'newest':
+            indices = [i for i in indices if self.newest[i]]
+        indices = list(indices)
+        if sort == 'newest':
+            indices.sort(key=self.category.__getitem__)
+        elif sort == 'priceAsc':
+            indices.sort(key=self.price.__getitem__)
+        elif sort == 'priceDesc':
+            indices.sort(key=self.price.__getitem__, reverse=True)
+        return SnapshotResults(self, indices)
+
+    def memory_report(self):
+        """Approximate bytes held per part of the snapshot, and in total per 100k products."""
+        def column_bytes(column):
+            return column.itemsize * len(column)
+
+        def strings_bytes(strings):
+            return sys.getsizeof(strings) + sum(sys.getsizeof(value) for value in strings)
+
+        parts = {
+            'numeric columns': sum(column_bytes(column) for column in (
+                self.price, self.min_price, self.max_price, self.rating, self.review_count, self.category, self.newest,
+            )),
+            'slugs': strings_bytes(self.slugs),
+            'names': strings_bytes(self.names),
+            'images': strings_bytes(self.images),
+            'search index': sys.getsizeof(self.search_text) + column_bytes(self.name_starts),
+        }
+        total = sum(parts.values())
+        return {
+            'products': len(self),
+            'numpy': np is not None,
+            'bytes': parts,
+            'total_bytes': total,
+            'bytes_per_100k_products': round(total / len(self) * 100_000) if len(self) else 0,
+        }
+
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def catalog_snapshot():
+    """
+    This process's snapshot of the catalog, rebuilt when the catalog version
+    moves on. Checking the version is one cache read; the reload builds a
+    complete new snapshot before swapping it in, and while one thread
+    rebuilds, the others keep serving the previous one.
+    """
+    global _snapshot
+    version = catalog_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    if not _lock.acquire(blocking=snapshot is None):
+        return snapshot
+    try:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = CatalogSnapshot.load(version)
+        return _snapshot
+    finally:
+        _lock.release()
@@ -0,0 +1,124 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from accounts.models import Cart
+from products.invalidation import bus
+from products.models import Coupon, CouponRedemption
+
+
+class CouponError(Exception):
+    pass
+
+
+class ActiveCoupons:
+    """
+    Per-process map of code -> Coupon for coupons that can still be used,
+    reloaded in one query every ``COUPON_CACHE_SECONDS`` or after a coupon
+    is saved in any process (via ``products.invalidation``). Redemption counts are never read from here:
+    caps are enforced by the database in ``redeem_coupon``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.coupons = None
+        self.loaded_at = 0.0
+
+    def get(self, code):
+        coupons, loaded_at = self.coupons, self.loaded_at
+        if coupons is None or time.monotonic() - loaded_at > settings.COUPON_CACHE_SECONDS:
+            coupons = self.load()
+        return coupons.get(code)
+
+    def load(self):
+        with self.lock:
+            now = timezone.now()
+            coupons = {
+                coupon.coupon_code: coupon
+                for coupon in Coupon.objects.filter(is_expired=False).filter(Q(valid_until=None) | Q(valid_until__gt=now))
+            }
+            self.coupons, self.loaded_at = coupons, time.monotonic()
+        return coupons
+
+    def clear(self):
+        self.coupons = None
+
+
+active_coupons = ActiveCoupons()
+bus.subscribe('coupons', active_coupons.clear)
+
+
+def validate_coupon(code, cart_total, now=None):
+    """Return the usable coupon for ``code`` or raise ``CouponError`` saying why not."""
+    coupon = active_coupons.get((code or '').strip())
+    if coupon is None:
+        raise CouponError('Invalid coupon code.')
+    now = now or timezone.now()
+    if coupon.valid_until and now >= coupon.valid_until:
+        raise CouponError('Coupon code expired.')
+    if coupon.valid_from and now < coupon.valid_from:
+        raise CouponError('This coupon is not valid yet.')
+    if cart_total < coupon.minimum_amount:
+        raise CouponError(f'Amount should be greater than {coupon.minimum_amount}')
+    return coupon
+
+
+def redeem_coupon(coupon, user_id):
+    """
+    Count one use of ``coupon`` by user ``user_id``, or raise ``CouponError``
+    if a cap is reached. Both counters move with ``UPDATE ... WHERE count <
+    cap``, so concurrent shoppers can't take more uses than the caps allow.
+    """
+    with transaction.atomic():
+        redeemed = Coupon.objects.filter(pk=coupon.pk)
+        if coupon.max_redemptions is not None:
+            redeemed = redeemed.filter(times_redeemed__lt=F('max_redemptions'))
+        if not redeemed.update(times_redeemed=F('times_redeemed') + 1):
+            raise CouponError('This coupon has been fully redeemed.')
+
+        redemption, _ = CouponRedemption.objects.get_or_create(coupon=coupon, user_id=user_id)
+        mine = CouponRedemption.objects.filter(pk=redemption.pk)
+        if coupon.max_redemptions_per_user is not None:
+            mine = mine.filter(uses__lt=coupon.max_redemptions_per_user)
+        if not mine.update(uses=F('uses') + 1):
+            # Rolls back the global count taken above.
+            raise CouponError('You have already used this coupon.')
+
+
+def release_coupon(coupon, user_id):
+    """Give back a use taken by ``redeem_coupon``, e.g. when the coupon is removed from a cart."""
+    with transaction.atomic():
+        Coupon.objects.filter(pk=coupon.pk, times_redeemed__gt=0).update(times_redeemed=F('times_redeemed') - 1)
+        CouponRedemption.objects.filter(coupon=coupon, user_id=user_id, uses__gt=0).update(uses=F('uses') - 1)
+
+
+def apply_coupon(cart, code):
+    """
+    Validate ``code`` against ``cart`` and attach it, counting the use.
+    Uses are counted when a coupon is applied, before payment, so a capped
+    code can never be charged to more shoppers than it allows.
+    """
+    if cart.coupon_id:
+        raise CouponError('Coupon already exists.')
+    coupon = validate_coupon(code, cart.get_cart_total())
+    with transaction.atomic():
+        # Only the first of two racing applies to the same cart takes a use.
+        if not Cart.objects.filter(pk=cart.pk, coupon=None).update(coupon=coupon):
+            raise CouponError('Coupon already exists.')
+        redeem_coupon(coupon, cart.user_id)
+    cart.coupon = coupon
+    return coupon
+
+
+def remove_coupon(cart):
+    coupon = cart.coupon
+    if coupon is None:
+        return
+    with transaction.atomic():
+        if Cart.objects.filter(pk=cart.pk, coupon=coupon).update(coupon=None):
+            release_coupon(coupon, cart.user_id)
+    cart.coupon = None
@@ -0,0 +1,138 @@
+import math
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from products.invalidation import bus
+from products.models import FlashSale
+
+
+ACTIVE_SALES_KEY = 'flash_sales:active'
+COOKIE_SALT = 'products.flash_sale'
+
+
+def active_sales():
+    """
+    ``{product uid: sale}`` for every sale that is running or yet to start,
+    as plain dicts of epoch seconds. Read from the cache, so gating a request
+    costs no queries; saving or deleting a ``FlashSale`` clears it.
+    """
+    return cache.get_or_set(ACTIVE_SALES_KEY, _load_active_sales, settings.FLASH_SALE_CACHE_SECONDS)
+
+
+def _load_active_sales():
+    return {
+        str(sale.product_id): {
+            'id': str(sale.pk),
+            'slug': sale.product.slug,
+            'starts_at': sale.starts_at.timestamp(),
+            'ends_at': sale.ends_at.timestamp(),
+            'rate': sale.admit_per_minute,
+            'window': sale.admission_minutes * 60,
+        }
+        for sale in FlashSale.objects.filter(is_active=True, ends_at__gt=timezone.now()).select_related('product')
+    }
+
+
+def forget_active_sales():
+    cache.delete(ACTIVE_SALES_KEY)
+
+
+bus.subscribe('flash_sales', forget_active_sales)
+
+
+def sale_for_product(product_id, now=None):
+    sale = active_sales().get(str(product_id))
+    if sale and (now or time.time()) < sale['ends_at']:
+        return sale
+    return None
+
+
+def sale_for_slug(slug, now=None):
+    for product_id, sale in active_sales().items():
+        if sale['slug'] == slug:
+            return sale_for_product(product_id, now)
+    return None
+
+
+def sale_by_id(sale_id):
+    return next((sale for sale in active_sales().values() if sale['id'] == sale_id), None)
+
+
+def cookie_name(sale):
+    return f"flash_{sale['id'].replace('-', '')}"
+
+
+def issue_ticket(sale, now=None):
+    """
+    Hand out the next place in line. Place ``n`` is admitted at
+    ``starts_at + (n - 1) / rate``; if the line has drained, the counter
+    jumps to the present so idle minutes don't bank a burst of admissions.
+
+    The counter is a column on the sale, bumped with one conditional
+    ``UPDATE`` like the coupon caps, so every worker hands out places from
+    the same line whatever cache backend is configured.
+    """
+    now = now or time.time()
+    floor = math.floor((now - sale['starts_at']) * sale['rate'] / 60) + 1
+    tickets = FlashSale.objects.filter(pk=sale['id'])
+    with transaction.atomic():
+        # The row stays locked until commit, so the read sees this update and no other.
+        tickets.update(tickets_issued=Greatest(F('tickets_issued') + 1, floor))
+        return tickets.values_list('tickets_issued', flat=True).get()
+
+
+def read_ticket(request, sale):
+    """This shopper's place in line for ``sale``, or None."""
+    try:
+        ticket = signing.loads(request.COOKIES[cookie_name(sale)], salt=COOKIE_SALT)
+    except (KeyError, signing.BadSignature):
+        return None
+    return ticket['n'] if ticket.get('sale') == sale['id'] else None
+
+
+def set_ticket(response, sale, ticket):
+    response.set_cookie(
+        cookie_name(sale), signing.dumps({'sale': sale['id'], 'n': ticket}, salt=COOKIE_SALT),
+        max_age=max(0, int(sale['ends_at'] - time.time())),
+        secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+    )
+
+
+def ticket_status(sale, ticket, now=None):
+    """Where ``ticket`` stands: waiting (with an estimate), admitted, or expired."""
+    now = now or time.time()
+    if ticket is None:
+        return {'state': 'none'}
+    admit_at = sale['starts_at'] + (ticket - 1) * 60 / sale['rate']
+    if now < admit_at:
+        wait = admit_at - now
+        return {
+            'state': 'waiting',
+            'ahead': math.ceil(wait * sale['rate'] / 60),
+            'wait_seconds': math.ceil(wait),
+            # Poll less often the further back in line, with a ceiling.
+            'poll_seconds': min(30, max(2, math.ceil(wait / 4))),
+        }
+    if now < admit_at + sale['window']:
+        return {'state': 'admitted', 'expires_in': math.ceil(admit_at + sale['window'] - now)}
+    return {'state': 'expired'}
+
+
+def is_admitted(request, sale):
+    return ticket_status(sale, read_ticket(request, sale))['state'] == 'admitted'
+
+
+def blocking_sale(request, product_ids):
+    """The first flash sale among ``product_ids`` this shopper hasn't been admitted to, if any."""
+    for product_id in product_ids:
+        sale = sale_for_product(product_id)
+        if sale and not is_admitted(request, sale):
+            return sale
+    return None
@@ -0,0 +1,141 @@
+import logging
+import select
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F
+
+from products.models import CacheVersion
+
+
+logger = logging.getLogger('ecomm.invalidation')
+
+CHANNEL = 'cache_invalidation'
+
+
+class InvalidationBus:
+    """
+    Tells every process when a cached topic changes. Django signals fire
+    only in the process that made the change, so per-process caches
+    subscribe here instead of to the signals.
+
+    ``publish(topic)`` bumps the topic's row in ``CacheVersion`` and, on
+    PostgreSQL, sends a ``NOTIFY``; both go out with the surrounding
+    transaction's commit, and this process's subscribers run then too, so
+    no thread can re-cache the old data under the new version before the
+    new data is visible.
+    A listener thread in each serving process (``start()``) picks the new
+    version up and runs its subscribers. It waits on ``LISTEN`` on
+    PostgreSQL and polls the table on other databases, so remote caches
+    are dropped within ``CACHE_INVALIDATION_POLL_SECONDS``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = {}
+        self.subscribers = defaultdict(list)
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def subscribe(self, topic, callback):
+        # ``callback()`` drops this process's cached copies of ``topic``.
+        self.subscribers[topic].append(callback)
+
+    def version(self, topic):
+        """The latest version of ``topic`` this process knows of; 0 before any."""
+        return self.versions.get(topic, 0)
+
+    def publish(self, topic):
+        rows = CacheVersion.objects.filter(topic=topic)
+        if not rows.update(version=F('version') + 1):
+            CacheVersion.objects.get_or_create(topic=topic)
+            rows.update(version=F('version') + 1)
+        version = rows.values_list('version', flat=True).get()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, f'{topic}:{version}'])
+        # Our own change is news even if the number isn't: a restored
+        # database (or a test's rollback) can hand out a version again.
+        transaction.on_commit(partial(self.changed, topic, version))
+        return version
+
+    def seen(self, topic, version):
+        """Record that ``topic`` is at ``version``, running its subscribers if that's news."""
+        with self.lock:
+            # Any change counts, not just increases: a restored database can go back.
+            if version == self.versions.get(topic):
+                return
+        self.changed(topic, version)
+
+    def changed(self, topic, version):
+        with self.lock:
+            self.versions[topic] = version
+        for callback in self.subscribers[topic]:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Invalidating %s v%d failed", topic, version)
+
+    def start(self):
+        """Start this process's listener thread, once."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self.listen, name='cache-invalidation', daemon=True)
+                self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def listen(self):
+        # A connection of its own: LISTEN needs a session that outlives requests.
+        db = connections['default']
+        poll_seconds = settings.CACHE_INVALIDATION_POLL_SECONDS
+        conn = None
+        while not self.stopping.is_set():
+            try:
+                if conn is None:
+                    conn = db.get_new_connection(db.get_connection_params())
+                    if db.vendor == 'postgresql':
+                        conn.autocommit = True
+                        conn.cursor().execute(f'LISTEN {CHANNEL}')
+                    # Catch up on anything published before we were listening.
+                    self.read_versions(conn)
+                if db.vendor == 'postgresql':
+                    if select.select([conn], [], [], poll_seconds)[0]:
+                        conn.poll()
+                        for notify in conn.notifies:
+                            topic, _, version = notify.payload.rpartition(':')
+                            self.seen(topic, int(version))
+                        conn.notifies.clear()
+                else:
+                    self.stopping.wait(poll_seconds)
+                    self.read_versions(conn)
+            except (DatabaseError, db.Database.Error, OSError):
+                logger.warning("Cache invalidation listener lost its connection; reconnecting", exc_info=True)
+                if conn is not None:
+                    conn.close()
+                conn = None
+                self.stopping.wait(poll_seconds)
+        if conn is not None:
+            conn.close()
+
+    def read_versions(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'SELECT topic, version FROM {CacheVersion._meta.db_table}')
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        for topic, version in rows:
+            self.seen(topic, version)
+
+
+bus = InvalidationBus()
@@ -0,0 +1,147 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.models import Stock, StockReservation
+
+
+logger = logging.getLogger('ecomm.inventory')
+
+
+class OutOfStock(Exception):
+    def __init__(self, stock, requested):
+        self.stock = stock
+        self.requested = requested
+        size = f" in size {stock.size_variant}" if stock.size_variant_id else ""
+        super().__init__(f"Sorry, there is not enough of {stock.product}{size} left for {requested} more.")
+
+
+def take_stock(stock_id, quantity):
+    """
+    Atomically take ``quantity`` units from a stock row. Returns False,
+    changing nothing, if fewer than ``quantity`` are left.
+
+    This is a single ``UPDATE ... WHERE quantity >= n``: the row lock it
+    takes serialises concurrent buyers, and the condition is re-checked
+    after the lock is granted, so stock can never go below zero.
+    """
+    return bool(Stock.objects.filter(pk=stock_id, quantity__gte=quantity).update(quantity=F('quantity') - quantity))
+
+
+def _demand(carts):
+    # Units wanted per (cart, sku).
+    demand = Counter()
+    for cart in carts:
+        for item in cart.cart_items.all():
+            demand[cart.pk, (item.product_id, item.size_variant_id, item.color_variant_id)] += item.quantity
+    return demand
+
+
+def _tracked_stock(demand):
+    products = {sku[0] for _, sku in demand}
+    return {
+        (stock.product_id, stock.size_variant_id, stock.color_variant_id): stock
+        for stock in Stock.objects.filter(product_id__in=products).select_related('product', 'size_variant')
+    }
+
+
+def reserve_cart(cart, ttl=None):
+    """
+    Hold stock for every tracked line of ``cart`` until the reservation
+    expires, replacing any earlier hold for the cart. Raises ``OutOfStock``
+    and holds nothing if any line cannot be covered.
+    """
+    ttl = ttl or timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+    demand = _demand([cart])
+    stocks = _tracked_stock(demand)
+    wanted = sorted(
+        ((stocks[sku], quantity) for (_, sku), quantity in demand.items() if sku in stocks),
+        # Lock rows in a fixed order so two carts can't deadlock on each other.
+        key=lambda pair: pair[0].pk,
+    )
+    if not wanted:
+        release_cart_reservations(cart)
+        return []
+
+    # Return stale holds on these SKUs first, so an abandoned checkout doesn't block a live one.
+    release_expired(stock_ids=[stock.pk for stock, _ in wanted])
+
+    expires_at = timezone.now() + ttl
+    with transaction.atomic():
+        release_cart_reservations(cart)
+        for stock, quantity in wanted:
+            if not take_stock(stock.pk, quantity):
+                raise OutOfStock(stock, quantity)
+        return StockReservation.objects.bulk_create([
+            StockReservation(stock=stock, cart=cart, quantity=quantity, expires_at=expires_at)
+            for stock, quantity in wanted
+        ])
+
+
+def _release(reservations):
+    # Called with the reservations locked, or on a database that serialises writers.
+    reservations = list(reservations)
+    if not reservations:
+        return 0
+    StockReservation.objects.filter(pk__in=[pk for pk, _, _ in reservations]).update(status=StockReservation.RELEASED)
+    returned = Counter()
+    for _, stock_id, quantity in reservations:
+        returned[stock_id] += quantity
+    for stock_id, quantity in returned.items():
+        Stock.objects.filter(pk=stock_id).update(quantity=F('quantity') + quantity)
+    return len(reservations)
+
+
+def _held():
+    return (
+        StockReservation.objects.select_for_update(skip_locked=True)
+        .filter(status=StockReservation.HELD).values_list('pk', 'stock_id', 'quantity')
+    )
+
+
+def release_cart_reservations(cart):
+    """Give back everything ``cart`` holds, e.g. when its checkout is cancelled."""
+    if not StockReservation.objects.filter(cart=cart, status=StockReservation.HELD).exists():
+        return 0
+    with transaction.atomic():
+        return _release(_held().filter(cart=cart))
+
+
+def release_expired(now=None, stock_ids=None):
+    """Give back every hold past its expiry. Returns how many were released."""
+    expired = _held().filter(expires_at__lte=now or timezone.now())
+    if stock_ids is not None:
+        expired = expired.filter(stock_id__in=stock_ids)
+    with transaction.atomic():
+        return _release(expired)
+
+
+def commit_reservations(carts):
+    """
+    Turn the holds of paid ``carts`` into sales. Carts whose hold lapsed
+    before the payment arrived take their stock now; if it has been sold
+    in the meantime the sale stands and the shortfall is logged.
+    """
+    carts = list(carts)
+    held = StockReservation.objects.filter(cart__in=carts, status=StockReservation.HELD)
+    held_carts = set(held.values_list('cart_id', flat=True))
+    if held_carts:
+        with transaction.atomic():
+            # Re-read under lock: a hold released since is taken again below.
+            held_carts = set(held.select_for_update().values_list('cart_id', flat=True))
+            held.filter(cart__in=held_carts).update(status=StockReservation.CONSUMED)
+
+    late = [cart for cart in carts if cart.pk not in held_carts]
+    if not late:
+        return
+    demand = _demand(late)
+    stocks = _tracked_stock(demand)
+    wanted = [(stocks[sku], quantity, cart_id) for (cart_id, sku), quantity in demand.items() if sku in stocks]
+    for stock, quantity, cart_id in sorted(wanted, key=lambda line: line[0].pk):
+        if not take_stock(stock.pk, quantity):
+            logger.warning("Oversold %s by up to %d for paid cart %s", stock, quantity, cart_id)
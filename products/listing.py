@@ -0,0 +1,113 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min
+
+from products.invalidation import bus
+from products.models import Product, ProductImage, ProductListing, ProductReview
+
+
+CHUNK_SIZE = 500
+LISTING_FIELDS = [
+    'category', 'slug', 'product_name', 'category_name', 'image', 'price', 'min_price', 'max_price',
+    'rating', 'review_count', 'newest_product', 'is_variant', 'updated_at',
+]
+
+
+def catalog_version():
+    # Moves on in every process whenever listings change, so in-process
+    # copies of the catalog (products.catalog_snapshot) know to reload.
+    return bus.version('catalog')
+
+
+def bump_catalog_version():
+    bus.publish('catalog')
+
+
+def _variant_prices(through, field, product_ids):
+    # {product id: (cheapest, dearest)} surcharge among a product's sizes or colors.
+    return {
+        row['product_id']: (row['low'], row['high'])
+        for row in through.objects.filter(product_id__in=product_ids).values('product_id')
+        .annotate(low=Min(f'{field}__price'), high=Max(f'{field}__price'))
+    }
+
+
+def refresh_listings(product_ids, chunk_size=CHUNK_SIZE):
+    """
+    Rebuild the ``ProductListing`` rows of ``product_ids``, six queries per
+    ``chunk_size`` products. Ids of deleted products are skipped: their rows
+    went with them. Returns the number of rows written.
+    """
+    product_ids = list(product_ids)
+    written = sum(_refresh(product_ids[i:i + chunk_size]) for i in range(0, len(product_ids), chunk_size))
+    bump_catalog_version()
+    return written
+
+
+def _refresh(product_ids):
+    products = list(Product.objects.filter(pk__in=product_ids).select_related('category'))
+    if not products:
+        return 0
+    ids = [product.pk for product in products]
+
+    # Walking newest first leaves each product's first image in place, as `product_images.first` would.
+    images = dict(ProductImage.objects.filter(product_id__in=ids).order_by('-pk').values_list('product_id', 'image'))
+    sizes = _variant_prices(Product.size_variant.through, 'sizevariant', ids)
+    colors = _variant_prices(Product.color_variant.through, 'colorvariant', ids)
+    reviews = {
+        row['product_id']: row
+        for row in ProductReview.objects.filter(product_id__in=ids).values('product_id')
+        .annotate(rating=Avg('stars'), count=Count('pk'))
+    }
+
+    listings = []
+    for product in products:
+        size_low, size_high = sizes.get(product.pk, (0, 0))
+        # A size must be picked but a color needn't be, so the plain size price is always on offer.
+        color_low, color_high = colors.get(product.pk, (0, 0))
+        color_low = min(color_low, 0)
+        review = reviews.get(product.pk, {'rating': 0, 'count': 0})
+        listings.append(ProductListing(
+            product=product,
+            category=product.category,
+            slug=product.slug,
+            product_name=product.product_name,
+            category_name=product.category.category_name,
+            image=images.get(product.pk, ''),
+            price=product.price,
+            min_price=product.price + size_low + color_low,
+            max_price=product.price + size_high + color_high,
+            rating=review['rating'] or 0,
+            review_count=review['count'],
+            newest_product=product.newest_product,
+            is_variant=product.parent_id is not None,
+        ))
+    ProductListing.objects.bulk_create(
+        listings, update_conflicts=True, unique_fields=['product'], update_fields=LISTING_FIELDS,
+    )
+    return len(listings)
+
+
+def refresh_on_commit(product_ids):
+    # After the surrounding transaction commits, so a product deleted along
+    # with its images and reviews isn't written back halfway through.
+    transaction.on_commit(partial(refresh_listings, list(product_ids)))
+
+
+def rebuild_listings(chunk_size=CHUNK_SIZE):
+    """Refresh every listing, ``chunk_size`` products at a time. Returns the number written."""
+    written = 0
+    last = None
+    while True:
+        # Keyset over the primary key, so late chunks cost what early ones do.
+        chunk = Product.objects.order_by('pk')
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        ids = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            break
+        written += _refresh(ids)
+        last = ids[-1]
+    bump_catalog_version()
+    return written
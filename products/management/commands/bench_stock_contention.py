@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from home.management.commands.load_harness import percentile
+from products.inventory import take_stock
+from products.models import Product, Stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Race hundreds of concurrent buyers for one SKU and report oversell and throughput, "
+        "for the conditional UPDATE used at checkout and for a naive read-modify-write."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200,
+                            help="Concurrent buyers, each on its own connection (mind max_connections).")
+        parser.add_argument('--attempts', type=int, default=5, help="Single-unit purchases each buyer tries.")
+        parser.add_argument('--stock', type=int, default=500, help="Units on hand when the drop opens.")
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError("SQLite serialises every writer; run this against PostgreSQL.")
+        product = Product.objects.filter(stock__isnull=True).first()
+        if product is None:
+            raise CommandError("No untracked product to stock; run `manage.py seed_scale` first.")
+
+        self.stdout.write(
+            f"{options['buyers']} buyers x {options['attempts']} attempts for {options['stock']} units of {product}"
+        )
+        # oversold: units sold beyond the stock; lost: sales the stock level never saw.
+        header = f"{'strategy':<20}{'sold':>7}{'left':>7}{'oversold':>10}{'lost':>7}{'wall s':>9}{'attempts/s':>12}{'p50 ms':>9}{'p99 ms':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for label, buy in (('conditional UPDATE', self.buy_conditional), ('read-modify-write', self.buy_naive)):
+            stock = Stock.objects.create(product=product, quantity=options['stock'])
+            try:
+                self.report(label, stock, options, *self.race(stock, buy, options))
+            finally:
+                stock.delete()
+
+    def buy_conditional(self, stock_id):
+        return take_stock(stock_id, 1)
+
+    def buy_naive(self, stock_id):
+        # What the code would look like without the conditional UPDATE: two
+        # buyers can read the same quantity and both "take" the last unit.
+        with transaction.atomic():
+            stock = Stock.objects.get(pk=stock_id)
+            if stock.quantity < 1:
+                return False
+            stock.quantity -= 1
+            stock.save(update_fields=['quantity'])
+            return True
+
+    def race(self, stock, buy, options):
+        start = threading.Barrier(options['buyers'])
+
+        def buyer(_):
+            results = []
+            try:
+                start.wait()
+                for _ in range(options['attempts']):
+                    started = time.perf_counter()
+                    ok = buy(stock.pk)
+                    results.append((time.perf_counter() - started, ok))
+            finally:
+                connection.close()
+            return results
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['buyers']) as pool:
+            results = [result for batch in pool.map(buyer, range(options['buyers'])) for result in batch]
+        return results, time.perf_counter() - started
+
+    def report(self, label, stock, options, results, wall):
+        stock.refresh_from_db()
+        sold = sum(1 for _, ok in results if ok)
+        latencies = sorted(elapsed for elapsed, _ in results)
+        self.stdout.write(
+            f"{label:<20}{sold:>7}{stock.quantity:>7}{max(0, sold - options['stock']):>10}"
+            f"{sold - (options['stock'] - stock.quantity):>7}"
+            f"{wall:>9.2f}{len(results) / wall:>12.0f}"
+            f"{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 99) * 1000:>9.1f}"
+        )
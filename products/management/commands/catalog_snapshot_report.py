@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from products.catalog_snapshot import CatalogSnapshot
+from products.models import ProductListing
+
+
+class Command(BaseCommand):
+    help = "Show how much memory the in-process catalog snapshot takes, per part and per 100k products."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--synthetic', type=int, default=0,
+            help="Measure a snapshot of this many made-up products instead of the real catalog.",
+        )
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            listings = [
+                ProductListing(
+                    slug=f'organic-linen-shirt-{i}', product_name=f'Organic Linen Shirt {i}',
+                    category_name=f'Category {i % 50}', image=f'product/organic-linen-shirt-{i}.jpg',
+                    price=2500, min_price=2500, max_price=2700, rating=4.2, review_count=17, newest_product=i % 10 == 0,
+                )
+                for i in range(options['synthetic'])
+            ]
+            snapshot = CatalogSnapshot(0, listings, [f'Category {i}' for i in range(50)])
+        else:
+            snapshot = CatalogSnapshot.load(0)
+
+        report = snapshot.memory_report()
+        self.stdout.write(f"{report['products']:,} products, NumPy {'on' if report['numpy'] else 'off'}")
+        for part, size in report['bytes'].items():
+            self.stdout.write(f"  {part:<16} {size / 1024:>10,.0f} KiB")
+        self.stdout.write(f"  {'total':<16} {report['total_bytes'] / 1024:>10,.0f} KiB")
+        self.stdout.write(f"Per 100k products: {report['bytes_per_100k_products'] / 2 ** 20:,.1f} MiB")
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.listing import CHUNK_SIZE, rebuild_listings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ProductListing read model from the catalog. Run after migrating or bulk imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_listings(options['chunk_size'])
+        self.stdout.write(f"Rebuilt {written} product listings in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = "Return the stock held by checkouts that were abandoned past STOCK_RESERVATION_MINUTES. Run from cron."
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(f"Released {released} expired stock reservations")
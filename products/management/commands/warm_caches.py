@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.warming import edge_client, hot_products, warm, warm_targets
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the caches behind the home page, product pages and search for the hottest products of "
+        "recent orders and wishlists. Run after a deploy or a cache flush."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=settings.WARM_CACHES_PRODUCTS,
+                            help="How many of the hottest products to warm.")
+        parser.add_argument('--days', type=int, default=7, help="How far back to look for orders and wishlist adds.")
+        parser.add_argument('--searches', type=int, default=10, help="Searches to run, for the commonest name words.")
+        parser.add_argument('--workers', type=int, default=settings.WARM_CACHES_WORKERS)
+        parser.add_argument('--base-url', help="The public site, e.g. https://shop.example.com: also fetch the "
+                                               "hot pages through it so the CDN keeps them.")
+
+    def handle(self, *args, **options):
+        product_ids = hot_products(options['products'], options['days'])
+        edge = edge_client(options['base_url'], options['workers']) if options['base_url'] else None
+        try:
+            targets = warm_targets(product_ids, searches=options['searches'], edge=edge)
+            self.stdout.write(
+                f"Warming {len(targets)} targets for {len(product_ids)} products on {options['workers']} workers")
+            report = warm(targets, workers=options['workers'])
+        finally:
+            if edge is not None:
+                edge.close()
+
+        for kind, count in sorted(report['kinds'].items()):
+            self.stdout.write(f"  {kind:<14} {count:>6}")
+        self.stdout.write(f"Warmed {report['warmed']} keys in {report['seconds']:.1f}s")
+        if edge is not None:
+            self.stdout.write(f"Fetched {report['pages']} pages through {options['base_url']}")
+        if report['failed']:
+            self.stderr.write(f"{len(report['failed'])} failed: {', '.join(report['failed'][:10])}")
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-19 13:42
+
+import base.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_alter_wishlist_unique_together_wishlist_size_variant_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='colorvariant',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='coupon',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='productreview',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='sizevariant',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='wishlist',
+            name='uid',
+            field=models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
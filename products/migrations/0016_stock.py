@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:12
+
+import base.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0020_unique_open_cart_and_cart_line'),
+        ('products', '0015_alter_category_uid_alter_colorvariant_uid_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stock',
+            fields=[
+                ('uid', models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('color_variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='products.colorvariant')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='products.product')),
+                ('size_variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='products.sizevariant')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('uid', models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('held', 'Held'), ('released', 'Released'), ('consumed', 'Consumed')], default='held', max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='accounts.cart')),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.stock')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(fields=('product', 'size_variant', 'color_variant'), name='unique_stock_sku', nulls_distinct=False),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['status', 'expires_at'], name='stock_reservation_expiry'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:17
+
+import base.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlashSale',
+            fields=[
+                ('uid', models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('admit_per_minute', models.PositiveIntegerField(default=100)),
+                ('admission_minutes', models.PositiveIntegerField(default=10, help_text='How long an admitted shopper has to check out.')),
+                ('is_active', models.BooleanField(default=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='flash_sale', to='products.product')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:19
+
+import base.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe_codes_and_count_redemptions(apps, schema_editor):
+    Coupon = apps.get_model('products', 'Coupon')
+    CouponRedemption = apps.get_model('products', 'CouponRedemption')
+    Cart = apps.get_model('accounts', 'Cart')
+
+    # Lookups took an arbitrary row for a duplicated code; keep the oldest
+    # under the code and give the others a suffix so the code can be unique.
+    duplicated = Coupon.objects.values('coupon_code').annotate(rows=Count('uid')).filter(rows__gt=1)
+    for row in list(duplicated):
+        keep, *extra = Coupon.objects.filter(coupon_code=row['coupon_code']).order_by('pk')
+        for n, coupon in enumerate(extra, start=2):
+            coupon.coupon_code = f'{keep.coupon_code}-{n}'
+            coupon.save(update_fields=['coupon_code'])
+
+    # Coupons are counted as redeemed when applied to a cart.
+    uses = Cart.objects.exclude(coupon=None).exclude(user=None).values('coupon', 'user').annotate(uses=Count('uid'))
+    CouponRedemption.objects.bulk_create([
+        CouponRedemption(coupon_id=row['coupon'], user_id=row['user'], uses=row['uses']) for row in uses
+    ])
+    for row in Cart.objects.exclude(coupon=None).values('coupon').annotate(uses=Count('uid')):
+        Coupon.objects.filter(pk=row['coupon']).update(times_redeemed=row['uses'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0020_unique_open_cart_and_cart_line'),
+        ('products', '0017_flashsale'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='max_redemptions',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='max_redemptions_per_user',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='times_redeemed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='valid_from',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='valid_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='coupon',
+            name='coupon_code',
+            field=models.CharField(max_length=20),
+        ),
+        migrations.CreateModel(
+            name='CouponRedemption',
+            fields=[
+                ('uid', models.UUIDField(default=base.models.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('updated_at', models.DateTimeField(auto_now_add=True)),
+                ('uses', models.PositiveIntegerField(default=0)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='products.coupon')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemptions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='couponredemption',
+            constraint=models.UniqueConstraint(fields=('coupon', 'user'), name='unique_coupon_redemption'),
+        ),
+        migrations.RunPython(dedupe_codes_and_count_redemptions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='coupon',
+            name='coupon_code',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+    ]
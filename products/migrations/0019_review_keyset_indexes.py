@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_coupon_limits'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', '-date_added', '-uid'], name='review_newest'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', '-stars', '-date_added', '-uid'], name='review_highest'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', 'stars', '-date_added', '-uid'], name='review_lowest'),
+        ),
+    ]
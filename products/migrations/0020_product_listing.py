@@ -0,0 +1,97 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, Min
+
+
+def fill_listings(apps, schema_editor):
+    # The home page, search and related products read only from this table,
+    # so fill it here, with the same aggregation as products.listing._refresh,
+    # rather than leave the catalog empty until `manage.py rebuild_listings`.
+    Product = apps.get_model('products', 'Product')
+    ProductImage = apps.get_model('products', 'ProductImage')
+    ProductReview = apps.get_model('products', 'ProductReview')
+    ProductListing = apps.get_model('products', 'ProductListing')
+
+    def variant_prices(through, field, ids):
+        return {
+            row['product_id']: (row['low'], row['high'])
+            for row in through.objects.filter(product_id__in=ids).values('product_id')
+            .annotate(low=Min(f'{field}__price'), high=Max(f'{field}__price'))
+        }
+
+    last = None
+    while True:
+        chunk = Product.objects.select_related('category').order_by('pk')
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        products = list(chunk[:500])
+        if not products:
+            break
+        ids = [product.pk for product in products]
+        last = ids[-1]
+
+        images = dict(ProductImage.objects.filter(product_id__in=ids).order_by('-pk').values_list('product_id', 'image'))
+        sizes = variant_prices(Product.size_variant.through, 'sizevariant', ids)
+        colors = variant_prices(Product.color_variant.through, 'colorvariant', ids)
+        reviews = {
+            row['product_id']: row
+            for row in ProductReview.objects.filter(product_id__in=ids).values('product_id')
+            .annotate(rating=Avg('stars'), count=Count('pk'))
+        }
+
+        listings = []
+        for product in products:
+            size_low, size_high = sizes.get(product.pk, (0, 0))
+            color_low, color_high = colors.get(product.pk, (0, 0))
+            color_low = min(color_low, 0)
+            review = reviews.get(product.pk, {'rating': 0, 'count': 0})
+            listings.append(ProductListing(
+                product=product,
+                category=product.category,
+                slug=product.slug,
+                product_name=product.product_name,
+                category_name=product.category.category_name,
+                image=images.get(product.pk, ''),
+                price=product.price,
+                min_price=product.price + size_low + color_low,
+                max_price=product.price + size_high + color_high,
+                rating=review['rating'] or 0,
+                review_count=review['count'],
+                newest_product=product.newest_product,
+                is_variant=product.parent_id is not None,
+            ))
+        ProductListing.objects.bulk_create(listings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_review_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='products.product')),
+                ('slug', models.SlugField(blank=True, null=True)),
+                ('product_name', models.CharField(max_length=100)),
+                ('category_name', models.CharField(max_length=100)),
+                ('image', models.CharField(blank=True, max_length=100)),
+                ('price', models.IntegerField()),
+                ('min_price', models.IntegerField()),
+                ('max_price', models.IntegerField()),
+                ('rating', models.FloatField(default=0)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('newest_product', models.BooleanField(default=False)),
+                ('is_variant', models.BooleanField(default=False)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category_name', 'price'], name='listing_category_price'), models.Index(fields=['price'], name='listing_price'), models.Index(fields=['newest_product', 'category_name'], name='listing_newest'), models.Index(fields=['category', 'is_variant'], name='listing_related')],
+            },
+        ),
+        migrations.RunPython(fill_listings, migrations.RunPython.noop),
+    ]
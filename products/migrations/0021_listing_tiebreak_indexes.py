@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_product_listing'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productlisting',
+            name='listing_category_price',
+        ),
+        migrations.RemoveIndex(
+            model_name='productlisting',
+            name='listing_price',
+        ),
+        migrations.RemoveIndex(
+            model_name='productlisting',
+            name='listing_newest',
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['category_name', 'price', 'product'], name='listing_category_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['price', 'product'], name='listing_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['newest_product', 'category_name', 'product'], name='listing_newest'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:31
+
+import django.db.models.functions.comparison
+import uuid
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_duplicate_skus(apps, schema_editor):
+    # Where NULLS NOT DISTINCT wasn't available (SQLite, PostgreSQL before 15)
+    # unique_stock_sku was never created, so a SKU without a size or colour
+    # may have several stock rows. Keep the oldest with all their units and
+    # holds before the constraint is created.
+    Stock = apps.get_model('products', 'Stock')
+    StockReservation = apps.get_model('products', 'StockReservation')
+    duplicated_skus = (
+        Stock.objects.values('product', 'size_variant', 'color_variant')
+        .annotate(rows=Count('uid'), total=Sum('quantity')).filter(rows__gt=1)
+    )
+    for sku in list(duplicated_skus):
+        keep, *extra = Stock.objects.filter(
+            product=sku['product'], size_variant=sku['size_variant'], color_variant=sku['color_variant'],
+        ).order_by('pk')
+        StockReservation.objects.filter(stock__in=extra).update(stock=keep)
+        Stock.objects.filter(pk=keep.pk).update(quantity=sku['total'])
+        Stock.objects.filter(pk__in=[stock.pk for stock in extra]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0023_timestamps'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='stock',
+            name='unique_stock_sku',
+        ),
+        migrations.RunPython(merge_duplicate_skus, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(models.F('product'), django.db.models.functions.comparison.Coalesce('size_variant', models.Value(uuid.UUID('00000000-0000-0000-0000-000000000000'), output_field=models.UUIDField())), django.db.models.functions.comparison.Coalesce('color_variant', models.Value(uuid.UUID('00000000-0000-0000-0000-000000000000'), output_field=models.UUIDField())), name='unique_stock_sku'),
+        ),
+    ]
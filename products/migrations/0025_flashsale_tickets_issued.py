@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0024_stock_sku_constraint_on_every_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flashsale',
+            name='tickets_issued',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0025_flashsale_tickets_issued'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='productlisting',
+            name='listing_related',
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['category', 'is_variant', 'product'], name='listing_related'),
+        ),
+    ]
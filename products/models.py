@@ -1,5 +1,7 @@
+from django.core.cache import cache
 from django.db import models
-from base.models import BaseModel
+from django.db.models import Prefetch
+from base.models import BaseModel, coalesce_key
 from django.utils.text import slugify
 from django.utils.html import mark_safe
 from django.contrib.auth.models import User
@@ -37,6 +39,10 @@ class SizeVariant(BaseModel):
         return self.size_name
 
 
+PRICE_MATRIX_VERSION_KEY = 'price_matrix:version'
+PRICE_MATRIX_TIMEOUT = 60 * 60
+
+
 class Product(BaseModel):
     parent = models.ForeignKey('self', related_name='variants', on_delete=models.CASCADE, blank=True, null=True)
     product_name = models.CharField(max_length=100)
@@ -55,8 +61,36 @@ class Product(BaseModel):
     def __str__(self) -> str:
         return self.product_name
 
-    def get_product_price_by_size(self, size):
-        return self.price + SizeVariant.objects.get(size_name=size).price
+    def get_product_price_by_size(self, size, color=None):
+        # Only this product's own variants count; None if it isn't offered in that size/color.
+        return self.get_price_matrix()['prices'].get(size or '', {}).get(color or '')
+
+    def get_price_matrix(self):
+        """
+        Every price this product can sell at, as ``prices[size][color]`` with
+        ``''`` for "no size/color chosen", plus the sizes and colors on
+        offer. Cached per product; bumping ``PRICE_MATRIX_VERSION_KEY``
+        (done whenever a size or color price changes) retires every entry.
+        """
+        version = cache.get_or_set(PRICE_MATRIX_VERSION_KEY, 0, timeout=None)
+        key = f'price_matrix:{self.pk}:{self.price}:{version}'
+        return cache.get_or_set(key, self._build_price_matrix, PRICE_MATRIX_TIMEOUT)
+
+    def _build_price_matrix(self):
+        sizes = sorted(self.size_variant.all(), key=lambda size: size.size_name)
+        colors = sorted(self.color_variant.all(), key=lambda color: color.color_name)
+        return {
+            'base': self.price,
+            'sizes': [{'name': size.size_name, 'price': size.price} for size in sizes],
+            'colors': [{'name': color.color_name, 'price': color.price} for color in colors],
+            'prices': {
+                size_name: {
+                    color_name: self.price + size_price + color_price
+                    for color_name, color_price in [('', 0)] + [(color.color_name, color.price) for color in colors]
+                }
+                for size_name, size_price in [('', 0)] + [(size.size_name, size.price) for size in sizes]
+            },
+        }
     
     def get_rating(self):
         total = sum(int(review['stars']) for review in self.reviews.values())
@@ -76,11 +110,38 @@ class ProductImage(BaseModel):
         return mark_safe(f'<img src="{self.image.url}" width="500"/>')
 
 
+def product_images_prefetch(lookup='product_images'):
+    # Same order as `product_images.first`, so templates can use `product_images.all.0`
+    # without a query per product.
+    return Prefetch(lookup, queryset=ProductImage.objects.order_by('pk'))
+
+
 class Coupon(BaseModel):
-    coupon_code = models.CharField(max_length=10)
+    coupon_code = models.CharField(max_length=20, unique=True)
     is_expired = models.BooleanField(default=False)
     discount_amount = models.IntegerField(default=100)
     minimum_amount = models.IntegerField(default=500)
+    valid_from = models.DateTimeField(null=True, blank=True)
+    valid_until = models.DateTimeField(null=True, blank=True)
+    # Empty means unlimited.
+    max_redemptions = models.PositiveIntegerField(null=True, blank=True)
+    max_redemptions_per_user = models.PositiveIntegerField(null=True, blank=True)
+    # Only ever changed with conditional UPDATEs; see products.coupons.
+    times_redeemed = models.PositiveIntegerField(default=0, editable=False)
+
+    def __str__(self) -> str:
+        return self.coupon_code
+
+
+class CouponRedemption(BaseModel):
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name="redemptions")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="coupon_redemptions")
+    uses = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['coupon', 'user'], name='unique_coupon_redemption'),
+        ]
 
 
 class ProductReview(BaseModel):
@@ -92,6 +153,74 @@ class ProductReview(BaseModel):
 
     date_added = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # One per keyset sort in products.reviews.
+        indexes = [
+            models.Index(fields=['product', '-date_added', '-uid'], name='review_newest'),
+            models.Index(fields=['product', '-stars', '-date_added', '-uid'], name='review_highest'),
+            models.Index(fields=['product', 'stars', '-date_added', '-uid'], name='review_lowest'),
+        ]
+
+
+class Stock(BaseModel):
+    """
+    Units available for one SKU. Products without a stock row are not
+    tracked and can be sold without limit.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="stock")
+    size_variant = models.ForeignKey(SizeVariant, on_delete=models.CASCADE, null=True, blank=True)
+    color_variant = models.ForeignKey(ColorVariant, on_delete=models.CASCADE, null=True, blank=True)
+    # Units free to reserve. Held reservations have already been taken out.
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # One row per SKU, colourless and sizeless ones included.
+            models.UniqueConstraint(
+                'product', coalesce_key('size_variant'), coalesce_key('color_variant'), name='unique_stock_sku'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.product} / {self.size_variant or "-"} / {self.color_variant or "-"}: {self.quantity}'
+
+
+class StockReservation(BaseModel):
+    HELD = 'held'
+    RELEASED = 'released'
+    CONSUMED = 'consumed'
+
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name="reservations")
+    cart = models.ForeignKey('accounts.Cart', on_delete=models.CASCADE, related_name="stock_reservations")
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, default=HELD,
+                              choices=[(HELD, 'Held'), (RELEASED, 'Released'), (CONSUMED, 'Consumed')])
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # release_expired_reservations scans held rows by expiry.
+            models.Index(fields=['status', 'expires_at'], name='stock_reservation_expiry'),
+        ]
+
+
+class FlashSale(BaseModel):
+    """
+    Puts a product behind a waiting room: shoppers get a place in line and
+    are let through to its page, cart and checkout ``admit_per_minute`` at a
+    time from ``starts_at`` until ``ends_at``.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name="flash_sale")
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    admit_per_minute = models.PositiveIntegerField(default=100)
+    admission_minutes = models.PositiveIntegerField(default=10, help_text="How long an admitted shopper has to check out.")
+    is_active = models.BooleanField(default=True)
+    # The last place in line handed out, shared by every worker (products.flash_sale.issue_ticket).
+    tickets_issued = models.PositiveIntegerField(default=0, editable=False)
+
+    def __str__(self) -> str:
+        return f'{self.product} ({self.starts_at:%Y-%m-%d %H:%M})'
+
 
 class Wishlist(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="wishlist")
@@ -108,3 +237,54 @@ class Wishlist(BaseModel):
         return f'{self.user.username} - {self.product.product_name} - {self.size_variant.size_name if self.size_variant else "No Size"}'
 
     
+
+
+class ProductListing(models.Model):
+    """
+    One flat row per product with everything a listing card shows, so
+    catalog pages read a single table. Derived data: kept up to date by the
+    signals in ``products.signals`` and rebuilt with ``rebuild_listings``.
+    """
+    product = models.OneToOneField(Product, primary_key=True, on_delete=models.CASCADE, related_name="listing")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="+")
+    slug = models.SlugField(null=True, blank=True)
+    product_name = models.CharField(max_length=100)
+    category_name = models.CharField(max_length=100)
+    # Path of the first image under MEDIA_ROOT, '' when there is none.
+    image = models.CharField(max_length=100, blank=True)
+    price = models.IntegerField()
+    # Cheapest and dearest size/color combination on offer.
+    min_price = models.IntegerField()
+    max_price = models.IntegerField()
+    rating = models.FloatField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    newest_product = models.BooleanField(default=False)
+    is_variant = models.BooleanField(default=False)
+    # When the row was last refreshed: the product page's Last-Modified.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # One per filter/sort the listing pages use, with the primary key as tie-breaker.
+        indexes = [
+            models.Index(fields=['category_name', 'price', 'product'], name='listing_category_price'),
+            models.Index(fields=['price', 'product'], name='listing_price'),
+            models.Index(fields=['newest_product', 'category_name', 'product'], name='listing_newest'),
+            models.Index(fields=['category', 'is_variant', 'product'], name='listing_related'),
+        ]
+
+    def __str__(self) -> str:
+        return self.product_name
+
+
+class CacheVersion(models.Model):
+    """
+    A version number per cache topic, bumped by ``products.invalidation``
+    whenever something cached under that topic changes. Other processes
+    poll it (or LISTEN for the matching notification on PostgreSQL) to
+    know when to drop their local copies.
+    """
+    topic = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.topic} v{self.version}'
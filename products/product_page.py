@@ -0,0 +1,106 @@
+import random
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Exists, OuterRef, Value
+from django.http import Http404
+
+from products.flash_sale import sale_for_slug
+from products.listing import catalog_version
+from products.models import Product, ProductListing, Wishlist, product_images_prefetch
+from products.reviews import reviews_page
+
+
+RELATED_PRODUCTS = 4
+RELATED_RANGE_TIMEOUT = 60 * 60
+
+
+def load_product_page(slug, user):
+    """
+    Everything ``product.html`` shows for one product, in a fixed number of
+    queries whatever its images, variants and reviews:
+
+    1. the product with its category and whether it's on the user's wishlist
+    2. its images
+    3. its review count and average rating
+    4. four related products, read from their listing rows (see ``related_products``)
+    5. the first page of reviews with their authors, unless it is cached
+
+    plus the price matrix's two variant queries when it isn't cached, and two
+    for the related products' key range when it isn't.
+    """
+    in_wishlist = (
+        Exists(Wishlist.objects.filter(user=user, product=OuterRef('pk'))) if user.is_authenticated else Value(False)
+    )
+    product = (
+        Product.objects.select_related('category')
+        .prefetch_related(product_images_prefetch())
+        .annotate(in_wishlist=in_wishlist)
+        .filter(slug=slug).first()
+    )
+    if product is None:
+        raise Http404("No product matches the given query.")
+    # Aggregated separately: annotating counts alongside the Exists would group by every product column.
+    stats = product.reviews.aggregate(rating=Avg('stars'), count=Count('pk'))
+    rating = stats['rating'] or 0
+
+    # The rest are loaded on scroll from the reviews endpoint.
+    reviews, next_cursor = reviews_page(product.pk)
+
+    return {
+        'product': product,
+        'images': list(product.product_images.all()),
+        'in_wishlist': product.in_wishlist,
+        'rating': rating,
+        'rating_percentage': rating / 5 * 100,
+        'review_count': stats['count'],
+        'reviews': reviews,
+        'reviews_next': next_cursor,
+        'related_products': related_products(product),
+        'price_matrix': product.get_price_matrix(),
+    }
+
+
+def related_products(product):
+    """
+    ``RELATED_PRODUCTS`` others from ``product``'s category, read in key
+    order from a random key: one short index scan however big the category.
+    The pivot is drawn from a range, cached under the catalog version, that
+    stops early enough to leave a full set after it.
+    """
+    lowest, highest = cache.get_or_set(
+        f'related_range:{product.category_id}:{catalog_version()}',
+        lambda: _pivot_range(product.category_id), RELATED_RANGE_TIMEOUT,
+    )
+    if lowest is None:
+        return []
+    pivot = uuid.UUID(int=random.randint(lowest.int, highest.int))
+    return list(
+        ProductListing.objects.filter(category_id=product.category_id, is_variant=False, pk__gte=pivot)
+        .exclude(pk=product.pk).order_by('pk')[:RELATED_PRODUCTS]
+    )
+
+
+def _pivot_range(category_id):
+    # Two index lookups (PostgreSQL has no MIN() for uuid). The last pivot
+    # leaves RELATED_PRODUCTS rows after it besides the product itself.
+    keys = ProductListing.objects.filter(category_id=category_id, is_variant=False).values_list('pk', flat=True)
+    lowest = keys.order_by('pk').first()
+    highest = keys.order_by('-pk')[RELATED_PRODUCTS:RELATED_PRODUCTS + 1]
+    return lowest, highest[0] if highest else lowest
+
+
+def product_page_validators(request, slug):
+    """
+    ``public_page`` validators for a product page, from one indexed
+    lookup: its listing row's refresh time, which moves on whenever the
+    product, its images, variants or reviews change, and the catalog version
+    for the related products. Pages behind a flash sale stay private.
+    """
+    if sale_for_slug(slug):
+        return None
+    row = Product.objects.filter(slug=slug).values_list('pk', 'listing__updated_at').first()
+    if row is None or row[1] is None:
+        return None
+    product_id, updated_at = row
+    return (str(product_id), updated_at.isoformat(), catalog_version()), updated_at
@@ -0,0 +1,110 @@
+import base64
+import json
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from products.models import ProductReview
+
+
+REVIEWS_PER_PAGE = 10
+FIRST_PAGE_TIMEOUT = 60 * 15
+
+# (field, descending) keys for each sort; the primary key breaks ties so
+# every review has exactly one place in the order.
+SORTS = {
+    'newest': [('date_added', True), ('uid', True)],
+    'highest': [('stars', True), ('date_added', True), ('uid', True)],
+    'lowest': [('stars', False), ('date_added', True), ('uid', True)],
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(review, sort):
+    values = [getattr(review, field) for field, _ in SORTS[sort]]
+    raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        keys = SORTS[sort]
+        if len(values) != len(keys):
+            raise ValueError
+        parsed = []
+        for (field, _), value in zip(keys, values):
+            if field == 'date_added':
+                value = parse_datetime(value)
+                if value is None:
+                    raise ValueError
+            elif field == 'uid':
+                value = uuid.UUID(value)
+            else:
+                value = int(value)
+            parsed.append(value)
+        return parsed
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise InvalidCursor("Invalid cursor.")
+
+
+def _after(sort, values):
+    # (a, b, c) "after" (x, y, z): a past x, or a = x and b past y, or ...
+    keys = SORTS[sort]
+    condition = Q()
+    for i, (field, descending) in enumerate(keys):
+        step = Q(**{f"{field}__{'lt' if descending else 'gt'}": values[i]})
+        for j in range(i):
+            step &= Q(**{keys[j][0]: values[j]})
+        condition |= step
+    return condition
+
+
+def first_page_key(product_id, sort):
+    return f'reviews:{product_id}:{sort}'
+
+
+def forget_first_pages(product_id):
+    cache.delete_many([first_page_key(product_id, sort) for sort in SORTS])
+
+
+def reviews_page(product_id, sort='newest', cursor=None):
+    """
+    One page of a product's reviews as ``(reviews, next_cursor)``, read with
+    an indexed keyset query (no OFFSET, so page 500 costs what page 1 does).
+    First pages are cached until the product's reviews change.
+    """
+    if sort not in SORTS:
+        raise InvalidCursor(f"Unknown sort '{sort}'.")
+    if cursor is None:
+        return cache.get_or_set(
+            first_page_key(product_id, sort), lambda: _read_page(product_id, sort, None), FIRST_PAGE_TIMEOUT,
+        )
+    return _read_page(product_id, sort, cursor)
+
+
+def _read_page(product_id, sort, cursor):
+    order = [f"{'-' if descending else ''}{field}" for field, descending in SORTS[sort]]
+    reviews = ProductReview.objects.filter(product_id=product_id).select_related('user').order_by(*order)
+    if cursor is not None:
+        reviews = reviews.filter(_after(sort, decode_cursor(cursor, sort)))
+    rows = list(reviews[:REVIEWS_PER_PAGE + 1])
+    next_cursor = encode_cursor(rows[REVIEWS_PER_PAGE - 1], sort) if len(rows) > REVIEWS_PER_PAGE else None
+    return (
+        [
+            {
+                'id': str(review.uid),
+                'author': review.user.get_full_name(),
+                'stars': review.stars,
+                'content': review.content,
+                'date_added': review.date_added,
+            }
+            for review in rows[:REVIEWS_PER_PAGE]
+        ],
+        next_cursor,
+    )
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from products.invalidation import bus
+from products.listing import refresh_on_commit
+from products.models import (
+    PRICE_MATRIX_VERSION_KEY, Category, ColorVariant, Coupon, FlashSale, Product, ProductImage, ProductReview, SizeVariant,
+)
+from products.reviews import forget_first_pages
+
+
+@receiver(post_save, sender=FlashSale)
+@receiver(post_delete, sender=FlashSale)
+def flash_sale_changed(sender, **kwargs):
+    bus.publish('flash_sales')
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def coupon_changed(sender, **kwargs):
+    bus.publish('coupons')
+
+
+@receiver(post_save, sender=SizeVariant)
+@receiver(post_delete, sender=SizeVariant)
+@receiver(post_save, sender=ColorVariant)
+@receiver(post_delete, sender=ColorVariant)
+@receiver(m2m_changed, sender=Product.size_variant.through)
+@receiver(m2m_changed, sender=Product.color_variant.through)
+def variant_prices_changed(sender, **kwargs):
+    # Variants are shared by many products, so retire every cached price matrix
+    # at once. Product price changes need nothing: the price is in the key.
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bus.publish('price_matrix')
+
+
+def use_price_matrix_version():
+    # Set rather than incremented, so every process writing it to a shared cache agrees.
+    cache.set(PRICE_MATRIX_VERSION_KEY, bus.version('price_matrix'), timeout=None)
+
+
+bus.subscribe('price_matrix', use_price_matrix_version)
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def review_changed(sender, instance, **kwargs):
+    forget_first_pages(instance.product_id)
+    refresh_on_commit([instance.product_id])
+
+
+# Keep ProductListing in step with everything a listing card shows.
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    # A deleted product's row goes with it; the refresh still bumps the catalog version.
+    refresh_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, **kwargs):
+    refresh_on_commit([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    refresh_on_commit(instance.products.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # Its products and their rows are already gone; this only bumps the catalog version.
+    refresh_on_commit([])
+
+
+@receiver(post_save, sender=SizeVariant)
+@receiver(pre_delete, sender=SizeVariant)
+@receiver(post_save, sender=ColorVariant)
+@receiver(pre_delete, sender=ColorVariant)
+def variant_saved(sender, instance, **kwargs):
+    # Before a delete, while the products using the variant can still be found.
+    refresh_on_commit(instance.product_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Product.size_variant.through)
+@receiver(m2m_changed, sender=Product.color_variant.through)
+def product_variants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            refresh_on_commit([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        refresh_on_commit(pk_set)
+    elif action == 'pre_clear':
+        refresh_on_commit(instance.product_set.values_list('pk', flat=True))
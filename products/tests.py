@@ -1,3 +1,614 @@
-from django.test import TestCase
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count
+from django.test import Client, LiveServerTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Cart, Order, OrderItem
+from accounts.stripe_stub import StripeStubServer
+from base.testing import QueryBudgetMixin
+from home.seeding import seed
+from products.coupons import CouponError, active_coupons, apply_coupon
+from products.flash_sale import issue_ticket, sale_for_slug
+from products.invalidation import InvalidationBus
+from products.listing import rebuild_listings
+from products.product_page import RELATED_PRODUCTS, related_products
+from products.inventory import commit_reservations, release_expired, take_stock
+from products.models import (
+    Category, Coupon, CouponRedemption, FlashSale, Product, ProductImage, ProductListing, ProductReview, SizeVariant,
+    Stock, StockReservation, Wishlist,
+)
+from products.reviews import REVIEWS_PER_PAGE, SORTS, first_page_key, reviews_page
+from products.warming import hot_products
+
+
+class ProductsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    app = 'products'
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stripe = StripeStubServer(port=0).start()
+        cls.addClassCleanup(cls.stripe.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=2, images_per_product=1, users=2, carts=2, cart_items=1,
+             orders=0, order_items=0, reviews=0, tag='stock')
+        cls.first, cls.second = User.objects.filter(username__startswith='stock-user-').order_by('username')
+        # Both shoppers want one unit of the same SKU.
+        item = Cart.objects.get(user=cls.first).cart_items.get()
+        Cart.objects.get(user=cls.second).cart_items.update(
+            product=item.product, size_variant=item.size_variant, color_variant=item.color_variant, quantity=1)
+        item.quantity = 1
+        item.save()
+        cls.stock = Stock.objects.create(product=item.product, size_variant=item.size_variant,
+                                         color_variant=item.color_variant, quantity=1)
+
+    def checkout(self, user):
+        self.client.force_login(user)
+        with self.settings(STRIPE_API_BASE=self.stripe.url):
+            return self.client.post(reverse('create_checkout_session'))
+
+    def test_checkout_holds_the_last_unit(self):
+        self.assertEqual(self.checkout(self.first).status_code, 200)
+        response = self.checkout(self.second)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('not enough', response.json()['error'])
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 0)
+
+        cart = Cart.objects.prefetch_related('cart_items').get(user=self.first)
+        commit_reservations([cart])
+        self.assertEqual(StockReservation.objects.get().status, StockReservation.CONSUMED)
+
+    def test_expired_hold_is_released_for_the_next_shopper(self):
+        self.checkout(self.first)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(self.checkout(self.second).status_code, 200)
+        statuses = sorted(StockReservation.objects.values_list('status', flat=True))
+        self.assertEqual(statuses, [StockReservation.HELD, StockReservation.RELEASED])
+        self.assertEqual(release_expired(), 0)
+
+    def test_a_sku_has_one_stock_row_on_every_backend(self):
+        product = Product.objects.exclude(pk=self.stock.product_id).first()
+        Stock.objects.create(product=product, quantity=3)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Stock.objects.create(product=product, quantity=5)
+
+
+class FlashSaleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=2, images_per_product=1, users=1, carts=1, cart_items=1,
+             orders=0, order_items=0, reviews=0, tag='flash')
+        cls.user = User.objects.get(username='flash-user-0')
+        cls.product = Cart.objects.get(user=cls.user).cart_items.get().product
+        cls.other = Product.objects.exclude(pk=cls.product.pk).get()
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # One shopper a minute: the first in line goes straight through, the second waits.
+        FlashSale.objects.create(product=self.product, starts_at=timezone.now(),
+                                 ends_at=timezone.now() + timedelta(hours=1), admit_per_minute=1)
+
+    def join(self, client):
+        url = reverse('get_product', args=[self.product.slug])
+        self.assertContains(client.get(url), 'Join the line')
+        response = client.post(url)
+        self.assertEqual(response.status_code, 302)
+        return client.get(response.url)
+
+    def test_shoppers_are_admitted_at_the_configured_rate(self):
+        first = self.join(Client())
+        self.assertTemplateUsed(first, 'product/product.html')
+        # An admitted shopper's page must not reach a shared cache, where the line could be skipped.
+        self.assertIn('private', first['Cache-Control'])
+
+        waiting = Client()
+        waiting.force_login(self.user)
+        response = self.join(waiting)
+        self.assertTemplateUsed(response, 'product/waiting_room.html')
+
+        status_url = reverse('flash_sale_status', args=[FlashSale.objects.get().pk])
+        with self.assertNumQueries(0):
+            status = waiting.get(status_url).json()
+        self.assertEqual(status['state'], 'waiting')
+        self.assertEqual(status['ahead'], 1)
+
+        response = waiting.get(reverse('add_to_cart', args=[self.product.uid]), {'size': 'M'})
+        self.assertRedirects(response, reverse('get_product', args=[self.product.slug]), fetch_redirect_response=False)
+        self.assertEqual(waiting.post(reverse('create_checkout_session')).status_code, 403)
+
+    def test_only_joining_takes_a_place_in_line(self):
+        # Crawlers, link unfurlers and `curl -L` keep no cookies and would loop on a redirect.
+        url = reverse('get_product', args=[self.product.slug])
+        for _ in range(3):
+            response = Client().get(url)
+            self.assertTemplateUsed(response, 'product/waiting_room.html')
+            self.assertNotIn('Location', response)
+        self.assertEqual(Client().head(url).status_code, 200)
+        self.assertEqual(FlashSale.objects.get().tickets_issued, 0)
+
+        self.join(Client())
+        self.assertEqual(FlashSale.objects.get().tickets_issued, 1)
+
+    def test_places_in_line_are_shared_by_every_worker(self):
+        sale = sale_for_slug(self.product.slug)
+        first = issue_ticket(sale)
+        # Another worker's process-local cache knows nothing of the first ticket.
+        cache.clear()
+        self.assertEqual(issue_ticket(sale), first + 1)
+        self.assertEqual(FlashSale.objects.get().tickets_issued, first + 1)
+
+    def test_rest_of_the_catalog_is_not_gated(self):
+        response = self.client.get(reverse('get_product', args=[self.other.slug]))
+        self.assertTemplateUsed(response, 'product/product.html')
+
+
+class CouponTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=3, images_per_product=1, users=1, carts=1, cart_items=2,
+             orders=0, order_items=0, reviews=0, tag='coupon')
+        cls.user = User.objects.get(username='coupon-user-0')
+        cls.cart = Cart.objects.get(user=cls.user)
+        cls.coupon = Coupon.objects.create(coupon_code='SPRING10', discount_amount=10, minimum_amount=0,
+                                           max_redemptions_per_user=1)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.addCleanup(active_coupons.clear)
+
+    def apply(self, code):
+        self.client.post(reverse('cart'), {'coupon': code}, HTTP_REFERER='/accounts/cart/')
+        self.cart.refresh_from_db()
+
+    def test_apply_counts_a_use_and_remove_gives_it_back(self):
+        self.apply('SPRING10')
+        self.assertEqual(self.cart.coupon, self.coupon)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_redeemed, 1)
+
+        self.client.get(reverse('remove_coupon', args=[self.cart.uid]), HTTP_REFERER='/accounts/cart/')
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_redeemed, 0)
+        self.assertEqual(CouponRedemption.objects.get().uses, 0)
+
+    def test_caps_and_validity_window(self):
+        Coupon.objects.create(coupon_code='LATER', minimum_amount=0, valid_from=timezone.now() + timedelta(days=1))
+        self.apply('LATER')
+        self.assertIsNone(self.cart.coupon)
+
+        CouponRedemption.objects.create(coupon=self.coupon, user=self.user, uses=1)
+        with self.assertRaisesMessage(CouponError, 'already used'):
+            apply_coupon(self.cart, 'SPRING10')
+        self.cart.refresh_from_db()
+        self.assertIsNone(self.cart.coupon)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_redeemed, 0)
+
+
+class PriceMatrixTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=1, images_per_product=1, users=0, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=0, tag='matrix')
+        cls.product = Product.objects.get()
+        cls.size = cls.product.size_variant.get(size_name='M')
+        cls.color = cls.product.color_variant.first()
+        # Another "M" elsewhere in the catalog used to make the size lookup ambiguous.
+        SizeVariant.objects.create(size_name='M', price=999)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_matrix_prices_every_size_and_color(self):
+        expected = self.product.price + self.size.price + self.color.price
+        self.assertEqual(self.product.get_product_price_by_size('M', self.color.color_name), expected)
+
+        response = self.client.get(reverse('product_prices', args=[self.product.slug]),
+                                   {'size': 'M', 'color': self.color.color_name})
+        self.assertEqual(response.json(), {'price': expected})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product_prices', args=[self.product.slug]))
+        self.assertEqual(response.json()['prices']['M'][''], self.product.price + self.size.price)
+
+    def test_variant_price_change_invalidates_the_matrix(self):
+        self.product.get_price_matrix()
+        self.size.price += 5
+        with self.captureOnCommitCallbacks(execute=True):
+            self.size.save()
+
+        product = Product.objects.get()
+        self.assertEqual(product.get_product_price_by_size('M'), product.price + self.size.price)
+
+
+class RelatedProductsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=10, images_per_product=1, users=0, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=0, tag='related')
+        # The last key in the category, so it sits in the range every pivot reads from.
+        cls.product = Product.objects.order_by('-pk').first()
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_a_full_set_from_one_index_scan(self):
+        keys = list(ProductListing.objects.exclude(pk=self.product.pk).order_by('pk').values_list('pk', flat=True))
+        related_products(self.product)
+        # The first and the last pivot the cached range allows.
+        for pick, expected in [(min, keys[:RELATED_PRODUCTS]), (max, keys[-RELATED_PRODUCTS:])]:
+            with mock.patch('products.product_page.random.randint', side_effect=pick), \
+                    self.assertNumQueries(1) as queries:
+                related = related_products(self.product)
+            self.assertNotIn('RANDOM', queries.captured_queries[0]['sql'].upper())
+            self.assertEqual([listing.pk for listing in related], expected)
+
+
+class ProductPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=1, products=2, images_per_product=3, users=20, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=40, tag='page')
+        cls.product = Product.objects.annotate(n=Count('reviews')).order_by('-n').first()
+
+    def test_reviews_are_paginated(self):
+        response = self.client.get(reverse('get_product', args=[self.product.slug]))
+
+        reviews = response.context['reviews']
+        self.assertEqual(len(reviews), REVIEWS_PER_PAGE)
+        self.assertEqual(response.context['review_count'], self.product.reviews.count())
+        self.assertEqual(len(response.context['images']), 3)
+        self.assertIsNotNone(response.context['reviews_next'])
+
+    def test_keyset_pages_cover_every_review_once(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for sort, keys in SORTS.items():
+            seen, cursor = [], None
+            while True:
+                response = self.client.get(
+                    reverse('product_reviews', args=[self.product.uid]), {'sort': sort, 'cursor': cursor or ''}
+                )
+                self.assertEqual(response.status_code, 200)
+                seen += [review['id'] for review in response.json()['reviews']]
+                cursor = response.json()['next']
+                if cursor is None:
+                    break
+            order = [f"{'-' if descending else ''}{field}" for field, descending in keys]
+            expected = [str(uid) for uid in self.product.reviews.order_by(*order).values_list('uid', flat=True)]
+            self.assertEqual(seen, expected, sort)
+
+        response = self.client.get(reverse('product_reviews', args=[self.product.uid]), {'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_first_page_is_cached_until_a_review_is_added(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        reviews_page(self.product.pk)
+        with self.assertNumQueries(0):
+            reviews_page(self.product.pk)
+
+        review = ProductReview.objects.create(product=self.product, user=User.objects.first(), stars=5, content='New')
+        reviews, _ = reviews_page(self.product.pk)
+        self.assertEqual(reviews[0]['id'], str(review.uid))
+
+    def test_unchanged_page_is_not_modified(self):
+        url = reverse('get_product', args=[self.product.slug])
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertIn('public', response['Cache-Control'])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # A crawler without cookies can revalidate on the date alone.
+        self.assertEqual(Client().get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        # A new review refreshes the listing row, and with it the validators.
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductReview.objects.create(product=self.product, user=User.objects.last(), stars=1, content='Later')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_signed_in_visitors_get_the_public_page(self):
+        url = reverse('get_product', args=[self.product.slug])
+        etag = self.client.get(url)['ETag']
+        user = User.objects.first()
+        self.client.force_login(user)
+        response = self.client.get(url)
+        self.assertEqual(response['ETag'], etag)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertFalse(response.cookies)
+        self.assertNotContains(response, user.username)
+
+        # Their name, wishlist and the form tokens come from the viewer endpoint instead.
+        Wishlist.objects.create(user=user, product=self.product)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        viewer = self.client.get(reverse('viewer')).json()
+        self.assertTrue(viewer['signed_in'])
+        self.assertIn(user.username, viewer['profile'])
+        self.assertEqual(viewer['wishlist_count'], 1)
+
+    def test_review_form_posts_with_the_viewer_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(User.objects.last())
+        url = reverse('get_product', args=[self.product.slug])
+        self.assertContains(client.get(url), 'data-csrf-token')
+
+        token = client.get(reverse('viewer')).json()['csrf_token']
+        response = client.post(url, {'stars': 4, 'content': 'Fits well', 'csrfmiddlewaretoken': token})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertTrue(self.product.reviews.filter(content='Fits well').exists())
+
+    def test_timestamps(self):
+        review = ProductReview.objects.first()
+        created_at, updated_at = review.created_at, review.updated_at
+        review.content = 'Edited'
+        review.save()
+        review.refresh_from_db()
+        self.assertEqual(review.created_at, created_at)
+        self.assertGreater(review.updated_at, updated_at)
+
+
+class ProductListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(categories=2, products=6, images_per_product=2, users=3, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=12, tag='listing')
+
+    def assertListingMatches(self, product):
+        listing = ProductListing.objects.get(pk=product.pk)
+        matrix = product.get_price_matrix()
+        prices = [price for size in matrix['sizes'] for price in matrix['prices'][size['name']].values()]
+        self.assertEqual(listing.image, str(product.product_images.order_by('pk').first().image))
+        self.assertEqual(listing.category_name, product.category.category_name)
+        self.assertEqual((listing.min_price, listing.max_price), (min(prices), max(prices)))
+        self.assertEqual(listing.review_count, product.reviews.count())
+        self.assertAlmostEqual(listing.rating, product.get_rating())
+
+    def test_seeded_listings_match_the_catalog(self):
+        for product in Product.objects.all():
+            self.assertListingMatches(product)
+
+    def test_signals_keep_listings_current(self):
+        product = Product.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.product_name = 'Renamed Linen Shirt'
+            product.save()
+            product.category.category_name = 'Renamed Category'
+            product.category.save()
+            ProductImage.objects.filter(product=product).order_by('pk').first().delete()
+            ProductReview.objects.create(product=product, user=User.objects.last(), stars=1)
+            SizeVariant.objects.filter(size_name='XL').update(price=400)
+            SizeVariant.objects.get(size_name='XL').save()
+        self.assertEqual(ProductListing.objects.get(pk=product.pk).product_name, 'Renamed Linen Shirt')
+        self.assertListingMatches(product)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertFalse(ProductListing.objects.filter(pk=product.pk).exists())
+
+    def test_rebuild_restores_every_row(self):
+        ProductListing.objects.all().delete()
+        self.assertEqual(rebuild_listings(chunk_size=4), Product.objects.count())
+        for product in Product.objects.all():
+            self.assertListingMatches(product)
+
+    def test_listing_pages_render_from_one_table(self):
+        product = Product.objects.first()
+        response = self.client.get(reverse('index'), {'category': product.category.category_name})
+        self.assertContains(response, product.product_name)
+        self.assertContains(response, f'/media/{product.product_images.order_by("pk").first().image}')
+
+
+class QueryCacheTests(TransactionTestCase):
+    # Query caching stays off inside transactions, so these run in autocommit.
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        seed(categories=2, products=2, images_per_product=1, users=0, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=0, tag='qc')
+        self.product = Product.objects.first()
+
+    def test_reads_are_cached_until_their_table_is_written(self):
+        names = lambda: list(Category.objects.order_by('category_name').values_list('category_name', flat=True))
+        first = names()
+        with self.assertNumQueries(0):
+            self.assertEqual(names(), first)
+
+        Category.objects.create(category_name='qc-new')
+        with self.assertNumQueries(1):
+            self.assertIn('qc-new', names())
+
+        Category.objects.filter(category_name='qc-new').update(category_name='qc-renamed')
+        with self.assertNumQueries(1):
+            self.assertIn('qc-renamed', names())
+
+        Category.objects.bulk_create([Category(category_name='qc-bulk', slug='qc-bulk')])
+        with self.assertNumQueries(1):
+            self.assertIn('qc-bulk', names())
+
+    def test_many_to_many_lookups_see_new_variants(self):
+        size = self.product.size_variant.get(size_name='M')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.product.size_variant.get(size_name='M'), size)
+
+        self.assertFalse(self.product.size_variant.filter(size_name='QC').exists())
+        names = lambda: set(self.product.size_variant.values_list('size_name', flat=True))
+        names()
+        self.product.size_variant.add(SizeVariant.objects.create(size_name='QC'))
+        with self.assertNumQueries(1):
+            self.assertIn('QC', names())
+
+    def test_only_allowed_models_outside_transactions_are_cached(self):
+        list(Category.objects.all())
+        with self.assertNumQueries(1):
+            list(Product.objects.all())
+        with transaction.atomic(), self.assertNumQueries(1):
+            list(Category.objects.all())
+        with self.settings(QUERY_CACHE={**settings.QUERY_CACHE, 'DENY': ['products.Category']}), self.assertNumQueries(1):
+            list(Category.objects.all())
+        # Joining a table that isn't allowed bypasses the cache too.
+        list(Category.objects.filter(products__isnull=False))
+        with self.assertNumQueries(1):
+            list(Category.objects.filter(products__isnull=False))
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class WarmCachesTests(LiveServerTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        seed(categories=2, products=6, images_per_product=1, users=1, carts=0, cart_items=0,
+             orders=1, order_items=1, reviews=12, tag='warm')
+        self.hot = Product.objects.exclude(orderitem__isnull=False).first()
+        OrderItem.objects.create(order=Order.objects.get(), product=self.hot, quantity=50)
+
+    def test_hottest_products_are_warmed(self):
+        self.assertEqual(hot_products(3, days=7)[0], self.hot.pk)
+
+        out, err = StringIO(), StringIO()
+        call_command('warm_caches', '--products', '3', '--workers', '4', stdout=out, stderr=err)
+        self.assertIn('Warmed', out.getvalue())
+        self.assertEqual(err.getvalue(), '')
+        self.assertIsNotNone(cache.get(first_page_key(self.hot.pk, 'newest')))
+        with self.assertNumQueries(0):
+            self.hot.get_price_matrix()
+
+    def test_pages_are_fetched_through_the_edge(self):
+        out, err = StringIO(), StringIO()
+        call_command('warm_caches', '--products', '3', '--workers', '2', '--base-url', self.live_server_url,
+                     stdout=out, stderr=err)
+        self.assertEqual(err.getvalue(), '')
+        # The home page in each sort, the hot products' categories and pages, and the searches.
+        self.assertRegex(out.getvalue(), rf"Fetched [1-9][0-9]* pages through {self.live_server_url}")
+
+
+class InvalidationBusTests(TransactionTestCase):
+    poll_seconds = 0.2
+
+    def test_other_processes_drop_their_copies_within_the_poll_interval(self):
+        # A second bus with its own listener connection stands in for another worker.
+        other = InvalidationBus()
+        dropped, unrelated = threading.Event(), threading.Event()
+        other.subscribe('coupons', dropped.set)
+        other.subscribe('flash_sales', unrelated.set)
+        with self.settings(CACHE_INVALIDATION_POLL_SECONDS=self.poll_seconds):
+            other.start()
+            self.addCleanup(other.stop)
+
+            coupon = Coupon.objects.create(coupon_code='BUS10')
+            # The first one may be picked up by the listener's catch-up read; time the second.
+            self.assertTrue(dropped.wait(5))
+            dropped.clear()
+            started = time.monotonic()
+            coupon.discount_amount = 200
+            coupon.save()
+            self.assertTrue(dropped.wait(5))
+            delay = time.monotonic() - started
+
+        self.assertLess(delay, self.poll_seconds + 0.5)
+        self.assertEqual(other.version('coupons'), 2)
+        self.assertFalse(unrelated.is_set())
+
+    def test_this_process_drops_its_copies_when_the_change_commits(self):
+        # Before then another thread could re-cache the old data under the new version.
+        local = InvalidationBus()
+        dropped = threading.Event()
+        local.subscribe('coupons', dropped.set)
+        with transaction.atomic():
+            version = local.publish('coupons')
+            self.assertFalse(dropped.is_set())
+            self.assertEqual(local.version('coupons'), 0)
+        self.assertTrue(dropped.is_set())
+        self.assertEqual(local.version('coupons'), version)
+
+        dropped.clear()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            local.publish('coupons')
+            raise RuntimeError
+        self.assertFalse(dropped.is_set())
+        self.assertEqual(local.version('coupons'), version)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentCouponTests(TransactionTestCase):
+    shoppers = 20
+
+    def setUp(self):
+        seed(categories=1, products=2, images_per_product=1, users=self.shoppers, carts=self.shoppers, cart_items=1,
+             orders=0, order_items=0, reviews=0, tag='viral')
+        Coupon.objects.create(coupon_code='VIRAL', minimum_amount=0, max_redemptions=5)
+        self.addCleanup(active_coupons.clear)
+
+    def test_capped_coupon_is_never_over_redeemed(self):
+        carts = list(Cart.objects.prefetch_related('cart_items__product', 'cart_items__size_variant',
+                                                   'cart_items__color_variant'))
+        start = threading.Barrier(len(carts))
+
+        def shopper(cart):
+            try:
+                start.wait()
+                apply_coupon(cart, 'VIRAL')
+                return True
+            except CouponError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(carts)) as pool:
+            applied = sum(pool.map(shopper, carts))
+
+        self.assertEqual(applied, 5)
+        self.assertEqual(Coupon.objects.get().times_redeemed, 5)
+        self.assertEqual(Cart.objects.exclude(coupon=None).count(), 5)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentStockTests(TransactionTestCase):
+    buyers = 30
+
+    def setUp(self):
+        seed(categories=1, products=1, images_per_product=1, users=0, carts=0, cart_items=0,
+             orders=0, order_items=0, reviews=0, tag='drop')
+        self.stock = Stock.objects.create(product=Product.objects.get(), quantity=10)
+
+    def test_concurrent_buyers_never_oversell(self):
+        start = threading.Barrier(self.buyers)
+
+        def buyer(_):
+            try:
+                start.wait()
+                return take_stock(self.stock.pk, 1)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.buyers) as pool:
+            sold = sum(pool.map(buyer, range(self.buyers)))
+
+        self.stock.refresh_from_db()
+        self.assertEqual(sold, 10)
+        self.assertEqual(self.stock.quantity, 0)
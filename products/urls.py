@@ -1,10 +1,14 @@
 from django.urls import path
-from products.views import get_product, wishlist_view, add_to_wishlist, move_to_cart, remove_from_wishlist
+from products.views import (get_product, wishlist_view, add_to_wishlist, move_to_cart, remove_from_wishlist,
+                            flash_sale_status, product_prices, product_reviews)
 
 urlpatterns = [
     path('wishlist/', wishlist_view, name='wishlist'),
     path('wishlist/add/<uid>/', add_to_wishlist, name='add_to_wishlist'),
     path('wishlist/move_to_cart/<uid>/', move_to_cart, name='move_to_cart'),
     path('wishlist/remove/<uid>/', remove_from_wishlist, name='remove_from_wishlist'),
+    path('flash-sale/<sale_id>/status/', flash_sale_status, name='flash_sale_status'),
+    path('reviews/<uuid:uid>/', product_reviews, name='product_reviews'),
+    path('<slug>/prices/', product_prices, name='product_prices'),
     path('<slug>/', get_product, name='get_product'),
 ]
@@ -1,41 +1,39 @@
-import random
 from .forms import ReviewForm
 from django.urls import reverse
 from django.contrib import messages
-from accounts.models import Cart, CartItem
+from accounts.models import Cart, add_cart_item
 from django.contrib.auth.decorators import login_required
-from products.models import Product, SizeVariant, ProductReview, Wishlist
+from django.contrib.auth.models import AnonymousUser
+from products.models import Product, SizeVariant, ProductReview, Wishlist, product_images_prefetch
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+from base.conditional import public_page
+from products.product_page import load_product_page, product_page_validators
+from products.reviews import InvalidCursor, reviews_page
+from products.flash_sale import blocking_sale, issue_ticket, read_ticket, sale_by_id, sale_for_slug, set_ticket, ticket_status
 
 # Create your views here.
 
+@public_page(product_page_validators)
 def get_product(request, slug):
-    product = get_object_or_404(Product, slug=slug)
-    sorted_size_variants = product.size_variant.all().order_by('size_name')
-    related_products = list(product.category.products.filter(parent=None).exclude(uid=product.uid))
-
-    # Review product view
-    review = None
-    if request.user.is_authenticated:
-        # Check if the user has already reviewed the product or not.
-        try:
-            review = ProductReview.objects.get(product=product, user=request.user)
-        except ProductReview.DoesNotExist:
-            review = None
-    
-    # Calculate the rating percentage
-    rating_percentage = 0
-    if product.reviews.exists():
-        rating_percentage = (product.get_rating() / 5) * 100
-
-    # Handle form submission
+    # Flash-sale products sit behind a waiting room; only joining the line touches the database.
+    sale = sale_for_slug(slug)
+    if sale:
+        status = ticket_status(sale, read_ticket(request, sale))
+        if status['state'] != 'admitted':
+            return waiting_room(request, sale, status)
+
+    # A public page is the same for everyone; the wishlist button's state isn't on it.
+    user = AnonymousUser() if getattr(request, 'public_page', False) else request.user
+    context = load_product_page(slug, user)
+    product = context['product']
+
+    # Handle review submission
     if request.method == 'POST' and request.user.is_authenticated:
-        if review:
-            # If review exists, update it
-            review_form = ReviewForm(request.POST, instance=review)
-        else:
-            # Otherwise, create a new review
-            review_form = ReviewForm(request.POST)
+        # Update the user's existing review, if any, instead of adding a second one.
+        review = ProductReview.objects.filter(product=product, user=request.user).first()
+        review_form = ReviewForm(request.POST, instance=review)
 
         if review_form.is_valid():
             review = review_form.save(commit=False)
@@ -46,29 +44,20 @@ def get_product(request, slug):
             return redirect('get_product', slug=slug)
     else:
         review_form = ReviewForm()
-    
-    # Related product view
-    if len(related_products) >= 4:
-        related_products = random.sample(related_products, 4)
-
-    # Wishlist product to fetch, if the same item/product is present or not.
-    in_wishlist = False  # Default value for anonymous users
-    if request.user.is_authenticated:
-        in_wishlist = Wishlist.objects.filter(user=request.user, product=product).exists()
-
-    context = {
-        'product': product,
-        'sorted_size_variants': sorted_size_variants,
-        'related_products': related_products,
-        'review_form': review_form,
-        'rating_percentage': rating_percentage,
-        'in_wishlist': in_wishlist,
-    }
 
-    if request.GET.get('size'):
-        size = request.GET.get('size')
-        price = product.get_product_price_by_size(size)
+    price_matrix = context['price_matrix']
+    context.update({
+        'review_form': review_form,
+        'sorted_size_variants': price_matrix['sizes'],
+        'color_variants': price_matrix['colors'],
+    })
+
+    # Server-rendered fallback for ?size=&color= links; with JS the page switches prices itself.
+    size, color = request.GET.get('size', ''), request.GET.get('color', '')
+    price = price_matrix['prices'].get(size, {}).get(color)
+    if (size or color) and price is not None:
         context['selected_size'] = size
+        context['selected_color'] = color
         context['updated_price'] = price
 
     return render(request, 'product/product.html', context=context)
@@ -83,7 +72,7 @@ def add_to_wishlist(request, uid):
         return redirect(request.META.get('HTTP_REFERER'))
     
     product = get_object_or_404(Product, uid=uid)
-    size_variant = get_object_or_404(SizeVariant, size_name=variant)
+    size_variant = get_object_or_404(product.size_variant, size_name=variant)
     wishlist, created = Wishlist.objects.get_or_create(user=request.user, product=product, size_variant=size_variant)
 
     if created:
@@ -111,7 +100,8 @@ def remove_from_wishlist(request, uid):
 # Wishlist View
 @login_required
 def wishlist_view(request):
-    wishlist_items = Wishlist.objects.filter(user=request.user)
+    wishlist_items = Wishlist.objects.filter(user=request.user).select_related(
+        'product', 'size_variant').prefetch_related(product_images_prefetch('product__product_images'))
     return render(request, 'product/wishlist.html', 
                   {'wishlist_items': wishlist_items,}
                   )
@@ -119,6 +109,11 @@ def wishlist_view(request):
 
 # Move to cart functionality on wishlist page.
 def move_to_cart(request, uid):
+    sale = blocking_sale(request, [uid])
+    if sale:
+        messages.warning(request, "This product is in a flash sale. Please wait for your turn.")
+        return redirect('get_product', slug=sale['slug'])
+
     product = get_object_or_404(Product, uid=uid)
 
     # Find the wishlist item with the corresponding size variant
@@ -136,12 +131,67 @@ def move_to_cart(request, uid):
     # Get or create the user's cart
     cart, created = Cart.objects.get_or_create(user=request.user, is_paid=False)
 
-    # Add the product to the cart with the size variant
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product, size_variant=size_variant)
-
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    # Add the product to the cart with the size variant (or bump its quantity)
+    add_cart_item(cart, product, size_variant)
 
     messages.success(request, "Product moved to cart successfully!")
     return redirect('cart')
+
+
+def waiting_room(request, sale, status):
+    if status['state'] in ('none', 'expired') and request.method == 'POST':
+        # Join (or rejoin) the line, then come back with the ticket cookie. Only on the
+        # page's own form: crawlers and cookieless clients replaying GETs mustn't move the line.
+        response = redirect(request.get_full_path())
+        set_ticket(response, sale, issue_ticket(sale))
+    else:
+        response = render(request, 'product/waiting_room.html', {'sale': sale, 'status': status})
+    add_never_cache_headers(response)
+    return response
+
+
+def product_reviews(request, uid):
+    # Keyset-paginated reviews: JSON by default, an HTML chunk for the product page's infinite scroll.
+    sort = request.GET.get('sort', 'newest')
+    try:
+        reviews, next_cursor = reviews_page(uid, sort, request.GET.get('cursor') or None)
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if request.GET.get('format') == 'html':
+        response = render(request, 'product_parts/review_list.html', {'reviews': reviews})
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+    else:
+        response = JsonResponse({
+            'reviews': [dict(review, date_added=review['date_added'].isoformat()) for review in reviews],
+            'next': next_cursor,
+        })
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+def product_prices(request, slug):
+    # The product page's price matrix as JSON; ?size=&color= narrows it to one price.
+    product = get_object_or_404(Product, slug=slug)
+    price_matrix = product.get_price_matrix()
+    if 'size' in request.GET or 'color' in request.GET:
+        price = product.get_product_price_by_size(request.GET.get('size'), request.GET.get('color'))
+        if price is None:
+            return JsonResponse({'error': 'This product is not offered in that size and color.'}, status=404)
+        response = JsonResponse({'price': price})
+    else:
+        response = JsonResponse(price_matrix)
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+def flash_sale_status(request, sale_id):
+    # Polled by the waiting room: answered from the cached sale and the signed ticket alone.
+    sale = sale_by_id(sale_id)
+    if sale is None:
+        response = JsonResponse({'state': 'ended'})
+    else:
+        response = JsonResponse(ticket_status(sale, read_ticket(request, sale)))
+    add_never_cache_headers(response)
+    return response
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Sum
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import cc_delim_re
+from django.utils.http import urlencode
+
+from accounts.models import OrderItem
+from products.catalog_snapshot import catalog_snapshot
+from products.flash_sale import active_sales
+from products.models import Category, Product, ProductListing, Wishlist
+from products.reviews import SORTS, reviews_page
+
+
+logger = logging.getLogger('ecomm.warming')
+
+INDEX_SORTS = ('newest', 'priceAsc', 'priceDesc')
+
+
+def hot_products(limit, days):
+    """
+    Up to ``limit`` product ids, hottest first: units ordered plus wishlist
+    adds over the last ``days`` days, topped up with the most reviewed
+    listings when that's too few (say, on a fresh database).
+    """
+    since = timezone.now() - timedelta(days=days)
+    scores = Counter()
+    ordered = (
+        OrderItem.objects.filter(order__order_date__gte=since, product__isnull=False)
+        .values('product_id').annotate(units=Sum('quantity'))
+    )
+    for row in ordered:
+        scores[row['product_id']] += row['units']
+    wished = Wishlist.objects.filter(added_on__gte=since).values('product_id').annotate(adds=Count('pk'))
+    for row in wished:
+        scores[row['product_id']] += row['adds']
+
+    ranked = [product_id for product_id, _ in scores.most_common(limit)]
+    if len(ranked) < limit:
+        fill = ProductListing.objects.filter(is_variant=False).exclude(pk__in=ranked).order_by('-review_count', 'pk')
+        ranked += list(fill.values_list('pk', flat=True)[:limit - len(ranked)])
+    return ranked
+
+
+def warm_targets(product_ids, searches=10, local=False, edge=None):
+    """
+    ``[(label, warm)]`` for everything worth having in cache before traffic
+    arrives, hottest first: shared data (price matrices, first review
+    pages, flash sales, categories), with ``local`` this process's catalog
+    snapshot, and with ``edge`` (an ``httpx.Client`` whose ``base_url`` is
+    the public site) the public pages, fetched through the CDN so it keeps
+    them.
+    """
+    rank = {product_id: i for i, product_id in enumerate(product_ids)}
+    products = sorted(
+        Product.objects.filter(pk__in=product_ids).select_related('category'), key=lambda product: rank[product.pk],
+    )
+    sales = active_sales()
+
+    targets = [
+        ('flash_sales', active_sales),
+        ('categories', lambda: list(Category.objects.all())),
+    ]
+    if local and settings.CATALOG_SNAPSHOT:
+        targets.append(('catalog_snapshot', catalog_snapshot))
+    for product in products:
+        targets.append((f'price_matrix:{product.slug}', product.get_price_matrix))
+        targets += [(f'reviews:{product.slug}:{sort}', _bind(reviews_page, product.pk, sort)) for sort in SORTS]
+    if edge is None:
+        return targets
+
+    index = reverse('index')
+    pages = [index] + [f'{index}?sort={sort}' for sort in INDEX_SORTS]
+    # Categories in order of their products' heat.
+    categories = list(dict.fromkeys(product.category.category_name for product in products))
+    pages += [f"{index}?{urlencode({'category': name})}" for name in categories]
+    # A flash sale would queue the warmer; its page is warmed by the sale itself.
+    pages += [reverse('get_product', args=[product.slug]) for product in products if str(product.pk) not in sales]
+    words = Counter(word.lower() for product in products for word in product.product_name.split() if len(word) > 2)
+    pages += [f"{reverse('product_search')}?{urlencode({'q': word})}" for word, _ in words.most_common(searches)]
+    return targets + [(f'page:{path}', _bind(_fetch, edge, path)) for path in pages]
+
+
+def _bind(function, *args):
+    return lambda: function(*args)
+
+
+def _fetch(edge, path):
+    # Without cookies, as a first-time visitor; only a public response is one the edge keeps.
+    response = edge.get(path)
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} returned {response.status_code}")
+    if 'public' not in cc_delim_re.split(response.headers.get('Cache-Control', '')):
+        raise RuntimeError(f"{path} isn't cacheable: {response.headers.get('Cache-Control')!r}")
+
+
+def warm(targets, workers=8):
+    """
+    Run every target on a pool of ``workers`` threads. Returns
+    ``{'warmed', 'pages', 'failed', 'seconds', 'kinds'}``: cache keys
+    written, pages the edge took, and the rest. Failures are logged and
+    skipped, so one bad page doesn't stop the rest.
+    """
+    started = time.perf_counter()
+    kinds = Counter()
+    failed = []
+
+    def run(target):
+        label, warm_one = target
+        try:
+            warm_one()
+            return label, True
+        except Exception:
+            logger.exception("Warming %s failed", label)
+            return label, False
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for label, ok in pool.map(run, targets):
+            if ok:
+                kinds[label.split(':', 1)[0]] += 1
+            else:
+                failed.append(label)
+    return {
+        'warmed': sum(count for kind, count in kinds.items() if kind != 'page'),
+        'pages': kinds['page'],
+        'failed': failed,
+        'seconds': time.perf_counter() - started,
+        'kinds': dict(kinds),
+    }
+
+
+def edge_client(base_url, workers):
+    """An ``httpx.Client`` for ``warm_targets(edge=...)``, one connection per worker."""
+    return httpx.Client(base_url=base_url, timeout=30, limits=httpx.Limits(max_connections=workers))
+
+
+def warm_caches(products=200, days=7, searches=10, workers=8, local=False):
+    targets = warm_targets(hot_products(products, days), searches=searches, local=local)
+    return warm(targets, workers=workers)
+
+
+def warm_in_background():
+    """Warm this worker's caches on a daemon thread if ``WARM_CACHES_ON_BOOT`` is set."""
+    if not settings.WARM_CACHES_ON_BOOT:
+        return None
+
+    def run():
+        try:
+            report = warm_caches(products=settings.WARM_CACHES_PRODUCTS, workers=settings.WARM_CACHES_WORKERS, local=True)
+            logger.info("Warmed %d keys in %.1fs (%d failed)", report['warmed'], report['seconds'], len(report['failed']))
+        except Exception:
+            logger.exception("Cache warming failed")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name='cache-warming', daemon=True)
+    thread.start()
+    return thread